@@ -0,0 +1,207 @@
+import math
+import os
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+
+from tracing import metrics, span
+
+# ADMISSION_ENABLED=0 lets every agent run start immediately
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "1") == "1"
+# Agent runs in flight at once: the starting limit and the range it adapts in
+ADMISSION_INITIAL_LIMIT = int(os.getenv("ADMISSION_INITIAL_LIMIT", "8"))
+ADMISSION_MIN_LIMIT = int(os.getenv("ADMISSION_MIN_LIMIT", "2"))
+ADMISSION_MAX_LIMIT = int(os.getenv("ADMISSION_MAX_LIMIT", "32"))
+# Agent runs one user may have in flight; further runs of that user wait
+ADMISSION_PER_USER = int(os.getenv("ADMISSION_PER_USER", "2"))
+# Runs waiting for a slot; arrivals beyond this are rejected right away
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "64"))
+# Seconds a run may wait for a slot before it is shed
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "30"))
+# A run slower than this multiple of the usual time of its pipeline counts as congestion
+ADMISSION_LATENCY_TOLERANCE = float(os.getenv("ADMISSION_LATENCY_TOLERANCE", "2.0"))
+# The limit is cut at most once per this many seconds, so one burst of
+# failures does not collapse it to the minimum
+ADMISSION_BACKOFF_INTERVAL = float(os.getenv("ADMISSION_BACKOFF_INTERVAL", "5"))
+ADMISSION_BACKOFF_FACTOR = 0.75
+# Weight of a new run time in the smoothed run times
+LATENCY_SMOOTHING = 0.05
+
+
+class Overloaded(Exception):
+    """A run was shed instead of started; retry_after is a hint in seconds"""
+
+    def __init__(self, reason, retry_after):
+        super().__init__(f"Server is busy ({reason}), please retry in {retry_after}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """One agent run's place in the queue and, once admitted, its slot"""
+
+    def __init__(self, user_id, deadline, key):
+        self.user_id = user_id
+        self.deadline = deadline
+        self.key = key
+        self.queued = time.monotonic()
+        self.admitted = None
+        self.failed = False
+        self.ready = threading.Event()
+
+
+class AdmissionController:
+    """
+    Bounds the agent runs in flight, globally and per user. Runs over either
+    limit wait in a FIFO queue; a run whose user is at their limit does not
+    hold up other users behind it. Runs are shed when the queue is full,
+    when the expected wait already exceeds their deadline, or when the
+    deadline passes while they wait.
+
+    The global limit adapts AIMD-style: it grows by about one per `limit`
+    completed runs while it is in use, and is cut by a quarter when a run
+    fails or takes much longer than usual for its pipeline (upstream rate
+    limits and slow providers show up as both).
+    """
+
+    def __init__(self, enabled=ADMISSION_ENABLED, initial_limit=ADMISSION_INITIAL_LIMIT,
+                 min_limit=ADMISSION_MIN_LIMIT, max_limit=ADMISSION_MAX_LIMIT, per_user=ADMISSION_PER_USER,
+                 queue_size=ADMISSION_QUEUE_SIZE, queue_timeout=ADMISSION_QUEUE_TIMEOUT):
+        self.enabled = enabled
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(min(max(initial_limit, min_limit), max_limit))
+        self.per_user = per_user
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self.admitted = 0
+        self.backoffs = 0
+        self.shed = Counter()
+        self._in_flight = 0
+        self._users = {}  # user id -> runs in flight
+        self._queue = deque()
+        self._run_seconds = {}  # pipeline -> smoothed run time
+        self._average_seconds = None
+        self._last_backoff = 0.0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def admit(self, user_id=None, key=None, timeout=None):
+        """Hold a slot for the body; raises Overloaded when the run is shed"""
+        ticket = self.acquire(user_id, key, timeout)
+        try:
+            yield ticket
+        except Exception:
+            ticket.failed = True
+            raise
+        finally:
+            self.release(ticket)
+
+    def acquire(self, user_id=None, key=None, timeout=None):
+        """Wait for a slot. key groups runs of similar cost (the pipeline name)."""
+        timeout = self.queue_timeout if timeout is None else timeout
+        ticket = Ticket(user_id, time.monotonic() + timeout, key)
+        if not self.enabled:
+            ticket.admitted = ticket.queued
+            return ticket
+
+        with span("admission") as current:
+            with self._lock:
+                if len(self._queue) >= self.queue_size:
+                    raise self._reject("queue full")
+                # Shed now rather than after a wait that cannot end in time
+                expected = self._expected_wait(len(self._queue))
+                if self._queue and expected is not None and expected > timeout:
+                    raise self._reject("deadline")
+                self._queue.append(ticket)
+                self._dispatch()
+
+            if not ticket.ready.wait(timeout):
+                with self._lock:
+                    if ticket.admitted is None:
+                        self._queue.remove(ticket)
+                        raise self._reject("timeout")
+
+            waited = ticket.admitted - ticket.queued
+            current.set(waitSeconds=round(waited, 3))
+        metrics.observe("admission_wait_seconds", waited)
+        return ticket
+
+    def release(self, ticket):
+        """Free the ticket's slot and feed its outcome into the limit"""
+        if not self.enabled or ticket.admitted is None:
+            return
+        seconds = time.monotonic() - ticket.admitted
+        with self._lock:
+            saturated = self._in_flight >= int(self.limit) or bool(self._queue)
+            self._in_flight -= 1
+            if ticket.user_id is not None:
+                remaining = self._users.get(ticket.user_id, 1) - 1
+                if remaining > 0:
+                    self._users[ticket.user_id] = remaining
+                else:
+                    self._users.pop(ticket.user_id, None)
+            self._adapt(ticket, seconds, saturated)
+            self._dispatch()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "limit": round(self.limit, 2),
+                "inFlight": self._in_flight,
+                "queued": len(self._queue),
+                "admitted": self.admitted,
+                "shed": dict(self.shed),
+                "backoffs": self.backoffs,
+                "averageRunSeconds": round(self._average_seconds, 2) if self._average_seconds else None,
+            }
+
+    def _dispatch(self):
+        # Admit queued runs in arrival order while there are free slots;
+        # runs of users at their own limit are skipped, not waited on
+        now = time.monotonic()
+        for ticket in list(self._queue):
+            if self._in_flight >= int(self.limit):
+                return
+            if ticket.deadline < now:
+                continue  # its own wait times out and sheds it
+            if ticket.user_id is not None and self._users.get(ticket.user_id, 0) >= self.per_user:
+                continue
+            self._queue.remove(ticket)
+            self._in_flight += 1
+            if ticket.user_id is not None:
+                self._users[ticket.user_id] = self._users.get(ticket.user_id, 0) + 1
+            self.admitted += 1
+            ticket.admitted = now
+            ticket.ready.set()
+
+    def _adapt(self, ticket, seconds, saturated):
+        usual = self._run_seconds.get(ticket.key)
+        congested = ticket.failed or (usual is not None and seconds > usual * ADMISSION_LATENCY_TOLERANCE)
+        if not ticket.failed:
+            self._run_seconds[ticket.key] = seconds if usual is None else usual + LATENCY_SMOOTHING * (seconds - usual)
+            average = self._average_seconds
+            self._average_seconds = seconds if average is None else average + LATENCY_SMOOTHING * (seconds - average)
+
+        now = time.monotonic()
+        if congested:
+            if now - self._last_backoff >= ADMISSION_BACKOFF_INTERVAL:
+                self.limit = max(self.min_limit, self.limit * ADMISSION_BACKOFF_FACTOR)
+                self._last_backoff = now
+                self.backoffs += 1
+        elif saturated:
+            # Only grow a limit that is actually being used
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    def _expected_wait(self, position):
+        if self._average_seconds is None:
+            return None
+        return self._average_seconds * (position + 1) / max(1, int(self.limit))
+
+    def _reject(self, reason):
+        self.shed[reason] += 1
+        metrics.inc("admission_shed_total", reason=reason)
+        expected = self._expected_wait(len(self._queue))
+        return Overloaded(reason, max(1, math.ceil(expected)) if expected else 5)
@@ -1,692 +1,347 @@
 from flask import Flask, request, jsonify, render_template, Response
 from dotenv import load_dotenv
-from phi.agent import Agent
-from phi.model.groq import Groq
+from phi.agent import Agent, RunResponse
 from phi.tools.googlesearch import GoogleSearch
 from phi.tools.baidusearch import BaiduSearch
 from phi.tools.duckduckgo import DuckDuckGo
-from phi.tools.crawl4ai_tools import Crawl4aiTools
 from phi.storage.agent.sqlite import SqlAgentStorage
 from datetime import datetime
 import re
 import os
+import time
 import json
+import atexit
 from flask_cors import CORS
 from bson import ObjectId
-from pymongo import MongoClient
+from streaming import (sse_event, stream_incremental, stream_buffered, chunk_content, agent_events, tool_call_event,
+                       EventLog, ReplayRegistry, StreamOverrun, STREAM_REPLAY_MAX_EVENTS)
+from fanout import FanOutExecutor, fanout_workers, merge_evidence, parse_deadlines
+from query_cache import build_query_cache, normalize_query
+from singleflight import SingleFlight
+from crawl_cache import CrawlCache, SharedCrawl4aiTools, crawl_budget
+from jobs import JobManager
+from bodies import BodyStore
+from search_index import SearchIndex
+from reuse import AnswerReuse
+from entity_store import EntityStore, TableFiller
+from prompts import (PromptBuilder, PromptStats, prompt_report, count_tokens, KNOWN_PREAMBLE,
+                     LEGACY_SEARCH_INSTRUCTIONS, LEGACY_MAIN_INSTRUCTIONS, LEGACY_SYSTEM_MESSAGE_TEMPLATE,
+                     LEGACY_SEARCH_PREAMBLE, LEGACY_EVIDENCE_PREAMBLE)
+from postprocess import postprocess_response, education_column_note
+from query_classifier import PIPELINES, ClassStats, classify, route
+from models import create_model, create_reformatter
+from cassette import Cassette
+from tracing import metrics, request_trace, span, instrument as trace_tools
+from profiling import PROFILE_REQUESTS, PROFILING_ENABLED, SamplingProfiler
+from admission import ADMISSION_MAX_LIMIT, AdmissionController, Overloaded
+from tables import TableParser, parse_tables, extract_records
+from storage import (ensure_indexes, list_responses, get_response, summary_fields, create_mongo_client,
+                     UserProfileCache, WriteBehindBuffer, serialize, HISTORY_PAGE_SIZE)
 
 # It's a point do not CTRL Z after this
 
 load_dotenv()
 
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+# "incremental" forwards agent output as it arrives, "buffered" waits for the
+# full answer and reformats it with Gemini before sending a single chunk
+STREAM_MODE = os.getenv("STREAM_MODE", "incremental")
+# Reformat pass of the buffered mode (REFORMAT_PROVIDER=fake for offline runs)
+reformat = create_reformatter()
+
+CORS_ORIGINS = ["https://ai-powered-search-assistant-eight.vercel.app"]
 
 app = Flask(__name__)
 CORS(app, resources={r"/api/*": {
-    "origins": ["https://ai-powered-search-assistant-eight.vercel.app"],
+    "origins": CORS_ORIGINS,
     "methods": ["GET", "POST", "OPTIONS", "DELETE", "PUT"],
-    "allow_headers": ["Content-Type", "Authorization"]
+    "allow_headers": ["Content-Type", "Authorization", "Last-Event-ID"]
 }})  # This will enable CORS for all routes
 
-# Get current date information for more accurate recent news and achievements
-current_year = datetime.now().year
-current_month = datetime.now().month
-current_date_str = datetime.now().strftime("%Y-%m-%d")
-
-# Enhanced instructions for search and scraping agents with specific focus on schools and companies
-search_instructions = [
-    '''CRITICAL WORKFLOW FOR INFORMATION RETRIEVAL:
-    1. Use multiple search engines to gather latest information,
-    2. Cross-reference and validate data from at least 3 different sources,
-    3. present information that cannot be verified with search results with a tag not verified,
-    4. Use Crawl4ai for each query for deep extraction of information related to every query,
-    5. ALWAYS provide direct source URLs and attribution for every piece of information,
-    6. When you find relevant websites, use web scraping tools to extract detailed information,
-    7. Format information in a consistent, readable manner,
-    8. Show the information in table which is possible to be shown in table,
-    ''',
-    
-    '''MANDATORY TABLE FIELDS FOR ALL QUERIES:
-    For ANY entity (schools, colleges, companies, organizations, locations), you MUST include these fields in your table:
-    - Official Website of schools/colleges/companies/organizations/locations
-    - Contact Details of schools/colleges/companies/organizations/locations
-    
-    These fields are REQUIRED''',
-    
-    f'''For school or college queries, mandatorily create a comprehensive table with:
-    - Institution Name (Latest Official Name),
-    - Official Website (of school or college),
-    - Contact Details (of school or college),
-    - Established Year (Verified from Multiple Sources),
-    - Location (Current, Precise Location),
-    - Type (Public/Private - Most Recent Status),
-    - Total Student Enrollment (Most Recent Academic Year),
-    - Annual Tuition Fees (Current Academic Year),
-    - Top Programs Offered (Updated Curriculum),
-    - Accreditation Status (Most Recent Certification),
-    - Average Campus Placement Rate (This column is only for colleges),
-    - Recent Notable Achievements in detail (Within Last 6 MONTHS - focusing on {current_year} data),
-    - Campus Facilities (Current Infrastructure)
-    
-    Always include direct source URLs for each piece of information.''',
-    
-    f'''For company queries, create a comprehensive table with:
-    - Company Name (Latest Official Name),
-    - Official Website ,
-    - Contact Details,
-    - Founded Year (Verified Date),
-    - Headquarters Location (Current Address),
-    - Industry Sector (Most Recent Classification),
-    - Number of Employees (Latest Reported Count),
-    - Annual Revenue (Most Recent Financial Year),
-    - Average Salary Range (Current Market Data),
-    - Top Job Roles (Updated Job Market Trends),
-    - Company Culture Rating (Recent Employee Feedback),
-    - Recent Major News/Developments (Last 3 MONTHS only - focusing on {current_year} data),
-    - Key Products/Services (Current Offerings)
-    
-    Always include direct source URLs for each piece of information.''',
-    
-    '''ANTI-HALLUCINATION GUIDELINES:
-    - present information that cannot be verified with search results with a tag Not Verified
-    - ALWAYS provide source URLs for each piece of information
-    - Include the date when the information was retrieved
-    - For conflicting information, present all perspectives with source links
-    - Do not try to fill gaps with educated guesses
-    - Present exact quotes from sources when possible
-    - Indicate confidence level for each piece of information (High/Medium/Low)
-    - Use phrases like "According to [source]..." rather than presenting information as definitive facts''',
-    
-    '''CRITICAL FUSION INSTRUCTION:
-    - Only combine web search results with LLM's contextual knowledge when search results are sparse,
-    - If web search provides specific data points, rely primarily on these verified points,
-    - Use LLM knowledge ONLY to organize and structure information, not to supplement it,
-    - Highlight any discrepancies between search results and existing knowledge,
-    - When in doubt, trust the search results over pre-existing knowledge''',
-
-    f'''MANDATORY INSTRUCTION FOR ALL SCHOOL QUERIES:
-    You MUST return ALL data points for the comprehensive table including:
-    - Institution Name (Latest Official Name),
-    - Official Website (of that school),
-    - Contact Details (of that school),
-    - Established Year (Verified from Multiple Sources),
-    - Location (Current, Precise Location),
-    - Type (Public/Private - Most Recent Status),
-    - Total Student Enrollment (Most Recent Academic Year),
-    - Annual Tuition Fees (Current Academic Year),
-    - Top Programs Offered (Updated Curriculum),
-    - Accreditation Status (Most Recent Certification),
-    - Recent Notable Achievements (Within Last 6 MONTHS - focusing on {current_year} data only),
-    - Campus Facilities (Current Infrastructure)
-    
-    If any data point cannot be found, indicate with "Data not available" but NEVER omit columns''',
-
-    f'''MANDATORY INSTRUCTION FOR ALL COLLEGES OR UNIVERSITIES QUERIES:
-    You MUST return ALL data points for the comprehensive table including:
-    - Institution Name (Latest Official Name),
-    - Official Website (of that college or universities),
-    - Contact Details (of that college or universities),
-    - Established Year (Verified from Multiple Sources),
-    - Location (Current, Precise Location),
-    - Type (Public/Private - Most Recent Status),
-    - Total Student Enrollment (Most Recent Academic Year),
-    - Annual Tuition Fees (Current Academic Year),
-    - Top Programs Offered (Updated Curriculum),
-    - Accreditation Status (Most Recent Certification),
-    - Average Campus Placement Rate (Latest Available Data),
-    - Recent Notable Achievements (Within Last 6 MONTHS - focusing on {current_year} data only),
-    - Campus Facilities (Current Infrastructure)
-    
-    If any data point cannot be found, indicate with "Data not available" but NEVER omit columns''',
-    
-    '''SOURCE ATTRIBUTION REQUIREMENTS:
-    After the main table, you MUST include a "Sources" section that follows these rules:
-    
-    1. List every source used for the information with:
-       - Full URL of the source website
-       - Date the page was last accessed
-       - Brief description of what information was obtained from this source
-       
-    2. For each piece of information in the table, indicate in brackets which source it came from
-       - Example: "Annual Revenue: $2.5 million [Source 3]"
-       - This allows users to verify the information themselves
-    
-    3. For conflicting information, include all sources that provided different data points
-       - Example: "Employee Count: 500 [Source 1] or 550 [Source 2]"''',
-    
-    f'''CRITICAL NEWS SECTION REQUIREMENTS:
-    For ALL queries about any entity, you MUST include a "Recent News" section that follows these rules:
-    
-    1. RECENCY: Search specifically for news published within the LAST 3 MONTHS ONLY, using date-specific search terms
-       - Example search: "[entity name] news {current_year}" or "[entity name] recent news last 3 months"
-       - Use specific date ranges in your searches (e.g., "after:{current_year}-{current_month-3}-01")
-       - Use Crawl4ai to extract news sections from the entity's official website
-       - Prioritize news from the most recent month when available
-       - Do NOT include any news from previous years unless absolutely nothing from {current_year} is available
-    
-    2. BALANCE: You MUST include BOTH positive and negative news when available
-       - Include at least 1 positive development (achievements, growth, awards)
-       - Include at least 1 critical or challenging news item (controversies, setbacks, criticisms)
-       - If only positive or only negative news exists, note this explicitly
-    
-    3. FORMATTING: Each news item MUST include:
-       - Headline (exact as published)
-       - Publication date (including month and year, with exact date when available)
-       - Source (publication name with link if available)
-       - Brief 1-2 sentence summary
-       - Label as [POSITIVE] or [CHALLENGING] at the beginning of each item
-    
-    4. VERIFICATION: Cross-reference news from multiple sources when possible
-    
-    5. MINIMUM REQUIREMENT: Include at least 3-5 news items total from {current_year} only
-       - If fewer than 3 recent news items from {current_year} can be found, explicitly state: "Limited recent news is available for this entity. The following represents the most current information found:"
-    
-    Use specific search queries like "[entity name] news {current_year}" and "[entity name] achievement {current_year}" to ensure the most recent coverage.''',
-    
-    '''INFORMATION CONFIDENCE INDICATORS:
-    For each section of your response, indicate the confidence level based on the quality and quantity of sources:
-    
-    - HIGH CONFIDENCE: Information verified from 3+ reputable sources including official websites
-    - MEDIUM CONFIDENCE: Information found in 1-2 reputable sources
-    - LOW CONFIDENCE: Information found only in user-generated content or forums
-    - NO CONFIDENCE: No information found (use "Data not available")
-    
-    These confidence indicators must be included at the beginning of each major section of your response.'''
-]
-
-# Enhanced Google Search agent with web scraping capabilities
-search_agent_GoogleSearch = Agent(
-    model=Groq(id="deepseek-r1-distill-llama-70b"),
-    role="Information retrieval specialist using Google Search with web scraping and general knowledge capabilities",
-    tools=[
-        GoogleSearch(),
-        Crawl4aiTools(max_length=None),
-    ],
-    description="You retrieve accurate and up-to-date information from Google Search results and can scrape website content when needed. You can also answer general knowledge questions and are particularly valuable for recent information.",
-    instructions=search_instructions,
-    stream=False,
-    show_tool_calls=False
-)
-
-# Enhanced DuckDuckGo agent with web scraping capabilities
-search_agent_DuckDuckGO = Agent(
-    model=Groq(id="deepseek-r1-distill-llama-70b"),
-    role="Information retrieval specialist using DuckDuckGo with web scraping and general knowledge capabilities",
-    tools=[
-        DuckDuckGo(),
-        Crawl4aiTools(max_length=None),
-    ],
-    description="You retrieve accurate and up-to-date information from DuckDuckGo search results and can scrape website content when needed. You can also answer general knowledge questions and are particularly good at privacy-respecting searches.",
-    instructions=search_instructions,
-    stream=False,
-    show_tool_calls=False
-)
-
-# Enhanced Baidu Search agent with web scraping capabilities
-search_agent_BaiduSearch = Agent(
-    model=Groq(id="deepseek-r1-distill-llama-70b"),
-    role="Information retrieval specialist using Baidu Search with web scraping and general knowledge capabilities",
-    tools=[
-        BaiduSearch(),
-        Crawl4aiTools(max_length=None),
-    ],
-    description="You retrieve accurate and up-to-date information from Baidu search results and can scrape website content when needed - particularly valuable for information about Asian entities and general knowledge related to Asia.",
-    instructions=search_instructions,
-    stream=False,
-    show_tool_calls=False
-)
-
-# Enhanced main agent instructions for information fusion
-main_agent_instructions = [
-    f'''MANDATORY TABLE FORMAT INSTRUCTION FOR ALL SCHOOL/COLLEGE QUERIES:
-    When ANY query involves a school, college, or educational institution, you MUST create a comprehensive table with EXACTLY these columns:
-    
-    | Institution Name | Official Website | Contact Information | Established Year | Location | Type | Total Student Enrollment | Annual Tuition Fees | Top Programs Offered | Accreditation Status | Average Campus Placement Rate | Recent Notable Achievements | Campus Facilities |
-    
-    in case if query is related to School, then do not include the Average Campus Placement Rate column
-    CRITICAL: Website and contact information are REQUIRED fields:
-    - Official Website: URL
-    - Contact Information: Phone number or anything
-    
-    ACTIVELY search for these two pieces of information as a TOP PRIORITY using:
-    - The institution's official website
-    - "Contact Us" pages
-    - Directory listings
-    - Social media profiles
-    - Google Maps
-    
-    FOR RECENT NOTABLE ACHIEVEMENTS:
-    - ONLY include achievements from {current_year}
-    - Search with specific date filters using "after:{current_year}-01-01"
-    - Use search terms like "[institution name] achievement {current_year}" or "[institution name] award {current_year}"
-    - Use Crawl4ai on the institution's "News" or "Announcements" pages
-    
-    NO OTHER TABLE FORMAT IS ACCEPTABLE for educational institution queries. Do not deviate from this format.
-    Only if after exhaustive searching you cannot find website or contact info, use "Data not available".
-    
-    After the table, you MUST provide a "Recent News" section with both positive and negative news for EACH institution in your results, focusing ONLY on {current_year} news.''',
-    
-    f'''MANDATORY TABLE FORMAT INSTRUCTION FOR ALL COMPANY QUERIES:
-    When ANY query involves a company or business, you MUST create a comprehensive table with EXACTLY these columns:
-    
-    | Company Name | Official Website | Contact Information | Founded Year | Headquarters Location | Industry Sector | Number of Employees | Annual Revenue | Average Salary Range | Top Job Roles | Company Culture Rating | Recent Major News | Key Products/Services |
-    
-    CRITICAL: Website and contact information are REQUIRED fields:
-    - Official Website: Full URL starting with http:// or https://
-    - Contact Information: Phone number with country/area code or email address
-    
-    ACTIVELY search for these two pieces of information as a TOP PRIORITY using:
-    - The company's official website
-    - "Contact Us" pages
-    - Business directories
-    - Social media profiles
-    - Google Maps
-    
-    FOR RECENT MAJOR NEWS:
-    - ONLY include news from {current_year}
-    - Search with specific date filters using "after:{current_year}-01-01"
-    - Use search terms like "[company name] news {current_year}" or "[company name] announcement {current_year}"
-    - Use Crawl4ai on the company's "News" or "Press Releases" pages
-    
-    NO OTHER TABLE FORMAT IS ACCEPTABLE for company queries. Do not deviate from this format.
-    Only if after exhaustive searching you cannot find website or contact info, use "Data not available".
-    
-    After the table, you MUST provide a "Recent News" section with both positive and negative news for EACH company in your results, focusing ONLY on {current_year} news.''',
-    
-    '''CRITICAL WORKFLOW FOR INFORMATION RETRIEVAL:
-        1. Use multiple search engines to gather latest information,
-        2. Cross-reference and validate data from at least 3 different sources,
-        3. Combine web search results with contextual LLM knowledge,
-        4. Use Crawl4ai for each query for deep extraction of information related to every query,
-        5. Always provide sources for your information,
-        6. When you find relevant websites, use web scraping tools to extract detailed information,
-        7. Format information in a consistent, readable manner,
-        8. Show the information in table which is possible to be shown in table''',
-    
-    # Information quality and citation
-    "Always provide accurate information with clear attribution to sources",
-    "Include direct links to source websites when available",
-    "Evaluate source credibility and prioritize official websites and reputable sources",
-    
-    # Query analysis and search engine selection
-    "Analyze queries deeply to identify subject domain, geographic relevance, and recency requirements",
-    "Use multiple search engines for global topics to ensure comprehensive coverage",
-    "For Asia-specific queries, prioritize Baidu Search",
-    "For privacy-sensitive topics, prioritize DuckDuckGo",
-    "For general global queries, prefer Google Search",
-    
-    # Web scraping and information synthesis
-    "Use web scraping tools strategically - Crawl4ai for deep content extraction from key pages",
-    "Synthesize information across multiple sources to provide a complete picture",
-    "When sources conflict, present all perspectives with your assessment of reliability",
-    "Format extracted data in tables whenever the information is structured and comparable",
-    
-    # Domain-specific organization
-    "For companies: Structure as Company Overview, Products/Services, Leadership, Financials, Recent News",
-    "For educational institutions: Always use the MANDATORY table format specified at the top",
-    "For locations/venues: Organize as Address, Opening Hours, Offerings, Reviews, Contact Information",
-    "For products: Show Features, Pricing, Availability, Comparisons, Customer Reviews",
-    "For events: Include Dates, Location, Participants, Schedule, Registration/Ticket Information",
-    
-    # Recency handling (modified to always use search tools)
-    "MANDATORY: For ALL queries, ALWAYS use search tools to retrieve the most up-to-date information",
-    "Never rely solely on built-in knowledge for any information",
-    "Always verify information through search tools regardless of query content",
-    
-    # Response quality
-    "Begin responses with a direct, concise answer to the query before providing supporting details",
-    "Prioritize readability with clear headings, short paragraphs, and bullet points for lists",
-    "Use tables to compare multiple entities or organize structured information",
-    "Include both summary information and detailed facts to accommodate different user needs",
-    "Provide perspective on information significance when relevant (e.g., whether a statistic is high/low)",
-    
-    # News reporting requirement
-    f"MANDATORY: Include a 'Recent News' section after the table information for EACH entity mentioned",
-    f"For EACH entity, report BOTH positive and negative news from {current_year} ONLY",
-    f"For each news item, include exact date (if available), headline, brief summary, and source",
-    f"Clearly label each news item as 'POSITIVE' or 'CHALLENGING'",
-    f"Balance perspectives by including at least one positive and one negative news item for each entity",
-    f"Organize news items chronologically with newest items first",
-    f"Use date-restricted searches to find the newest information possible",
-    f"Use search queries with specific date ranges like 'after:{current_year}-01-01'",
-    
-    # Special handling
-    "For numerical data, include context (e.g., industry averages, historical trends) when available",
-    "For technical topics, provide both simplified explanations and detailed information",
-    "When information appears outdated, explicitly note this and search for more recent sources",
-    "For controversial topics, present multiple viewpoints with balanced treatment",
-    
-    # Process transparency
-    "Clearly indicate which search engines were used to retrieve information",
-    "Note when information comes from web scraping versus search results",
-    "Acknowledge information gaps when searches don't yield complete answers",
-    "Always double-check calculations and factual claims before presenting them",
-    "Add the current year to search queries to find the most recent information"
-]
-
-# Modified system message template to ensure search tools are used for every query
-system_message_template = f"""
-You are an advanced information retrieval system designed to provide ONLY verified information. For EVERY query, follow this protocol EXACTLY:
-
-1. You MUST use your search tools for ALL queries to provide the most current and accurate information.
-   - Do not rely on your pre-trained knowledge for ANY information
-   - NEVER state "As of my last update" or similar phrases
-   - ALWAYS verify information through search, regardless of the query content
-   - NEVER invent or hallucinate information that cannot be verified through search results
-
-2. For the query: "{{user_query}}"
-   - You MUST use search tools to gather current information
-   - Combine search results with your knowledge ONLY for organization and structure
-   - Verify ALL facts, figures, and statements through search
-   - Use "Data not available" for any information that cannot be verified
-
-3. Use multiple search engines to cross-reference information:
-   - Google Search for general global queries
-   - Baidu Search for Asia-specific information
-   - DuckDuckGo for privacy-sensitive topics
-   - ALWAYS show which search engine provided which information
-
-4. CRITICAL: For ANY school or college queries, you MUST create a table with EXACTLY these columns in this EXACT order:
-   | Institution Name | Official Website | Contact Details | Established Year | Location | Type | Total Student Enrollment | Annual Tuition Fees | Top Programs Offered | Accreditation Status | Average Campus Placement Rate | Recent Notable Achievements | Campus Facilities |
-   
-   - Institution Name: Latest official name
-   - Official Website: REQUIRED - Working URL to the institution's site with http:// or https://
-   - Contact Details: REQUIRED - Current phone number, email address
-   - Established Year: Verified from multiple sources
-   - Location: Current, precise location
-   - Type: Public/Private - most recent status
-   - Total Student Enrollment: Most recent academic year
-   - Annual Tuition Fees: Current academic year
-   - Top Programs Offered: Updated curriculum
-   - Accreditation Status: Most recent certification
-   - Average Campus Placement Rate: Latest available data (only for colleges)
-   - Recent Notable Achievements: Must be from {current_year} ONLY - use date-restricted searches
-   - Campus Facilities: Current infrastructure
-   
-   For ANY missing information, write "Data not available" in the cell. NEVER omit columns or change their order.
-   Add source attribution for each piece of information [Source #].
-
-5. MANDATORY SOURCES SECTION: After any table or detailed information, you MUST include a "Sources" section that lists:
-   - Full URLs of all websites used
-   - Date the information was accessed
-   - Brief description of what information was obtained from each source
-   - Number each source so it can be referenced in the body of the text [Source #]
-
-6. MANDATORY RECENT NEWS SECTION: For ALL queries (schools, colleges, companies, or any entity), you MUST include a "Recent News" section after the main information with:
-   - News items MUST be from {current_year} ONLY - use specific date-restricted searches
-   - At least 3-5 news items when available
-   - News items MUST include BOTH positive developments AND critical/challenging news
-   - Each news item must be labeled as [POSITIVE] or [CHALLENGING] at the beginning
-   - Include for each: headline, exact publication date (day/month/year if available), source URL, and 1-2 sentence summary
-   - Use specific search queries like "[entity name] news {current_year}" and "[entity name] achievement {current_year}"
-   - Use date-specific search parameters like "after:{current_year}-01-01"
-   - If limited recent news is available, explicitly state this but still provide what you can find
-
-7. OFFICIAL WEBSITE AND CONTACT DETAILS CHECK:
-   - Double-check that Official Website and Contact Details are included in the table
-   - For Official Website, provide complete URL (including https://)
-   - For Contact Details, provide phone, email, and/or social media when available
-   - These fields are REQUIRED for ALL entity-based queries
-
-8. CONFIDENCE INDICATORS:
-   - Label each major section with confidence level based on source quality and quantity:
-   - HIGH CONFIDENCE: Information verified from 3+ reputable sources including official websites
-   - MEDIUM CONFIDENCE: Information found in 1-2 reputable sources 
-   - LOW CONFIDENCE: Information found only in user-generated content or forums
-   - NO CONFIDENCE: No information found (use "Data not available")
-
-9. After searching, synthesize a complete response that integrates all information sources with proper source attribution.
-
-10. FINAL CHECK: Before submitting your response, verify:
-   - Your table has ALL REQUIRED COLUMNS in the EXACT order specified above
-   - Official Website and Contact Details columns are properly filled
-   - You've included the Sources section with numbered references
-   - You've included the Recent News section with BOTH positive and challenging news items
-   - All news items are from {current_year} ONLY
-   - Each major section has confidence indicators
-   - You've used "Data not available" rather than inventing information
-"""
-
-def validate_education_query_response(response_text, query):
-    # Simple detection for education-related queries
-    education_keywords = ["school", "college", "university", "institute", "campus", 
-                         "education", "academic", "student", "faculty", "course"]
-    
-    is_education_query = any(keyword.lower() in query.lower() for keyword in education_keywords)
-    
-    # Check if the response includes a Sources section
-    has_sources_section = "Sources:" in response_text or "SOURCES:" in response_text
-    
-    if not has_sources_section:
-        sources_reminder = f"""
-
-**MISSING INFORMATION: A "Sources" section should be included listing all websites used for information gathering with URLs and access dates.**
-        """
-        response_text += sources_reminder
-    
-    # Check if confidence indicators are included
-    has_confidence_indicators = any(level in response_text for level in ["HIGH CONFIDENCE:", "MEDIUM CONFIDENCE:", "LOW CONFIDENCE:"])
-    
-    if not has_confidence_indicators:
-        confidence_reminder = """
-
-**MISSING INFORMATION: Confidence indicators (HIGH/MEDIUM/LOW) should be included for each major section based on source quality.**
-        """
-        response_text += confidence_reminder
-    
-    if not is_education_query:
-        # Check if the response has "Official Website" and "Contact Details" if it's any type of entity
-        has_website = "Official Website" in response_text
-        has_contact = "Contact Details" in response_text
-        
-        if not (has_website and has_contact):
-            general_reminder = """
-
-**MISSING INFORMATION: Information about any entity should include Official Website and Contact Details. Please request this information if needed.**
-            """
-            response_text += general_reminder
-        
-        # Check if the response has a balanced news section
-        has_news_section = "Recent News" in response_text or "RECENT NEWS" in response_text
-        has_positive = "[POSITIVE]" in response_text
-        has_challenging = "[CHALLENGING]" in response_text
-        
-        if not has_news_section or not (has_positive and has_challenging):
-            news_reminder = f"""
-
-**MISSING INFORMATION: A Recent News section should be included with both positive and challenging news items from {current_year} only. Please request this information if needed.**
-            """
-            response_text += news_reminder
-            
-        return response_text
-    
-    # For education queries, check if the response has the required columns
-    required_columns = [
-        "Institution Name", "Official Website", "Contact Details", "Established Year", "Location", "Type", 
-        "Total Student Enrollment", "Annual Tuition Fees", "Top Programs Offered",
-        "Accreditation Status", "Average Campus Placement Rate", 
-        "Recent Notable Achievements", "Campus Facilities"
-    ]
-    
-    # Check if the response has a balanced news section
-    has_news_section = "Recent News" in response_text or "RECENT NEWS" in response_text
-    has_positive = "[POSITIVE]" in response_text
-    has_challenging = "[CHALLENGING]" in response_text
-    
-    # If there's a table but missing required columns, add a correction note
-    if "| Institution Name |" not in response_text or len(required_columns) > response_text.count("|") / 2:
-        correction_note = """
-        
-**MISSING INFORMATION: The table provided is incomplete. A comprehensive educational institution table should include the following columns:**
-
-| Institution Name | Official Website | Contact Details | Established Year | Location | Type | Total Student Enrollment | Annual Tuition Fees | Top Programs Offered | Accreditation Status | Average Campus Placement Rate | Recent Notable Achievements | Campus Facilities |
-
-Please request more detailed information if needed.
-        """
-        response_text += correction_note
-    
-    # If there's no balanced news section, add a reminder
-    if not has_news_section or not (has_positive and has_challenging):
-        news_reminder = f"""
-
-**MISSING INFORMATION: A Recent News section should be included with both positive [POSITIVE] and challenging [CHALLENGING] news items from {current_year} only. Please request this information if needed.**
-        """
-        response_text += news_reminder
-    
-    # Add anti-hallucination disclaimer if needed
-    disclaimer = f"""
-
-**INFORMATION VERIFICATION NOTICE: All information provided has been gathered through search tools and web scraping as of {current_date_str}. Any field marked as "Data not available" indicates that information could not be verified from reliable sources. Please consult official websites for the most accurate and up-to-date information.**
-        """
-    response_text += disclaimer
-    
-    return response_text
-
-# Function to validate company query responses
-def validate_company_query_response(response_text, query):
-    # Simple detection for company-related queries
-    company_keywords = ["company", "business", "corporation", "firm", "enterprise", 
-                        "corporate", "industry", "organization", "startup"]
-    
-    is_company_query = any(keyword.lower() in query.lower() for keyword in company_keywords)
-    
-    if not is_company_query:
-        return response_text
-    
-    # Check if the response has the required columns for companies
-    if "| Company Name |" not in response_text or "| Official Website |" not in response_text or "| Contact Information |" not in response_text:
-        correction_note = """
-        
-**NOTE: The table provided is incomplete. A comprehensive company table should include the following columns:**
-
-| Company Name | Official Website | Contact Information | Founded Year | Headquarters Location | Industry Sector | Number of Employees | Annual Revenue | Average Salary Range | Top Job Roles | Company Culture Rating | Recent Major News | Key Products/Services |
-
-Please request more detailed information if needed.
-        """
-        return response_text + correction_note
-    
-    # Check if there's a news section with both positive and negative news
-    if "Recent News" not in response_text or ("POSITIVE" not in response_text and "Positive" not in response_text) or ("NEGATIVE" not in response_text and "Negative" not in response_text and "CHALLENGING" not in response_text and "Challenging" not in response_text):
-        news_note = f"""
-
-**NOTE: The response should include a "Recent News" section with both positive and negative news items from {current_year} only for each company mentioned.**
-
-Please request this information if needed.
-        """
-        return response_text + news_note
-        
-    return response_text
-
-
-# Function to clean system instructions from the response
-def clean_system_instructions(response_text):
-    # Patterns to identify and remove system instructions
-    patterns = [
-        r"As an advanced information retrieval system.*?protocol EXACTLY:",
-        r"YOU MUST use your search tools.*?information\.",
-        r"NEVER state \"As of my last update\".*?phrases",
-        r"ALWAYS verify information through.*?content",
-        r"CRITICAL: For ANY school or college queries.*?order\.",
-        r"MANDATORY: After the table.*?first",
-        r"YOUR RESPONSE MUST CONTAIN.*?requested",
-        r"I'll use my search tools to gather.*?Query:",
-        r"I must use search tools to gather.*?information\.",
-        r"For your query about.*?search tools\.",
-        r"I'll now search for the most up-to-date information.*?query\.",
-        r"Let me search for information about.*?\.",
-        r"Following the required format for educational institutions.*?\.",
-        r"I'll make sure to include both positive and negative news.*?\.",
-        r"I'll ensure I don't include system instructions.*?\.",
-        r"Now, let me gather information using my search tools.*?one moment\.",
-        r"Website and contact information are TOP PRIORITY fields.*?pages\.",
-        r"I need to use search tools for this query.*?\.",
-        r"I'll actively search for the official website and contact information.*?\.",
-        r"I'll make sure to include news for each entity.*?\.",
-        r"Each news item will be clearly labeled as.*?\.",
-        r"Let me search for the most current information.*?\.",
-        r"Before providing my response.*?\.",
-        r"I understand I need to provide comprehensive information.*?\.",
-        r"I'll get started on your query.*?\.",
-        r"I'll ALWAYS cite my sources.*?\.",
-        r"These instructions are VERY IMPORTANT.*?\.",
-        r"Using my search tools to gather current information.*?\.",
-        r"I need to conduct web searches for this.*?\.",
-        r"I'm using search tools to gather this information.*?\.",
-        r"I'll make sure to include website and contact information.*?\.",
-        r"I'm searching for both positive and negative news.*?\.",
-        r"I'll be sure to format my response according to.*?\.",
-        r"For this query, I need to.*?\.",
-        r"I must create a comprehensive table.*?\.",
-        r"Let me gather the requested information.*?\.",
-        r"I'm using search tools to find the most up-to-date information.*?\.",
-        r"I'll use Crawl4ai to extract detailed information.*?\."
-    ]
-    
-    # Apply the patterns to clean the response
-    cleaned_response = response_text
-    for pattern in patterns:
-        cleaned_response = re.sub(pattern, "", cleaned_response, flags=re.DOTALL)
-    
-    # Remove any resulting double spaces or newlines
-    cleaned_response = re.sub(r'\n\s*\n\s*\n', '\n\n', cleaned_response)
-    cleaned_response = re.sub(r'  +', ' ', cleaned_response)
-    
-    return cleaned_response.strip()
-
-# Function to enforce website and contact information inclusion
-def enforce_website_contact_info(response_text, query):
-    # If the response already has website and contact info, return as is
-    if ("| Official Website |" in response_text and "| Contact Information |" in response_text and 
-        not ("Official Website | Data not available" in response_text and "Contact Information | Data not available" in response_text)):
-        return response_text
-    
-    # Add a specific warning about website and contact information
-    warning = """
-    
-**IMPORTANT: The results should include Official Website and Contact Information for each entity mentioned. Please ensure this critical information is included in all tables.**
+# Agent prompts are assembled from de-duplicated rule blocks for the topics
+# of the query, with the query kept out of the system prompt so it can be
+# prefix-cached (PROMPT_BUILDER=0 sends the legacy prompts)
+PROMPT_BUILDER = os.getenv("PROMPT_BUILDER", "1") == "1"
+prompt_builder = PromptBuilder()
+prompt_stats = PromptStats()
+
+# One page cache shared by the crawlers of all search agents
+crawl_cache = CrawlCache()
+
+# Search and crawl traffic recorded to or replayed from a local file
+# (TOOL_CASSETTE_MODE=record|replay) for reproducible offline benchmarks
+tool_cassette = Cassette()
+
+# Search engines the agents are built from: tool class, role and description
+SEARCH_ENGINES = {
+    # Enhanced Google Search agent with web scraping capabilities
+    "google": (
+        GoogleSearch,
+        "Information retrieval specialist using Google Search with web scraping and general knowledge capabilities",
+        "You retrieve accurate and up-to-date information from Google Search results and can scrape website content when needed. You can also answer general knowledge questions and are particularly valuable for recent information.",
+    ),
+    # Enhanced DuckDuckGo agent with web scraping capabilities
+    "duckduckgo": (
+        DuckDuckGo,
+        "Information retrieval specialist using DuckDuckGo with web scraping and general knowledge capabilities",
+        "You retrieve accurate and up-to-date information from DuckDuckGo search results and can scrape website content when needed. You can also answer general knowledge questions and are particularly good at privacy-respecting searches.",
+    ),
+    # Enhanced Baidu Search agent with web scraping capabilities
+    "baidu": (
+        BaiduSearch,
+        "Information retrieval specialist using Baidu Search with web scraping and general knowledge capabilities",
+        "You retrieve accurate and up-to-date information from Baidu search results and can scrape website content when needed - particularly valuable for information about Asian entities and general knowledge related to Asia.",
+    ),
+}
+
+def create_search_agents(query_class, pipeline):
     """
-    
-    return response_text + warning
+    Build a fresh set of search agents keyed by engine name, one per engine
+    of the query's pipeline. phi agents keep per-run state, so every request
+    gets its own set.
+    """
+    if PROMPT_BUILDER:
+        search_instructions = [prompt_builder.system_prompt("search", query_class.topics, query_class.kind)]
+    else:
+        search_instructions = LEGACY_SEARCH_INSTRUCTIONS
+
+    agents = {}
+    for name in pipeline.engines:
+        tool, role, description = SEARCH_ENGINES[name]
+        # Crawls are traced inside the shared crawler, below its page cache
+        tools = [trace_tools(tool_cassette.instrument(tool()))]
+        if pipeline.crawl:
+            tools.append(tool_cassette.instrument(SharedCrawl4aiTools(crawl_cache)))
+        agents[name] = Agent(
+            model=create_model("search", pipeline.model),
+            role=role,
+            tools=tools,
+            description=description,
+            instructions=search_instructions,
+            stream=False,
+            show_tool_calls=False
+        )
+    return agents
 
 # Modified agent to use search tools for every query
 class AlwaysSearchAgent(Agent):
-    def run(self, message, **kwargs):
-        # Modified instruction to emphasize preserving the original query
-        enriched_message = f"CRITICAL: YOU MUST USE SEARCH TOOLS and web scraping tools for this query. YOU MUST FIND AND INCLUDE OFFICIAL WEBSITE URLs AND CONTACT INFORMATION for all entities. YOU MUST PROVIDE BOTH POSITIVE AND NEGATIVE NEWS for all entities mentioned. DO NOT add year on your own, but you are allowed to do other changes for functionality. Query: {message}"
+    def run(self, message, query_class, evidence=None, known=None, **kwargs):
+        """query_class: the QueryClass the request was classified as"""
+        if PROMPT_BUILDER:
+            # The rules are in the system prompt; the message only carries the query and its context
+            enriched_message = prompt_builder.user_message(message, evidence=evidence, known=known)
+        elif evidence is None:
+            # Modified instruction to emphasize preserving the original query
+            enriched_message = LEGACY_SEARCH_PREAMBLE.format(query=message)
+            if known:
+                # Saved research on some of the entities; only the gaps need searching
+                enriched_message += f"\n\n{KNOWN_PREAMBLE}\n\nKNOWN INFORMATION:\n\n{known}"
+        else:
+            # Evidence was already gathered by the search agents in parallel
+            enriched_message = LEGACY_EVIDENCE_PREAMBLE.format(query=message, evidence=evidence)
         response = super().run(enriched_message, **kwargs)
         
-        # If it's not streaming, post-process the response
+        # If it's not streaming, post-process the response text
         if not kwargs.get("stream", False):
-            # First validate the educational and company query responses
-            response = validate_education_query_response(response, message)
-            response = validate_company_query_response(response, message)
-            # Enforce website and contact information
-            response = enforce_website_contact_info(response, message)
-            # Then clean out any system instructions
-            response = clean_system_instructions(response)
+            response_text = response.content if isinstance(response.content, str) else str(response.content or "")
+            # Validate the answer, add notes for missing information and strip echoed instructions
+            with span("postprocess"):
+                response.content = postprocess_response(response_text, query_class)
         
         return response
 
-agent_team = AlwaysSearchAgent(
-    name="Information Research Team",
-    model=Groq(id="deepseek-r1-distill-llama-70b"),
-    role="Team coordinator that manages information retrieval across multiple search platforms and web scraping tools for ALL queries",
-    team=[search_agent_GoogleSearch, search_agent_BaiduSearch, search_agent_DuckDuckGO],
-    instructions=main_agent_instructions,
-    storage=SqlAgentStorage(table_name="information_research_team", db_file="agents.db"),
-    add_history_to_messages=False,
-    stream=False,
-    show_tool_calls=False,
-    markdown=False,
-    system_message=system_message_template.format(user_query="Example query")
+# Run history of the coordinator, shared by all requests
+team_storage = SqlAgentStorage(table_name="information_research_team", db_file="agents.db")
+
+def coordinator_prompt(role, query, query_class):
+    """System message and instructions of the coordinator or synthesis agent"""
+    if PROMPT_BUILDER:
+        return prompt_builder.system_prompt(role, query_class.topics, query_class.kind), None
+    # The legacy system message embeds the query
+    return LEGACY_SYSTEM_MESSAGE_TEMPLATE.format(user_query=query), LEGACY_MAIN_INSTRUCTIONS
+
+def create_agent_team(query, search_agents, query_class, pipeline):
+    """Coordinator that delegates to the search agents"""
+    system_message, instructions = coordinator_prompt("coordinator", query, query_class)
+    return AlwaysSearchAgent(
+        name="Information Research Team",
+        model=create_model("coordinator", pipeline.model),
+        role="Team coordinator that manages information retrieval across multiple search platforms and web scraping tools for ALL queries",
+        team=[search_agents[name] for name in ("google", "baidu", "duckduckgo") if name in search_agents],
+        instructions=instructions,
+        storage=team_storage,
+        add_history_to_messages=False,
+        stream=False,
+        # Streamed runs also report tool calls as they start and complete
+        stream_intermediate_steps=True,
+        show_tool_calls=False,
+        markdown=False,
+        system_message=system_message
+    )
+
+def create_synthesis_agent(query, query_class, pipeline):
+    """
+    Same coordinator without a team: used when the search agents are fanned
+    out in parallel and their merged evidence is handed over in a single step
+    """
+    system_message, instructions = coordinator_prompt("synthesis", query, query_class)
+    return AlwaysSearchAgent(
+        name="Information Synthesis",
+        model=create_model("synthesis", pipeline.model),
+        role="Team coordinator that synthesises evidence gathered in parallel from multiple search platforms and web scraping tools",
+        instructions=instructions,
+        add_history_to_messages=False,
+        stream=False,
+        # Streamed runs also report tool calls as they start and complete
+        stream_intermediate_steps=True,
+        show_tool_calls=False,
+        markdown=False,
+        system_message=system_message
+    )
+
+# Institution and company facts with per-field freshness, learned from every
+# answer the pipeline produces. Fresh facts fill table cells the agent left
+# empty; they are also given to the agents as known information through
+# answer_reuse, which REUSE_ENABLED=0 turns off (the cells are still filled).
+entity_store = EntityStore(db_file=os.getenv("ENTITY_STORE_DB", "agents.db"))
+
+# Parallel fan-out of the search agents (SEARCH_FANOUT=0 falls back to phi's
+# one-tool-call-at-a-time team delegation)
+SEARCH_FANOUT = os.getenv("SEARCH_FANOUT", "1") == "1"
+# Sized so every run admission lets in can start all of its engines
+fanout_executor = FanOutExecutor(
+    deadlines=parse_deadlines(os.getenv("FANOUT_DEADLINES", "")),
+    max_workers=fanout_workers(ADMISSION_MAX_LIMIT, max(len(pipeline.engines) for pipeline in PIPELINES.values()))
 )
+FANOUT_ENGINES = [("google", "Google Search"), ("duckduckgo", "DuckDuckGo"), ("baidu", "Baidu Search")]
+
+# Latency and estimated cost of the routed pipelines per query class
+class_stats = ClassStats()
+
+class ResearchSession:
+    """
+    Per-request agent context. Each request builds its own agents with the
+    query baked into the system message, so one process can serve many
+    concurrent queries without them sharing mutable agent state. The query
+    is classified once; its class picks the pipeline (engines, crawling,
+    model) and is handed to every later stage.
+    """
+
+    def __init__(self, query, query_class=None):
+        self.query = query
+        self.query_class = query_class or classify(query)
+        self.pipeline = route(self.query_class)
+        self.search_agents = create_search_agents(self.query_class, self.pipeline)
+        self.reuse = None
+        self.prompt_tokens = 0
+        # Coordinator or synthesis agent of the run, read for its token metrics
+        self.agent = None
+        self.engine_results = []
+
+    def run(self, stream=False):
+        if stream:
+            return self._run_stream()
+        started = time.monotonic()
+        with crawl_budget(self.query):
+            response = self._run(stream=False)
+        self._finish(started, chunk_content(response))
+        return response
 
-# Override the run method to inject the actual query into the system message
-original_run = agent_team.run
-def enhanced_run(message, **kwargs):
-    agent_team.system_message = system_message_template.format(user_query=message)
-    return original_run(message, **kwargs)
-agent_team.run = enhanced_run
+    def _run_stream(self):
+        """Yield text deltas and tool_call events, then one metrics event"""
+        started = time.monotonic()
+        deltas = []
+        # The crawl budget has to stay attached while the stream is consumed
+        with crawl_budget(self.query):
+            # The fan-out runs here; its engines' tool calls go out before the answer
+            chunks = self._run(stream=True)
+            for tool in self._engine_tool_calls():
+                yield tool
+            for item in agent_events(chunks):
+                if isinstance(item, str):
+                    deltas.append(item)
+                yield item
+        self._finish(started, "".join(deltas))
+        yield {"metrics": self.metrics(started)}
+
+    def _engine_tool_calls(self):
+        for result in self.engine_results:
+            for tool in result.tools:
+                yield tool_call_event(tool, result.name)
+
+    def metrics(self, started):
+        """Timing, routing and token usage of the finished run"""
+        usage = getattr(getattr(self.agent, "run_response", None), "metrics", None) or {}
+
+        def total(*names):
+            for name in names:
+                value = usage.get(name)
+                if value:
+                    return sum(value) if isinstance(value, list) else value
+            return 0
+
+        return {
+            "seconds": round(time.monotonic() - started, 3),
+            "queryClass": self.query_class.kind,
+            "pipeline": self.pipeline.name,
+            "engines": [result.name for result in self.engine_results],
+            "promptTokens": total("input_tokens", "prompt_tokens"),
+            "completionTokens": total("output_tokens", "completion_tokens"),
+            "outcome": self.reuse.outcome if self.reuse else "miss",
+        }
+
+    def _run(self, stream):
+        # Saved research on the same query or its entities, looked up before any search
+        with span("reuse") as current:
+            self.reuse = answer_reuse.lookup(self.query) if answer_reuse else None
+            current.set(outcome=self.reuse.outcome if self.reuse else "miss")
+        if self.reuse and self.reuse.answer is not None:
+            response = RunResponse(content=self.reuse.answer)
+            return iter([response]) if stream else response
+        known = self.reuse.evidence if self.reuse else None
+        if PROMPT_BUILDER:
+            report = prompt_report(prompt_builder, self.query, self.query_class, len(self.search_agents),
+                                   SEARCH_FANOUT, known)
+            prompt_stats.record(report)
+            self.prompt_tokens = report["after"]
+
+        if not SEARCH_FANOUT:
+            self.agent = create_agent_team(self.query, self.search_agents, self.query_class, self.pipeline)
+            return self.agent.run(self.query, self.query_class, stream=stream, known=known)
+
+        engines = [(name, label, self.search_agents[name]) for name, label in FANOUT_ENGINES
+                   if name in self.search_agents]
+        search_query = f"{self.query}\n\n{self.reuse.search_hint()}" if self.reuse else self.query
+        with span("fanout", engines=len(engines)) as current:
+            self.engine_results = fanout_executor.gather(engines, search_query)
+            evidence = merge_evidence(self.engine_results)
+            current.set(bytes=len(evidence.encode("utf-8")))
+        if known:
+            evidence = f"{known}\n\n{evidence}"
+        self.agent = create_synthesis_agent(self.query, self.query_class, self.pipeline)
+        return self.agent.run(self.query, self.query_class, stream=stream, evidence=evidence)
+
+    def _finish(self, started, text):
+        elapsed = time.monotonic() - started
+        outcome = self.reuse.outcome if self.reuse else "miss"
+        if answer_reuse:
+            answer_reuse.record(outcome, elapsed)
+        # Cost is estimated from prompt and output tokens and the engines searched
+        engine_calls = 0 if outcome == "answer" else len(self.search_agents)
+        class_stats.record(self.query_class.kind, self.pipeline, elapsed, self.prompt_tokens,
+                           count_tokens(text), engine_calls)
+        # A reused answer was not researched again, so it must not refresh stored facts
+        if outcome != "answer":
+            try:
+                with span("entities"):
+                    entity_store.ingest(text)
+            except Exception as e:
+                print(f"Error storing entity facts: {e}")
+            if answer_reuse:
+                answer_reuse.remember(self.query, text)
+
+def run_research(query, stream=False, query_class=None):
+    """Run the research pipeline for a query in its own session"""
+    return ResearchSession(query, query_class).run(stream=stream)
 
 # Stream handler class for EventSource responses
 class EventStreamHandler:
@@ -696,10 +351,10 @@ class EventStreamHandler:
 
     def handle_chunk(self, chunk):
         """Process a chunk from the agent"""
-        if isinstance(chunk, dict) and "type" in chunk and chunk["type"] == "tool_call":
+        if isinstance(chunk, dict) and "tool_call" in chunk:
             # Handle tool call (we might skip or store it)
-            self.tool_calls.append(chunk)
-            return json.dumps({"tool_call": chunk}) + "\n\n"
+            self.tool_calls.append(chunk["tool_call"])
+            return json.dumps(chunk) + "\n\n"
         else:
             # Handle text chunk
             self.chunks.append(chunk)
@@ -709,18 +364,15 @@ class EventStreamHandler:
         """Generate an event stream for the given message"""
         def stream_generator():
             try:
-                # Run the agent with a streaming callback
-                agent_team.run(
-                    message, 
-                    stream_handler=lambda chunk: self._process_chunk(chunk, response_handler)
-                )
+                # Run the agent and pass each streamed chunk to the handler
+                for chunk in ResearchSession(message).run(stream=True):
+                    self._process_chunk(chunk, response_handler)
                 
                 # Signal the end of the stream
-                yield "data: " + json.dumps({"done": True}) + "\n\n"
+                yield sse_event({"done": True})
             
             except Exception as e:
-                error_data = json.dumps({"error": str(e)})
-                yield "data: " + error_data + "\n\n"
+                yield sse_event({"error": str(e)})
         
         if response_handler:
             for chunk in stream_generator():
@@ -733,14 +385,15 @@ class EventStreamHandler:
         """Process a chunk and either yield it or pass it to a response_handler"""
         event_data = ""
         
-        if isinstance(chunk, dict) and "type" in chunk and chunk["type"] == "tool_call":
-            # It's a tool call
-            self.tool_calls.append(chunk)
-            event_data = "data: " + json.dumps({"tool_call": chunk}) + "\n\n"
+        if isinstance(chunk, dict):
+            # A tool call or metrics event
+            if "tool_call" in chunk:
+                self.tool_calls.append(chunk["tool_call"])
+            event_data = sse_event(chunk)
         else:
             # It's a text chunk
             self.chunks.append(chunk)
-            event_data = "data: " + json.dumps({"chunk": chunk}) + "\n\n"
+            event_data = sse_event({"chunk": chunk})
         
         if response_handler:
             response_handler(event_data)
@@ -748,7 +401,6 @@ class EventStreamHandler:
             if event_data:
                 return event_data
         
-        print("Processed Chunk:", chunk)
         return chunk
 
 # @app.route('/')
@@ -756,147 +408,283 @@ class EventStreamHandler:
 #     return render_template('index.html')
 
 
+# Opt-in sampling profiler capturing flamegraph stacks for the next N requests
+# (PROFILING_ENABLED=1 for the /api/profile endpoints, PROFILE_REQUESTS=N at startup)
+profiler = SamplingProfiler()
+if PROFILE_REQUESTS:
+    profiler.arm(PROFILE_REQUESTS)
+
+# Bounds the agent runs in flight, globally and per user, with a limit that
+# adapts to upstream latency and errors
+admission = AdmissionController()
+
+# Concurrent identical queries share one agent run (keyed on the normalised query)
+query_flights = SingleFlight("query")
+stream_flights = SingleFlight("stream")
+# Recent stream logs, so a reconnecting EventSource resumes after its last event
+stream_replays = ReplayRegistry()
+
+
+def answer_query(query, user_id=None, cached_only=False):
+    """
+    Answer a query for /api/query.
+    Returns the response text and whether it was served from the cache.
+    With cached_only, a query that is not cached is not run: (None, False).
+    Raises Overloaded when admission control sheds the run.
+    """
+    # Serve repeated queries from the response cache
+    cached = query_cache.get(query, "query") if query_cache else None
+    if cached is not None:
+        return cached, True
+    if cached_only:
+        return None, False
+
+    # Classified once; admission, the session and post-processing share it
+    query_class = classify(query)
+    return query_flights.do(normalize_query(query), lambda: _run_query(query, query_class, user_id)), False
+
+
+def _run_query(query, query_class, user_id=None):
+    # Run agent in non-stream mode
+    with admission.admit(user_id, pipeline_key(query_class)):
+        response = run_research(query, stream=False, query_class=query_class)
+    # Cells the agent could not fill are completed from fresh stored facts
+    with span("fill"):
+        final_content = TableFiller(entity_store).fill(chunk_content(response).strip())
+
+    if query_cache:
+        query_cache.set(query, final_content, "query")
+
+    return final_content
+
+
+def pipeline_key(query_class):
+    """Runs of the same pipeline have comparable cost; admission compares their latency"""
+    return route(query_class).name
+
+
+def stream_query_events(query, user_id=None):
+    """
+    Event payloads for /api/stream. By default agent output is forwarded as
+    chunk events paragraph by paragraph while the agent is still running.
+    STREAM_MODE=buffered restores the old collect-then-reformat behaviour.
+    Subscribers of an identical query already in flight receive that run's
+    events from the start instead of starting another run.
+    """
+    yield from open_query_stream(query, user_id).follow()
+
+
+def open_query_stream(query, user_id=None):
+    """Event log answering query: a cached answer, the identical run in flight or a new run"""
+    # Cached answers are replayed instantly as a single chunk
+    cached = query_cache.get(query, "stream") if query_cache else None
+    if cached is not None:
+        log = EventLog()
+        log.append({"chunk": cached})
+        log.append({"done": True})
+        log.close()
+        return log
+
+    return stream_flights.log(normalize_query(query), lambda: _run_stream(query, user_id), STREAM_REPLAY_MAX_EVENTS)
+
+
+def open_resumable_stream(query, last_event_id=None, user_id=None):
+    """
+    (stream id, event log, first index, reset) for /api/stream without
+    blocking on the run. A reconnecting client sends the id of the last
+    event it received and continues right after it; when that stream is gone
+    it gets a reset event (reset=True) and the answer from the start.
+    """
+    resumed = stream_replays.resume(last_event_id) if last_event_id else None
+    if resumed is not None:
+        stream_id, log, start = resumed
+        return stream_id, log, start, False
+    log = open_query_stream(query, user_id)
+    return stream_replays.add(log), log, 0, bool(last_event_id)
+
+
+def resumable_stream_events(query, last_event_id=None, user_id=None):
+    """(event id, payload) pairs for /api/stream, following the run until it finishes"""
+    stream_id, log, start, reset = open_resumable_stream(query, last_event_id, user_id)
+    if reset:
+        # The client has to drop what it already shows
+        yield None, {"reset": True}
+    try:
+        for index, event in log.entries(start):
+            yield f"{stream_id}-{index}", event
+    except StreamOverrun:
+        # This reader fell behind the capped log. Ending the response makes the
+        # browser reconnect with its last event id, which gets a reset and the
+        # full answer, instead of continuing with a gap in the text.
+        return
+
+
+def _run_stream(query, user_id=None):
+    # Runs on the stream's producer thread, so the trace covers the whole run
+    with request_trace() as trace:
+        # Classified once; admission, the session and the column check share it
+        query_class = classify(query)
+        try:
+            with admission.admit(user_id, pipeline_key(query_class)) as ticket:
+                for event in _traced_stream(query, query_class, trace):
+                    if "error" in event:
+                        # Errors are sent as events, so the run has to be marked failed here
+                        ticket.failed = True
+                    yield event
+        except Overloaded as e:
+            yield {"error": str(e), "retryAfter": e.retry_after}
+
+
+def _traced_stream(query, query_class, trace):
+    try:
+        # Text deltas interleaved with tool_call and metrics events
+        deltas = run_research(query, stream=True, query_class=query_class)
+        # Tables are parsed as the chunks go out, so the column check at the
+        # end does not have to parse the whole answer again
+        tables = TableParser()
+        # Cells the agent could not fill are completed from fresh stored facts
+        filler = TableFiller(entity_store)
+
+        streamed = []
+
+        def finalize(text):
+            if not streamed:
+                # The buffered mode finalizes before any chunk has reached the
+                # parser, so the text has to be parsed here
+                return education_column_note(text, query_class)
+            tables.flush()
+            return education_column_note(text, query_class, tables.tables)
+
+        if STREAM_MODE == "buffered":
+            events = stream_buffered(deltas, reformat, finalize)
+        else:
+            events = stream_incremental(deltas, finalize)
+
+        for event in events:
+            if "chunk" in event:
+                event["chunk"] = filler.fill(event["chunk"])
+                streamed.append(event["chunk"])
+                tables.feed(event["chunk"])
+            elif event.get("done"):
+                if query_cache:
+                    query_cache.set(query, "".join(streamed), "stream")
+                if trace is not None:
+                    yield {"trace": trace.to_dict()}
+            yield event
+
+    except Exception as e:
+        yield {"error": str(e)}
+
+
 @app.route('/api/query', methods=['POST'])
 def process_query():
     """
     Non-streaming endpoint that:
       1) Runs the agent (no streaming).
-      2) Extracts only the substring inside content='...'
-      3) Returns that clean substring as JSON to the frontend.
+      2) Extracts the post-processed response content.
+      3) Returns that content as JSON to the frontend.
     """
     data = request.json
-    query = data.get('query', '')
-    if not query:
-        return jsonify({'error': 'No query provided'}), 400
+    payload, status, headers = query_response(data.get('query', ''), data.get('userId'))
+    return jsonify(payload), status, headers
 
-    try:
-        # Run agent in non-stream mode
-        response = agent_team.run(query, stream=False)
-
-        # Convert to string if needed
-        text_response = response if isinstance(response, str) else str(response)
-
-        # Find all matches in case there's more than one
-        matches = re.findall(r"content='([^']*)'", text_response)
-        if matches:
-            # Join or pick the last one, depending on your preference
-            # For example, just take the last match:
-            final_content = matches[-1].strip()
-        else:
-            final_content = ""
 
-        return jsonify({"success": True, "response": final_content})
+def query_response(query, user_id=None, cached_only=False):
+    """
+    Payload, status and headers of /api/query, shared by the Flask and ASGI
+    servers. With cached_only, returns None instead of running a query that
+    is not cached, so a caller can answer cache hits without waiting behind
+    agent runs.
+    """
+    if not query:
+        return {'error': 'No query provided'}, 400, {}
+    if cached_only and (query_cache is None or query_cache.get(query, "query") is None):
+        return None
 
+    try:
+        with profiler.request(), request_trace() as trace:
+            with span("request", endpoint="query"):
+                final_content, cached = answer_query(query, user_id, cached_only)
+        if final_content is None:
+            return None  # expired since the check above
+        payload = {"success": True, "response": final_content}
+        if cached:
+            payload["cached"] = True
+        if trace is not None:
+            # Debug mode (TRACE_DEBUG=1): where the time of this request went
+            payload["trace"] = trace.to_dict()
+        return payload, 200, {}
+
+    except Overloaded as e:
+        return {"error": str(e)}, 503, {"Retry-After": str(e.retry_after)}
     except Exception as e:
-        return jsonify({"error": str(e)}), 500
-
+        return {"error": str(e)}, 500, {}
 
 
 @app.route('/api/stream', methods=['GET', 'POST'])
 def stream_response():
     if request.method == 'GET':
         query = request.args.get('query', '')
+        user_id = request.args.get('userId')
     else:  # POST
         data = request.json
         query = data.get('query', '')
+        user_id = data.get('userId')
 
     if not query:
         return jsonify({'error': 'No query provided'}), 400
 
-    # Import Google Generative AI
-    from google import genai
+    events = profiler.wrap_stream(resumable_stream_events(query, request.headers.get('Last-Event-ID'), user_id))
+    return Response((sse_event(event, event_id) for event_id, event in events), mimetype='text/event-stream')
 
-    # Initialize the Generative AI client
-    client = genai.Client(api_key=GOOGLE_API_KEY)
 
-    def generate():
-        try:
-            # Accumulate all chunks first
-            total_chunks = []
-
-            # Run the agent in streaming mode
-            for chunk in agent_team.run(query, stream=True):
-                # Convert chunk to string, handling different possible types
-                text_chunk = chunk if isinstance(chunk, str) else str(chunk)
-
-                # REGEX to extract content from tool call or response
-                match = re.search(r"content='([^']*)'", text_chunk)
-                if match:
-                    # Extract the content
-                    content_chunk = match.group(1).strip()
-                    
-                    # Add meaningful chunks to total_chunks
-                    if content_chunk:
-                        total_chunks.append(content_chunk)
-
-            # Combine all chunks
-            all_chunks = " ".join(total_chunks)
-            
-            # Use Google Generative AI to format and process the chunks
-            response = client.models.generate_content(
-                model="gemini-2.0-flash",
-                contents='''Reformat this text to have:
-                - Clear line breaks between sections
-                - Proper word spacing
-                - Readable paragraph structure
-                - No unnecessary concatenation of words
-                - Use markdown formatting where appropriate
-                
-                
-                Text to format: ''' + all_chunks
-            )
-            
-            # Final processed data
-            final_data = response.text
-            
-            # Validate education query responses
-            education_keywords = ["school", "college", "university", "institute", "campus", 
-                                "education", "academic", "student", "faculty", "course"]
-            is_education_query = any(keyword.lower() in query.lower() for keyword in education_keywords)
-            
-            if is_education_query:
-                required_columns = [
-                    "Institution Name", "Established Year", "Location", "Type", 
-                    "Total Student Enrollment", "Annual Tuition Fees", "Top Programs Offered",
-                    "Accreditation Status", "Average Campus Placement Rate", 
-                    "Recent Notable Achievements", "Campus Facilities"
-                ]
-                
-                missing_columns = []
-                for col in required_columns:
-                    if col not in final_data:
-                        missing_columns.append(col)
-                
-                if missing_columns:
-                    correction_note = "\n\n**NOTE: The table is missing these required columns: " + ", ".join(missing_columns) + ". Please request more detailed information if needed.**"
-                    final_data += correction_note
-            
-            # Send the final processed data
-            processed_chunk = json.dumps({"chunk": final_data})
-            yield "data: " + processed_chunk + "\n\n"
+MONGODB_URI = os.environ.get('MONGODB_URI')
+if not MONGODB_URI:
+    raise Exception("MONGODB_URI not set in environment variables")
 
-            # Signal end of stream
-            done_data = json.dumps({"done": True})
-            yield "data: " + done_data + "\n\n"
+# Connect to MongoDB (one pooled client shared by all requests and threads)
+client = create_mongo_client(MONGODB_URI)
+db = client['AI-Search-Assistant']  # replace with your database name
+users_collection = db['users']
+search_collection = db['search_results']
+ensure_indexes(search_collection)
 
-        except Exception as e:
-            error_data = json.dumps({"error": str(e)})
-            yield "data: " + error_data + "\n\n"
+# Profiles copied onto saved results, kept current by the user routes below
+user_profiles = UserProfileCache(users_collection)
 
-    return Response(generate(), mimetype='text/event-stream')
+# Saved bodies are compressed and stored once per content hash; search
+# results only reference them
+response_bodies = BodyStore(db['response_bodies'])
 
+# Saved results are inserted in batches off the request path
+search_writes = WriteBehindBuffer(search_collection, prepare=response_bodies.externalize,
+                                  discard=response_bodies.release_refs)
+atexit.register(search_writes.flush)
 
-from pymongo import MongoClient
+# Full-text index of each user's saved responses, updated on save and delete
+search_index = SearchIndex(
+    search_collection,
+    bodies=response_bodies,
+    pending=lambda user_id: search_writes.pending(lambda doc: doc.get("userId") == user_id)
+)
 
+# New queries are answered from, or given as context, recent answers of the
+# pipeline for the same query or entities (REUSE_ENABLED=0 turns this off).
+# Only answers the server produced are kept there, never user-saved content.
+answer_reuse = None
+if os.getenv("REUSE_ENABLED", "1") == "1":
+    answer_reuse = AnswerReuse(db['research_answers'], crawl_cache=crawl_cache, entities=entity_store)
+    answer_reuse.ensure_indexes()
 
-MONGODB_URI = os.environ.get('MONGODB_URI')
-if not MONGODB_URI:
-    raise Exception("MONGODB_URI not set in environment variables")
 
-# Connect to MongoDB
-client = MongoClient(MONGODB_URI)
-db = client['AI-Search-Assistant']  # replace with your database name
-users_collection = db['users']
+def save_search_results(docs):
+    """Queue saved results for writing and add them to their users' search indexes"""
+    indexed = [(doc.get("userId"), doc.get("searchQuery"), doc.get("content"), doc.get("timestamp")) for doc in docs]
+    document_ids = search_writes.add_many(docs)
+    for document_id, (user_id, search_query, content, timestamp) in zip(document_ids, indexed):
+        if user_id:
+            search_index.add(user_id, document_id, search_query, content, timestamp)
+    return document_ids
 
 @app.route('/webhook', methods=['POST'])
 def clerk_webhook():
@@ -923,6 +711,7 @@ def clerk_webhook():
             if event_type == "user.deleted":
                 # Remove user from database if deleted
                 users_collection.delete_one({"clerkId": clerk_id})
+                user_profiles.delete(clerk_id)
                 return jsonify({"message": "User deleted"}), 200
 
             # Insert or update the user in MongoDB
@@ -936,6 +725,7 @@ def clerk_webhook():
                 }},
                 upsert=True
             )
+            user_profiles.put(clerk_id, {"name": full_name, "email": email})
             return jsonify({"message": "User processed"}), 200
         else:
             return jsonify({"message": "Event type not handled"}), 200
@@ -964,6 +754,7 @@ def manual_user_sync():
             }},
             upsert=True
         )
+        user_profiles.put(clerk_id, {"name": data.get('name'), "email": data.get('email')})
         
         return jsonify({"message": "User synced successfully"}), 200
     
@@ -972,11 +763,182 @@ def manual_user_sync():
         return jsonify({"message": "Internal server error", "error": str(e)}), 500
     
 
-MONGODB_URI = os.environ.get('MONGODB_URI')
-client = MongoClient(MONGODB_URI)
-db = client['AI-Search-Assistant']
-search_collection = db['search_results']
-users_collection = db['users']
+# Response cache in front of the agent pipeline (QUERY_CACHE_BACKEND is one of
+# memory, sqlite, mongo or off)
+query_cache = build_query_cache(
+    os.getenv("QUERY_CACHE_BACKEND", "memory"),
+    ttl=int(os.getenv("QUERY_CACHE_TTL", "21600")),
+    max_entries=int(os.getenv("QUERY_CACHE_MAX_ENTRIES", "500")),
+    db_file="agents.db",
+    mongo_db=db,
+)
+
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    stats = {
+        "crawl": crawl_cache.stats(),
+        "coalescing": {"query": query_flights.stats(), "stream": stream_flights.stats()},
+        "streamReplay": stream_replays.stats(),
+        "admission": admission.stats(),
+        "userProfiles": user_profiles.stats(),
+        "writeBehind": search_writes.stats(),
+        "bodies": response_bodies.stats(),
+        "searchIndex": search_index.stats(),
+        "reuse": answer_reuse.stats() if answer_reuse else {"enabled": False},
+        "entities": entity_store.stats(),
+        "prompts": prompt_stats.stats() if PROMPT_BUILDER else {"enabled": False},
+        "queryClasses": class_stats.stats(),
+        "toolCassette": tool_cassette.stats() if tool_cassette.enabled else {"enabled": False}
+    }
+    if not query_cache:
+        return jsonify({"enabled": False, **stats}), 200
+    return jsonify({"enabled": True, **query_cache.stats(), **stats}), 200
+
+
+def metrics_collectors():
+    """Cache and queue gauges read when /metrics is scraped"""
+    crawl = crawl_cache.stats()
+    replays = stream_replays.stats()
+    admitted = admission.stats()
+    samples = [
+        ("crawl_cache_hits_total", "counter", "Crawl cache hits", crawl["hits"], {}),
+        ("crawl_cache_misses_total", "counter", "Crawl cache misses", crawl["misses"], {}),
+        ("crawl_bytes_fetched_total", "counter", "Bytes fetched by crawls", crawl["bytesFetched"], {}),
+        ("write_behind_pending", "gauge", "Saved results waiting to be written", search_writes.stats()["pending"], {}),
+        ("stream_replay_streams", "gauge", "Streams buffered for resuming", replays["streams"], {}),
+        ("stream_resumes_total", "counter", "Reconnects by outcome", replays["resumed"], {"result": "resumed"}),
+        ("stream_resumes_total", "counter", "Reconnects by outcome", replays["misses"], {"result": "reset"}),
+        ("admission_limit", "gauge", "Adaptive limit of agent runs in flight", admitted["limit"], {}),
+        ("admission_in_flight", "gauge", "Agent runs in flight", admitted["inFlight"], {}),
+        ("admission_queue_depth", "gauge", "Agent runs waiting for a slot", admitted["queued"], {}),
+        ("admission_backoffs_total", "counter", "Cuts of the adaptive limit", admitted["backoffs"], {}),
+    ]
+    if query_cache:
+        cache = query_cache.stats()
+        samples += [
+            ("query_cache_hits_total", "counter", "Response cache hits", cache["hits"], {}),
+            ("query_cache_misses_total", "counter", "Response cache misses", cache["misses"], {}),
+        ]
+    return samples
+
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Stage latencies, token counts, bytes crawled and cache hits in the Prometheus text format"""
+    return Response(metrics.render([metrics_collectors]), mimetype="text/plain; version=0.0.4")
+
+
+@app.route('/api/profile/start', methods=['POST'])
+def start_profile():
+    """Profile the next N requests (body: {"requests": N})"""
+    if not PROFILING_ENABLED:
+        return jsonify({"error": "Profiling is disabled"}), 404
+    data = request.json or {}
+    try:
+        requests = int(data.get('requests', 10))
+    except (TypeError, ValueError):
+        return jsonify({"error": "requests must be a number"}), 400
+    profiler.arm(requests)
+    return jsonify(profiler.status()), 200
+
+
+@app.route('/api/profile', methods=['GET'])
+def get_profile():
+    """Collapsed stacks of the profiled requests (flamegraph.pl / speedscope input)"""
+    if not PROFILING_ENABLED:
+        return jsonify({"error": "Profiling is disabled"}), 404
+    if request.args.get('format') == 'status':
+        return jsonify(profiler.status()), 200
+    return Response(profiler.collapsed(), mimetype="text/plain")
+
+
+def persist_job(job):
+    """Store a finished job's result alongside the saved search results"""
+    records = extract_records(parse_tables(job.result))
+    save_search_results([{
+        "jobId": job.id,
+        "userId": job.user_id,
+        "content": job.result,
+        "records": records,
+        "searchQuery": job.query,
+        "timestamp": job.finished_at,
+        **summary_fields(job.result),
+    }])
+
+# Background research jobs that outlive the HTTP request that started them
+job_manager = JobManager(stream_query_events, persist=persist_job)
+
+@app.route('/api/jobs', methods=['POST'])
+def submit_job():
+    data = request.get_json() or {}
+    query = data.get('query', '')
+    if not query:
+        return jsonify({'error': 'No query provided'}), 400
+
+    try:
+        priority = int(data.get('priority', 0))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid priority'}), 400
+
+    job, created = job_manager.submit(query, user_id=data.get('userId'), priority=priority)
+    return jsonify({"jobId": job.id, "status": job.status, "deduplicated": not created}), 202
+
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = job_manager.get(job_id)
+    if job:
+        return jsonify(job.to_dict()), 200
+
+    # Jobs evicted from memory can still be read back from MongoDB
+    try:
+        stored = search_collection.find_one({"jobId": job_id}, {"_id": 0, "content": 1, "contentRef": 1, "searchQuery": 1, "timestamp": 1})
+        response_bodies.inline([stored])
+    except Exception as e:
+        print(f"Error fetching job {job_id}: {e}")
+        return jsonify({"error": "Internal server error"}), 500
+    if not stored:
+        return jsonify({"error": "Job not found"}), 404
+
+    return jsonify({
+        "jobId": job_id,
+        "query": stored["searchQuery"],
+        "status": "done",
+        "finishedAt": stored["timestamp"].isoformat(),
+        "result": stored["content"]
+    }), 200
+
+
+@app.route('/api/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """Replay a job's events so far and follow it until it finishes"""
+    job = job_manager.get(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+
+    start = request.args.get('from', 0, type=int)
+    return Response((sse_event(event) for event in job.log.follow(start)), mimetype='text/event-stream')
+
+# Upper bound on results saved by one /api/pushData/bulk call
+PUSH_BULK_MAX_ITEMS = int(os.getenv("PUSH_BULK_MAX_ITEMS", "100"))
+
+
+def build_search_result(user_id, user, content, search_query):
+    """The document stored for one saved search result"""
+    # Institution/company tables as typed records, so fields can be queried without re-parsing content
+    records = extract_records(parse_tables(content))
+    return {
+        "userId": user_id,
+        "username": user.get('name') or 'Unknown User',
+        "email": user.get('email') or 'No email',
+        "content": content,
+        "records": records,
+        "searchQuery": search_query,  # Inserting the original search query
+        "timestamp": datetime.utcnow(),
+        # Size and preview for the history listing, which does not load content
+        **summary_fields(content),
+    }
+
 
 @app.route('/api/pushData', methods=['POST'])
 def push_search_data():
@@ -988,33 +950,57 @@ def push_search_data():
         if not data or 'content' not in data or 'userId' not in data or 'searchQuery' not in data:
             return jsonify({"error": "Missing required fields"}), 400
         
-        # Find the user in the database to get additional details
-        user = users_collection.find_one({"clerkId": data['userId']})
+        # User details come from the profile cache, not a per-request lookup
+        user = user_profiles.get(data['userId'])
         if not user:
             return jsonify({"error": "User not found"}), 404
         
-        # Prepare the search result document with the searchQuery field included
-        search_result = {
-            "userId": data['userId'],
-            "username": user.get('name', 'Unknown User'),
-            "email": user.get('email', 'No email'),
-            "content": data['content'],
-            "searchQuery": data['searchQuery'],  # Inserting the original search query
-            "timestamp": datetime.utcnow()
-        }
+        search_result = build_search_result(data['userId'], user, data['content'], data['searchQuery'])
         
-        # Insert the search result into MongoDB
-        result = search_collection.insert_one(search_result)
+        # Queued for a batched insert; the id is assigned up front
+        document_id = save_search_results([search_result])[0]
         
         return jsonify({
             "message": "Search data stored successfully",
-            "documentId": str(result.inserted_id)
+            "documentId": str(document_id)
         }), 201
     
     except Exception as e:
         print(f"Error storing search data: {e}")
         return jsonify({"error": "Internal server error"}), 500
 
+
+@app.route('/api/pushData/bulk', methods=['POST'])
+def push_search_data_bulk():
+    """Save several results of one user: {"userId": ..., "items": [{"content", "searchQuery"}, ...]}"""
+    try:
+        data = request.json
+        items = data.get('items') if data else None
+        if not data or 'userId' not in data or not isinstance(items, list) or not items:
+            return jsonify({"error": "Missing required fields"}), 400
+        if len(items) > PUSH_BULK_MAX_ITEMS:
+            return jsonify({"error": f"At most {PUSH_BULK_MAX_ITEMS} items per request"}), 400
+        if any(not isinstance(item, dict) or 'content' not in item or 'searchQuery' not in item for item in items):
+            return jsonify({"error": "Every item needs content and searchQuery"}), 400
+
+        user = user_profiles.get(data['userId'])
+        if not user:
+            return jsonify({"error": "User not found"}), 404
+
+        document_ids = save_search_results([
+            build_search_result(data['userId'], user, item['content'], item['searchQuery'])
+            for item in items
+        ])
+
+        return jsonify({
+            "message": "Search data stored successfully",
+            "documentIds": [str(document_id) for document_id in document_ids]
+        }), 201
+
+    except Exception as e:
+        print(f"Error storing search data: {e}")
+        return jsonify({"error": "Internal server error"}), 500
+
     
 @app.route('/api/get-stored-responses', methods=['POST'])
 def get_stored_responses():
@@ -1025,28 +1011,75 @@ def get_stored_responses():
         if not user_id:
             return jsonify({"error": "No user ID provided"}), 400
         
-        # Fetch stored responses for this user, sorted by timestamp (desc), limit 50
-        stored_responses = list(
-            search_collection.find(
-                {"userId": user_id},
-                {"_id": 1, "content": 1, "timestamp": 1, "searchQuery": 1}
+        # One page of this user's responses, newest first, without the content
+        try:
+            stored_responses, next_cursor = list_responses(
+                search_collection, user_id,
+                limit=data.get('limit', HISTORY_PAGE_SIZE),
+                cursor=data.get('cursor'),
+                bodies=response_bodies,
+                pending=search_writes.pending
             )
-            .sort("timestamp", -1)
-            .limit(50)
-        )
-        
-        # Convert timestamp to ISO format and _id to string
-        for resp in stored_responses:
-            resp['timestamp'] = resp['timestamp'].isoformat()
-            resp['_id'] = str(resp['_id'])  # Convert ObjectId to string
-        
-        return jsonify({"responses": stored_responses}), 200
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        return jsonify({"responses": stored_responses, "nextCursor": next_cursor}), 200
     
     except Exception as e:
         print(f"Error fetching stored responses: {e}")
         return jsonify({"error": "Internal server error"}), 500
 
 
+@app.route('/api/get-stored-response', methods=['POST'])
+def get_stored_response():
+    """Full content of one saved response, loaded when it is opened"""
+    try:
+        data = request.get_json()
+        user_id = data.get('userId')
+        response_id = data.get('responseId')
+
+        if not user_id or not response_id:
+            return jsonify({"error": "Missing required fields"}), 400
+
+        try:
+            stored_response = get_response(search_collection, user_id, response_id, bodies=response_bodies,
+                                           pending=search_writes.pending)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+        if stored_response is None:
+            return jsonify({"error": "Response not found"}), 404
+        return jsonify({"response": stored_response}), 200
+
+    except Exception as e:
+        print(f"Error fetching stored response: {e}")
+        return jsonify({"error": "Internal server error"}), 500
+
+
+
+@app.route('/api/search-responses', methods=['POST'])
+def search_responses():
+    """Full-text search over a user's saved responses, best match first"""
+    try:
+        data = request.get_json()
+        user_id = data.get('userId') if data else None
+        query = (data.get('query') or '').strip() if data else ''
+
+        if not user_id or not query:
+            return jsonify({"error": "Missing required fields"}), 400
+
+        try:
+            limit = max(1, min(int(data.get('limit', HISTORY_PAGE_SIZE)), 100))
+        except (TypeError, ValueError):
+            return jsonify({"error": "Invalid limit"}), 400
+
+        results = search_index.search(user_id, query, limit)
+        return jsonify({"responses": [serialize(doc) for doc in results]}), 200
+
+    except Exception as e:
+        print(f"Error searching stored responses: {e}")
+        return jsonify({"error": "Internal server error"}), 500
+
 
 @app.route('/api/delete-response', methods=['DELETE'])
 def delete_response():
@@ -1069,8 +1102,17 @@ def delete_response():
             print(f"Invalid ObjectId format: {response_id}, error: {e}")
             return jsonify({"error": f"Invalid ID format: {response_id}"}), 400
 
-        result = search_collection.delete_one({'_id': object_id})
-        if result.deleted_count == 1:
+        # A result still waiting in the write-behind buffer is withdrawn before it is written
+        withdrawn = search_writes.remove(lambda doc: doc["_id"] == object_id)
+        if withdrawn:
+            search_index.remove(withdrawn[0].get('userId'), response_id)
+            return jsonify({"message": "Response deleted successfully"}), 200
+
+        deleted = search_collection.find_one_and_delete({'_id': object_id}, {'contentRef': 1, 'userId': 1})
+        if deleted:
+            search_index.remove(deleted.get('userId'), response_id)
+            # The shared body goes away with its last reference
+            response_bodies.release(deleted.get('contentRef'))
             return jsonify({"message": "Response deleted successfully"}), 200
         else:
             return jsonify({"error": "Response not found"}), 404
@@ -0,0 +1,209 @@
+"""
+Async serving mode.
+
+/api/query and /api/stream are served natively on the event loop with the
+same JSON/SSE contracts as the Flask routes (both go through the same
+backend functions). An open connection costs a coroutine, not a thread:
+agent runs execute in bounded thread pools and write their events to a
+log, and every stream (including coalesced followers and Last-Event-ID
+resumes) is woken by the log instead of blocking a thread on it, so idle
+SSE clients waiting on Groq, Gemini, search engines or crawls do not pin
+worker threads. Cache hits and stream lookups run on a small pool of their
+own, so they are answered right away even when every run worker is busy.
+Every other route is forwarded to the Flask app.
+
+Run from the backend directory:
+    uvicorn asgi:application --host 0.0.0.0 --port 5000
+"""
+import asyncio
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+from uvicorn.middleware.wsgi import WSGIMiddleware
+
+import app as backend
+from streaming import StreamOverrun, sse_event
+
+# Agent runs executing at the same time, for /api/query and for streams;
+# further runs wait on the loop (queries) or in the pool's queue (streams)
+ASGI_MAX_RUNS = int(os.getenv("ASGI_MAX_RUNS", "32"))
+ASGI_MAX_STREAM_RUNS = int(os.getenv("ASGI_MAX_STREAM_RUNS", "32"))
+# Threads for cache and replay lookups, which never wait on a run
+ASGI_LOOKUP_WORKERS = int(os.getenv("ASGI_LOOKUP_WORKERS", "4"))
+
+_lookups = ThreadPoolExecutor(max_workers=ASGI_LOOKUP_WORKERS, thread_name_prefix="lookup")
+_query_runs = ThreadPoolExecutor(max_workers=ASGI_MAX_RUNS, thread_name_prefix="query-run")
+_stream_runs = ThreadPoolExecutor(max_workers=ASGI_MAX_STREAM_RUNS, thread_name_prefix="stream-run")
+# Streamed runs are produced in their own pool rather than a thread each
+backend.stream_flights.executor = _stream_runs
+_flask = WSGIMiddleware(backend.app)
+
+
+def _cors_headers(scope):
+    headers = dict(scope.get("headers") or [])
+    origin = headers.get(b"origin", b"").decode("latin-1")
+    if origin in backend.CORS_ORIGINS:
+        return [(b"access-control-allow-origin", origin.encode("latin-1")), (b"vary", b"Origin")]
+    return []
+
+
+async def _read_json(receive):
+    body = b""
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return None
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            break
+    try:
+        return json.loads(body or b"{}")
+    except ValueError:
+        return {}
+
+
+async def _send_json(send, scope, payload, status=200, headers=()):
+    body = json.dumps(payload).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+                   + list(headers) + _cors_headers(scope),
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _query(scope, receive, send):
+    data = await _read_json(receive)
+    if data is None:
+        return
+
+    loop = asyncio.get_running_loop()
+    query, user_id = data.get("query", ""), data.get("userId")
+    # Cache hits do not queue behind the agent runs
+    response = await loop.run_in_executor(_lookups, backend.query_response, query, user_id, True)
+    if response is None:
+        response = await loop.run_in_executor(_query_runs, backend.query_response, query, user_id)
+    payload, status, headers = response
+    await _send_json(send, scope, payload, status,
+                     [(name.lower().encode("latin-1"), str(value).encode("latin-1")) for name, value in headers.items()])
+
+
+async def _stream(scope, receive, send):
+    if scope["method"] == "GET":
+        params = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        query = params.get("query", [""])[0]
+        user_id = params.get("userId", [None])[0]
+    else:
+        data = await _read_json(receive)
+        if data is None:
+            return
+        query = data.get("query", "")
+        user_id = data.get("userId")
+
+    if not query:
+        await _send_json(send, scope, {"error": "No query provided"}, 400)
+        return
+
+    # Sent by a reconnecting EventSource to resume after its last event
+    last_event_id = dict(scope.get("headers") or []).get(b"last-event-id", b"").decode("latin-1") or None
+    loop = asyncio.get_running_loop()
+    # Looks up the cache and replays and starts (or joins) the run; the run
+    # itself goes on in the stream pool and is not waited on here
+    stream_id, log, start, reset = await loop.run_in_executor(
+        _lookups, backend.open_resumable_stream, query, last_event_id, user_id)
+
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [(b"content-type", b"text/event-stream; charset=utf-8"), (b"cache-control", b"no-cache")]
+                   + _cors_headers(scope),
+    })
+
+    disconnected = asyncio.ensure_future(_disconnect(receive))
+    try:
+        with backend.profiler.request():
+            if reset:
+                await send({"type": "http.response.body", "body": sse_event({"reset": True}).encode("utf-8"),
+                            "more_body": True})
+            async for index, event in _follow(log, start, disconnected):
+                await send({"type": "http.response.body",
+                            "body": sse_event(event, f"{stream_id}-{index}").encode("utf-8"), "more_body": True})
+    finally:
+        disconnected.cancel()
+    if not disconnected.cancelled() and disconnected.done():
+        # Client went away; the run finishes in the background
+        return
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def _disconnect(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def _follow(log, start, disconnected):
+    """
+    (index, event) pairs of an event log, woken by the log's writer instead
+    of a thread blocked on it. Stops early when the client disconnects.
+    """
+    loop = asyncio.get_running_loop()
+    wake = asyncio.Event()
+
+    def notify():
+        loop.call_soon_threadsafe(wake.set)
+
+    log.subscribe(notify)
+    try:
+        index = start
+        while True:
+            wake.clear()
+            try:
+                pending, closed = log.read(index)
+            except StreamOverrun:
+                # Too far behind: end the response so the browser reconnects
+                # with its last event id and gets a reset and the full answer
+                return
+            for event in pending:
+                yield index, event
+                index += 1
+            if (closed and not pending) or disconnected.done():
+                return
+            if not pending:
+                woken = asyncio.ensure_future(wake.wait())
+                await asyncio.wait([woken, disconnected], return_when=asyncio.FIRST_COMPLETED)
+                woken.cancel()
+                if disconnected.done():
+                    return
+    finally:
+        log.unsubscribe(notify)
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            for pool in (_lookups, _query_runs, _stream_runs):
+                pool.shutdown(wait=False)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+        return
+
+    path = scope.get("path", "")
+    method = scope.get("method", "")
+    if scope["type"] == "http" and path == "/api/query" and method == "POST":
+        await _query(scope, receive, send)
+    elif scope["type"] == "http" and path == "/api/stream" and method in ("GET", "POST"):
+        await _stream(scope, receive, send)
+    else:
+        # CORS preflights and all remaining routes are handled by Flask
+        await _flask(scope, receive, send)
@@ -0,0 +1,102 @@
+"""
+Storage and read-bandwidth comparison for saved response bodies on a
+synthetic corpus: every save stored verbatim (previous behaviour) against
+content-addressed, compressed bodies as written by bodies.BodyStore.
+
+Users save answers to a shared pool of queries; a share of saves repeat an
+answer already saved (same query answered from the cache or re-saved) and a
+share are near-duplicates (same answer with a changed line). No database is
+needed: sizes are computed with the same hashing and codecs as BodyStore.
+
+Run from the backend directory:
+    python benchmarks/bench_bodies.py --saves 5000 --reads 20000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from collections import OrderedDict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bodies import content_hash, compress_body, decompress_body, zstandard
+from bench_postprocess import synthetic_response
+
+
+def build_corpus(saves, queries, repeat_share, variant_share, entities):
+    answers = [synthetic_response(random.randint(entities // 2, entities)).replace("value", f"value q{q}")
+               for q in range(queries)]
+    corpus = []
+    for i in range(saves):
+        answer = random.choice(answers)
+        roll = random.random()
+        if roll < repeat_share:
+            corpus.append(answer)
+        elif roll < repeat_share + variant_share:
+            corpus.append(answer + f"\n\nAccessed on 2025-01-{i % 28 + 1:02d}.")
+        else:
+            corpus.append(answer.replace("value", f"value s{i}"))
+    return corpus
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--saves", type=int, default=5000)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--entities", type=int, default=20, help="table rows per answer (upper bound)")
+    parser.add_argument("--repeat-share", type=float, default=0.4)
+    parser.add_argument("--variant-share", type=float, default=0.2)
+    parser.add_argument("--reads", type=int, default=20000)
+    parser.add_argument("--cache-mb", type=int, default=16, help="decompressed body cache per process")
+    args = parser.parse_args()
+    random.seed(7)
+
+    corpus = build_corpus(args.saves, args.queries, args.repeat_share, args.variant_share, args.entities)
+    raw_total = sum(len(content.encode("utf-8")) for content in corpus)
+    hashes = [content_hash(content) for content in corpus]
+    unique = dict(zip(hashes, corpus))
+
+    codecs = ["zlib"] + (["zstd"] if zstandard else [])
+    print(f"{len(corpus)} saves, {len(unique)} distinct bodies, {raw_total / 2**20:.1f} MB verbatim\n")
+    print(f"{'storage':<28} {'stored (MB)':>12} {'ratio':>7} {'compress (s)':>13}")
+    print(f"{'verbatim (previous)':<28} {raw_total / 2**20:>12.2f} {1:>6.1f}x {0:>13.2f}")
+
+    stored = {}
+    for codec in codecs:
+        start = time.perf_counter()
+        stored[codec] = {body_hash: compress_body(content, codec)[1] for body_hash, content in unique.items()}
+        elapsed = time.perf_counter() - start
+        size = sum(len(data) for data in stored[codec].values())
+        print(f"{'content-addressed + ' + codec:<28} {size / 2**20:>12.2f} {raw_total / size:>6.1f}x {elapsed:>13.2f}")
+
+    # Reads open random saved responses; recent ones are opened more often
+    reads = [hashes[min(len(hashes) - 1, int(random.expovariate(1 / (len(hashes) / 5))))] for _ in range(args.reads)]
+    raw_read = sum(len(unique[body_hash].encode("utf-8")) for body_hash in reads)
+
+    print(f"\n{args.reads} reads")
+    print(f"{'read path':<28} {'transferred (MB)':>17} {'decompress (ms/read)':>21}")
+    print(f"{'verbatim (previous)':<28} {raw_read / 2**20:>17.2f} {0:>21.3f}")
+    for codec, cache_mb in [(codec, cache_mb) for codec in codecs for cache_mb in (0, args.cache_mb)]:
+        cache = OrderedDict()
+        cache_bytes = 0
+        transferred = 0
+        start = time.perf_counter()
+        for body_hash in reads:
+            if body_hash in cache:
+                cache.move_to_end(body_hash)
+                continue
+            data = stored[codec][body_hash]
+            transferred += len(data)
+            content = decompress_body(codec, data)
+            cache[body_hash] = content
+            cache_bytes += len(content)
+            while cache_bytes > cache_mb * 2**20:
+                cache_bytes -= len(cache.popitem(last=False)[1])
+        elapsed = time.perf_counter() - start
+        label = f"{codec} + {cache_mb} MB body cache" if cache_mb else codec
+        print(f"{label:<28} {transferred / 2**20:>17.2f} {elapsed / args.reads * 1000:>21.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+End-to-end offline benchmark of /api/query and /api/stream. Every agent runs
+on the local fake model (models.FakeModel), so the real orchestration,
+fan-out, post-processing and streaming code is exercised without API keys or
+network access. MongoDB is replaced by mongomock unless --mongodb is given.
+
+Reports throughput, p50/p99 latency and, for /api/stream, p50/p99
+time-to-first-token (first chunk event).
+
+Tool calls scripted for the fake model (FAKE_MODEL_SCRIPT) run the real
+search and crawl tools unless they are replayed from a tool cassette:
+record one once with network access, then replay it anywhere, optionally
+with the recorded timing. The script itself can be recorded from the real
+model the same way: MODEL_PROVIDER=record runs Groq and appends every turn,
+with its tool calls and results, to FAKE_MODEL_RECORD.
+
+Run from the backend directory:
+    python benchmarks/bench_endpoints.py --requests 200 --concurrency 16
+    FAKE_MODEL_LATENCY=1 FAKE_MODEL_TOKEN_RATE=50 python benchmarks/bench_endpoints.py --endpoint stream
+    MODEL_PROVIDER=record FAKE_MODEL_RECORD=turns.jsonl python benchmarks/bench_endpoints.py --requests 5
+    TOOL_CASSETTE_MODE=record TOOL_CASSETTE=tools.jsonl FAKE_MODEL_SCRIPT=turns.jsonl python benchmarks/bench_endpoints.py
+    TOOL_CASSETTE_MODE=replay TOOL_CASSETTE=tools.jsonl TOOL_CASSETTE_TIMING=1 FAKE_MODEL_SCRIPT=turns.jsonl \
+        python benchmarks/bench_endpoints.py
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+os.environ.setdefault("MODEL_PROVIDER", "fake")
+os.environ.setdefault("REFORMAT_PROVIDER", "fake")
+os.environ.setdefault("FAKE_MODEL_LATENCY", "0.2")
+os.environ.setdefault("FAKE_MODEL_TOKEN_RATE", "500")
+# Every request should run the pipeline rather than be served from a cache
+os.environ.setdefault("QUERY_CACHE_BACKEND", "off")
+os.environ.setdefault("REUSE_ENABLED", "0")
+os.environ.setdefault("ENTITY_STORE_DB", os.path.join(tempfile.mkdtemp(), "entities.db"))
+
+QUERIES = [
+    "top engineering colleges in Delhi",
+    "largest software companies in Bangalore",
+    "latest news about electric vehicles",
+    "What is the capital of Australia?",
+    "best places to visit in Kyoto",
+]
+
+
+def percentile(values, share):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(share * (len(ordered) - 1))))]
+
+
+def load_app(use_mongodb):
+    if not use_mongodb:
+        import mongomock
+        import storage
+        os.environ.setdefault("MONGODB_URI", "mongodb://localhost:27017")
+        storage.create_mongo_client = lambda uri: mongomock.MongoClient()
+    elif not os.environ.get("MONGODB_URI"):
+        sys.exit("Set MONGODB_URI to a disposable MongoDB instance or leave out --mongodb")
+    import app
+    return app
+
+
+def run_query(client, query):
+    start = time.perf_counter()
+    response = client.post("/api/query", json={"query": query})
+    elapsed = time.perf_counter() - start
+    return response.status_code == 200, elapsed, None
+
+
+def run_stream(client, query):
+    start = time.perf_counter()
+    first_token = None
+    ok = False
+    response = client.get(f"/api/stream?query={quote(query)}", buffered=False)
+    try:
+        for data in response.response:
+            for line in (data.decode("utf-8") if isinstance(data, bytes) else data).split("\n"):
+                if not line.startswith("data: "):
+                    continue
+                event = json.loads(line[6:])
+                if "chunk" in event and first_token is None:
+                    first_token = time.perf_counter() - start
+                elif event.get("done"):
+                    ok = True
+                elif "error" in event:
+                    ok = False
+    finally:
+        response.close()
+    return ok, time.perf_counter() - start, first_token
+
+
+def bench(app, endpoint, requests, concurrency):
+    run = run_stream if endpoint == "stream" else run_query
+
+    def one(index):
+        # A distinct query per request, so identical in-flight queries are not coalesced
+        query = f"{QUERIES[index % len(QUERIES)]} ({index})"
+        return run(app.app.test_client(), query)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(one, range(requests)))
+    wall = time.perf_counter() - start
+
+    latencies = [elapsed for ok, elapsed, _ in results if ok]
+    first_tokens = [first for ok, _, first in results if ok and first is not None]
+    return {
+        "endpoint": f"/api/{endpoint}",
+        "ok": len(latencies),
+        "failed": requests - len(latencies),
+        "throughput": len(latencies) / wall,
+        "p50": percentile(latencies, 0.5),
+        "p99": percentile(latencies, 0.99),
+        "ttft50": percentile(first_tokens, 0.5),
+        "ttft99": percentile(first_tokens, 0.99),
+    }
+
+
+def ms(seconds):
+    return f"{seconds * 1000:.0f}" if seconds is not None else "-"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoint", choices=["query", "stream", "both"], default="both")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--mongodb", action="store_true", help="use MONGODB_URI instead of mongomock")
+    args = parser.parse_args()
+
+    app = load_app(args.mongodb)
+    endpoints = ["query", "stream"] if args.endpoint == "both" else [args.endpoint]
+
+    print(f"fake model: {os.environ['FAKE_MODEL_LATENCY']}s latency, {os.environ['FAKE_MODEL_TOKEN_RATE']} tokens/s; "
+          f"{args.requests} requests, {args.concurrency} concurrent")
+    print(f"{'endpoint':<12} {'ok':>5} {'failed':>7} {'req/s':>8} {'p50 (ms)':>9} {'p99 (ms)':>9} "
+          f"{'ttft p50':>9} {'ttft p99':>9}")
+    for endpoint in endpoints:
+        row = bench(app, endpoint, args.requests, args.concurrency)
+        print(f"{row['endpoint']:<12} {row['ok']:>5} {row['failed']:>7} {row['throughput']:>8.2f} "
+              f"{ms(row['p50']):>9} {ms(row['p99']):>9} {ms(row['ttft50']):>9} {ms(row['ttft99']):>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Latency and payload size of the saved-responses history API on a seeded
+collection: the previous query (50 newest rows with full content, no index)
+against the indexed, cursor-paginated listing and load-by-id.
+
+Uses a throwaway database on MONGODB_URI (dropped afterwards), or
+mongomock with --mongomock. mongomock has no real indexes or query planner,
+so only the payload sizes are meaningful there; use a local mongod for
+latency numbers.
+
+Run from the backend directory:
+    MONGODB_URI=mongodb://localhost:27017 python benchmarks/bench_history.py --docs 100000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from storage import ensure_indexes, list_responses, get_response, summary_fields
+
+
+def connect(use_mongomock):
+    if use_mongomock:
+        import mongomock
+        return mongomock.MongoClient()
+    from pymongo import MongoClient
+    uri = os.environ.get("MONGODB_URI")
+    if not uri:
+        sys.exit("Set MONGODB_URI to a disposable MongoDB instance or pass --mongomock")
+    return MongoClient(uri)
+
+
+def seed(collection, docs, users, heavy_share, content_kb):
+    """Insert docs spread over users; user-0 owns heavy_share of them"""
+    paragraph = ("| Institution Name | Official Website | Contact Information |\n|---|---|---|\n"
+                 + "| Example College | https://example.edu | +1 555 0100 |\n" * 8
+                 + "HIGH CONFIDENCE: Example paragraph of a research answer. " * 20 + "\n\n")
+    content = (paragraph * (content_kb * 1024 // len(paragraph) + 1))[:content_kb * 1024]
+    start = datetime.utcnow() - timedelta(days=365)
+
+    batch = []
+    for i in range(docs):
+        user = "user-0" if random.random() < heavy_share else f"user-{random.randint(1, users - 1)}"
+        batch.append({
+            "userId": user,
+            "content": content,
+            "searchQuery": f"query {i}",
+            "timestamp": start + timedelta(seconds=i * 300),
+            **summary_fields(content),
+        })
+        if len(batch) == 1000:
+            collection.insert_many(batch)
+            batch = []
+    if batch:
+        collection.insert_many(batch)
+
+
+def timed(fn, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - start) / repeat * 1000, result
+
+
+def payload_kb(payload):
+    return len(json.dumps(payload, default=str).encode("utf-8")) / 1024
+
+
+def legacy_listing(collection, user_id):
+    return list(
+        collection.find({"userId": user_id}, {"_id": 1, "content": 1, "timestamp": 1, "searchQuery": 1})
+        .sort("timestamp", -1)
+        .limit(50)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=100000)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--heavy-share", type=float, default=0.1, help="fraction of documents owned by one user")
+    parser.add_argument("--content-kb", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--mongomock", action="store_true")
+    args = parser.parse_args()
+
+    client = connect(args.mongomock)
+    db = client[f"history_bench_{int(time.time())}"]
+    collection = db["search_results"]
+    try:
+        print(f"Seeding {args.docs} documents ...")
+        seed(collection, args.docs, args.users, args.heavy_share, args.content_kb)
+        heavy = "user-0"
+        print(f"{heavy} owns {collection.count_documents({'userId': heavy})} documents\n")
+
+        rows = []
+        legacy_ms, legacy = timed(lambda: legacy_listing(collection, heavy), args.repeat)
+        rows.append(("legacy: 50 newest with content, no index", legacy_ms, payload_kb(legacy)))
+
+        ensure_indexes(collection)
+        legacy_ms, legacy = timed(lambda: legacy_listing(collection, heavy), args.repeat)
+        rows.append(("legacy: 50 newest with content, indexed", legacy_ms, payload_kb(legacy)))
+
+        page_ms, (page, cursor) = timed(lambda: list_responses(collection, heavy), args.repeat)
+        rows.append(("listing: first page", page_ms, payload_kb(page)))
+
+        # Walk 100 pages deep and time the page reached there
+        for _ in range(100):
+            if not cursor:
+                break
+            page, cursor = list_responses(collection, heavy, cursor=cursor)
+        if cursor:
+            deep_ms, (deep, _) = timed(lambda: list_responses(collection, heavy, cursor=cursor), args.repeat)
+            rows.append(("listing: page 101 (keyset)", deep_ms, payload_kb(deep)))
+
+        response_id = page[0]["_id"]
+        body_ms, body = timed(lambda: get_response(collection, heavy, response_id), args.repeat)
+        rows.append(("load one response by id", body_ms, payload_kb(body)))
+
+        print(f"{'operation':<44} {'latency (ms)':>13} {'payload (KB)':>13}")
+        for name, latency, size in rows:
+            print(f"{name:<44} {latency:>13.2f} {size:>13.1f}")
+    finally:
+        client.drop_database(db.name)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+"""
+Micro-benchmark of the response post-processing on large synthetic answers.
+Compares the post-processing in postprocess.py with the previous
+implementation (one re.sub per instruction pattern plus substring checks in
+each validator), kept below for reference, and checks both agree on answers
+where the old substring heuristics get the tables right.
+
+The gain over the old implementation is negligible: the two run at about
+the same speed, within run-to-run noise. Echoes are stripped in one scan,
+but the validation markers need a lookup of their own (a combined scan let
+a marker swallow the start of an echo), and table parsing and the
+whitespace tidy still pass over the text separately. What the rewrite buys
+is typed table checks, not speed.
+
+Run from the backend directory:
+    python benchmarks/bench_postprocess.py --entities 200 --repeat 20
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from postprocess import postprocess_response, current_year, current_date_str
+from query_classifier import classify
+from tables import INSTITUTION_COLUMNS, COMPANY_COLUMNS
+
+
+# ---- previous implementation ----------------------------------------------
+
+def validate_education_query_response(response_text, query):
+    # Simple detection for education-related queries
+    education_keywords = ["school", "college", "university", "institute", "campus", 
+                         "education", "academic", "student", "faculty", "course"]
+    
+    is_education_query = any(keyword.lower() in query.lower() for keyword in education_keywords)
+    
+    # Check if the response includes a Sources section
+    has_sources_section = "Sources:" in response_text or "SOURCES:" in response_text
+    
+    if not has_sources_section:
+        sources_reminder = f"""
+
+**MISSING INFORMATION: A "Sources" section should be included listing all websites used for information gathering with URLs and access dates.**
+        """
+        response_text += sources_reminder
+    
+    # Check if confidence indicators are included
+    has_confidence_indicators = any(level in response_text for level in ["HIGH CONFIDENCE:", "MEDIUM CONFIDENCE:", "LOW CONFIDENCE:"])
+    
+    if not has_confidence_indicators:
+        confidence_reminder = """
+
+**MISSING INFORMATION: Confidence indicators (HIGH/MEDIUM/LOW) should be included for each major section based on source quality.**
+        """
+        response_text += confidence_reminder
+    
+    if not is_education_query:
+        # Check if the response has "Official Website" and "Contact Details" if it's any type of entity
+        has_website = "Official Website" in response_text
+        has_contact = "Contact Details" in response_text
+        
+        if not (has_website and has_contact):
+            general_reminder = """
+
+**MISSING INFORMATION: Information about any entity should include Official Website and Contact Details. Please request this information if needed.**
+            """
+            response_text += general_reminder
+        
+        # Check if the response has a balanced news section
+        has_news_section = "Recent News" in response_text or "RECENT NEWS" in response_text
+        has_positive = "[POSITIVE]" in response_text
+        has_challenging = "[CHALLENGING]" in response_text
+        
+        if not has_news_section or not (has_positive and has_challenging):
+            news_reminder = f"""
+
+**MISSING INFORMATION: A Recent News section should be included with both positive and challenging news items from {current_year} only. Please request this information if needed.**
+            """
+            response_text += news_reminder
+            
+        return response_text
+    
+    # For education queries, check if the response has the required columns
+    required_columns = [
+        "Institution Name", "Official Website", "Contact Details", "Established Year", "Location", "Type", 
+        "Total Student Enrollment", "Annual Tuition Fees", "Top Programs Offered",
+        "Accreditation Status", "Average Campus Placement Rate", 
+        "Recent Notable Achievements", "Campus Facilities"
+    ]
+    
+    # Check if the response has a balanced news section
+    has_news_section = "Recent News" in response_text or "RECENT NEWS" in response_text
+    has_positive = "[POSITIVE]" in response_text
+    has_challenging = "[CHALLENGING]" in response_text
+    
+    # If there's a table but missing required columns, add a correction note
+    if "| Institution Name |" not in response_text or len(required_columns) > response_text.count("|") / 2:
+        correction_note = """
+        
+**MISSING INFORMATION: The table provided is incomplete. A comprehensive educational institution table should include the following columns:**
+
+| Institution Name | Official Website | Contact Details | Established Year | Location | Type | Total Student Enrollment | Annual Tuition Fees | Top Programs Offered | Accreditation Status | Average Campus Placement Rate | Recent Notable Achievements | Campus Facilities |
+
+Please request more detailed information if needed.
+        """
+        response_text += correction_note
+    
+    # If there's no balanced news section, add a reminder
+    if not has_news_section or not (has_positive and has_challenging):
+        news_reminder = f"""
+
+**MISSING INFORMATION: A Recent News section should be included with both positive [POSITIVE] and challenging [CHALLENGING] news items from {current_year} only. Please request this information if needed.**
+        """
+        response_text += news_reminder
+    
+    # Add anti-hallucination disclaimer if needed
+    disclaimer = f"""
+
+**INFORMATION VERIFICATION NOTICE: All information provided has been gathered through search tools and web scraping as of {current_date_str}. Any field marked as "Data not available" indicates that information could not be verified from reliable sources. Please consult official websites for the most accurate and up-to-date information.**
+        """
+    response_text += disclaimer
+    
+    return response_text
+
+# Function to validate company query responses
+def validate_company_query_response(response_text, query):
+    # Simple detection for company-related queries
+    company_keywords = ["company", "business", "corporation", "firm", "enterprise", 
+                        "corporate", "industry", "organization", "startup"]
+    
+    is_company_query = any(keyword.lower() in query.lower() for keyword in company_keywords)
+    
+    if not is_company_query:
+        return response_text
+    
+    # Check if the response has the required columns for companies
+    if "| Company Name |" not in response_text or "| Official Website |" not in response_text or "| Contact Information |" not in response_text:
+        correction_note = """
+        
+**NOTE: The table provided is incomplete. A comprehensive company table should include the following columns:**
+
+| Company Name | Official Website | Contact Information | Founded Year | Headquarters Location | Industry Sector | Number of Employees | Annual Revenue | Average Salary Range | Top Job Roles | Company Culture Rating | Recent Major News | Key Products/Services |
+
+Please request more detailed information if needed.
+        """
+        return response_text + correction_note
+    
+    # Check if there's a news section with both positive and negative news
+    if "Recent News" not in response_text or ("POSITIVE" not in response_text and "Positive" not in response_text) or ("NEGATIVE" not in response_text and "Negative" not in response_text and "CHALLENGING" not in response_text and "Challenging" not in response_text):
+        news_note = f"""
+
+**NOTE: The response should include a "Recent News" section with both positive and negative news items from {current_year} only for each company mentioned.**
+
+Please request this information if needed.
+        """
+        return response_text + news_note
+        
+    return response_text
+
+
+# Function to clean system instructions from the response
+def clean_system_instructions(response_text):
+    # Patterns to identify and remove system instructions
+    patterns = [
+        r"As an advanced information retrieval system.*?protocol EXACTLY:",
+        r"YOU MUST use your search tools.*?information\.",
+        r"NEVER state \"As of my last update\".*?phrases",
+        r"ALWAYS verify information through.*?content",
+        r"CRITICAL: For ANY school or college queries.*?order\.",
+        r"MANDATORY: After the table.*?first",
+        r"YOUR RESPONSE MUST CONTAIN.*?requested",
+        r"I'll use my search tools to gather.*?Query:",
+        r"I must use search tools to gather.*?information\.",
+        r"For your query about.*?search tools\.",
+        r"I'll now search for the most up-to-date information.*?query\.",
+        r"Let me search for information about.*?\.",
+        r"Following the required format for educational institutions.*?\.",
+        r"I'll make sure to include both positive and negative news.*?\.",
+        r"I'll ensure I don't include system instructions.*?\.",
+        r"Now, let me gather information using my search tools.*?one moment\.",
+        r"Website and contact information are TOP PRIORITY fields.*?pages\.",
+        r"I need to use search tools for this query.*?\.",
+        r"I'll actively search for the official website and contact information.*?\.",
+        r"I'll make sure to include news for each entity.*?\.",
+        r"Each news item will be clearly labeled as.*?\.",
+        r"Let me search for the most current information.*?\.",
+        r"Before providing my response.*?\.",
+        r"I understand I need to provide comprehensive information.*?\.",
+        r"I'll get started on your query.*?\.",
+        r"I'll ALWAYS cite my sources.*?\.",
+        r"These instructions are VERY IMPORTANT.*?\.",
+        r"Using my search tools to gather current information.*?\.",
+        r"I need to conduct web searches for this.*?\.",
+        r"I'm using search tools to gather this information.*?\.",
+        r"I'll make sure to include website and contact information.*?\.",
+        r"I'm searching for both positive and negative news.*?\.",
+        r"I'll be sure to format my response according to.*?\.",
+        r"For this query, I need to.*?\.",
+        r"I must create a comprehensive table.*?\.",
+        r"Let me gather the requested information.*?\.",
+        r"I'm using search tools to find the most up-to-date information.*?\.",
+        r"I'll use Crawl4ai to extract detailed information.*?\."
+    ]
+    
+    # Apply the patterns to clean the response
+    cleaned_response = response_text
+    for pattern in patterns:
+        cleaned_response = re.sub(pattern, "", cleaned_response, flags=re.DOTALL)
+    
+    # Remove any resulting double spaces or newlines
+    cleaned_response = re.sub(r'\n\s*\n\s*\n', '\n\n', cleaned_response)
+    cleaned_response = re.sub(r'  +', ' ', cleaned_response)
+    
+    return cleaned_response.strip()
+
+# Function to enforce website and contact information inclusion
+def enforce_website_contact_info(response_text, query):
+    # If the response already has website and contact info, return as is
+    if ("| Official Website |" in response_text and "| Contact Information |" in response_text and 
+        not ("Official Website | Data not available" in response_text and "Contact Information | Data not available" in response_text)):
+        return response_text
+    
+    # Add a specific warning about website and contact information
+    warning = """
+    
+**IMPORTANT: The results should include Official Website and Contact Information for each entity mentioned. Please ensure this critical information is included in all tables.**
+    """
+    
+    return response_text + warning
+
+
+def legacy_postprocess(response_text, query):
+    response_text = validate_education_query_response(response_text, query)
+    response_text = validate_company_query_response(response_text, query)
+    response_text = enforce_website_contact_info(response_text, query)
+    return clean_system_instructions(response_text)
+
+
+# ---- benchmark -------------------------------------------------------------
+
+def synthetic_response(entities, complete=True, columns=INSTITUTION_COLUMNS):
+    header = "| " + " | ".join(columns) + " |"
+    separator = "|" + "---|" * len(columns)
+    rows = "\n".join(
+        "| " + " | ".join(f"{column} value {i} [Source {i % 7}]" for column in columns) + " |"
+        for i in range(entities)
+    )
+    news = "\n".join(
+        f"- [POSITIVE] Institution {i} opened a new research centre.  Source: https://news.example.com/{i}\n"
+        f"- [CHALLENGING] Institution {i} faced criticism over fees.   Source: https://news.example.com/c{i}"
+        for i in range(entities)
+    )
+    echo = "I'll use my search tools to gather the latest information. Query: ignored\n\n\n\n"
+    body = (
+        echo + "HIGH CONFIDENCE: Summary of the institutions.\n\n"
+        + header + "\n" + separator + "\n" + rows + "\n\n\n\n"
+        + "## Recent News\n\n" + news + "\n\n"
+        + "Let me search for the most current information on this.\n"
+    )
+    if complete:
+        body += "Sources:\n" + "\n".join(f"{i}. https://source{i}.example.com" for i in range(7))
+    return body
+
+
+ECHOED_MARKERS = "YOUR RESPONSE MUST CONTAIN a Sources: section with links as requested\n\n"
+ECHO_IN_MARKER = "Intro. Official Website and contact information are TOP PRIORITY fields to check on pages. Rest.\n\n"
+
+
+def timed(fn, text, query, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn(text, query)
+    return (time.perf_counter() - start) / repeat, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entities", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    cases = [
+        ("education, complete", synthetic_response(args.entities), "top colleges in Delhi"),
+        ("education, no sources", synthetic_response(args.entities, complete=False), "best colleges for engineering"),
+        ("company", synthetic_response(args.entities, columns=COMPANY_COLUMNS), "largest software company"),
+        ("general", synthetic_response(args.entities // 4, complete=False), "weather in Paris"),
+        # Markers that only occur in an echoed instruction still count, as in the legacy order
+        ("education, echoed sources", ECHOED_MARKERS + synthetic_response(args.entities, complete=False),
+         "top colleges in Delhi"),
+        # An echo that starts inside a marker is still stripped
+        ("general, echo in a marker", ECHO_IN_MARKER + synthetic_response(args.entities // 4, complete=False),
+         "weather in Paris"),
+    ]
+
+    print(f"{'case':<26} {'size (KB)':>10} {'legacy (ms)':>12} {'current (ms)':>13} {'speed-up':>9} {'same output':>12}")
+    for name, text, query in cases:
+        legacy_time, legacy_result = timed(legacy_postprocess, text, query, args.repeat)
+        new_time, new_result = timed(postprocess_response, text, classify(query), args.repeat)
+        print(f"{name:<26} {len(text) / 1024:>10.1f} {legacy_time * 1000:>12.2f} {new_time * 1000:>13.2f} "
+              f"{legacy_time / new_time:>8.1f}x {str(legacy_result == new_result):>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Time-to-first-event and total latency of /api/stream's pipeline against a
+stubbed agent. Compares the incremental mode with the legacy buffered mode.
+
+Run from the backend directory:
+    python benchmarks/bench_stream.py --startup 2 --token-delay 0.005 --reformat 3
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from streaming import sse_event, stream_incremental, stream_buffered
+
+
+def synthetic_answer(entities=5):
+    rows = "\n".join(
+        f"| Entity {i} | https://entity{i}.example.com | +1 555 010{i} | {1950 + i} | City {i} |"
+        for i in range(entities)
+    )
+    news = "\n".join(
+        f"- [POSITIVE] Entity {i} announced a new programme this quarter. Source: https://news.example.com/{i}"
+        for i in range(entities)
+    )
+    return (
+        "HIGH CONFIDENCE: Overview of the requested entities.\n\n"
+        "| Institution Name | Official Website | Contact Details | Established Year | Location |\n"
+        "|---|---|---|---|---|\n" + rows + "\n\n"
+        "## Recent News\n\n" + news + "\n\n"
+        "Sources:\n1. https://entity0.example.com accessed today\n"
+    )
+
+
+def stub_agent(text, startup, token_delay, token_size=4):
+    """Yield the answer in small deltas the way a streaming model would"""
+    time.sleep(startup)
+    for i in range(0, len(text), token_size):
+        time.sleep(token_delay)
+        yield text[i:i + token_size]
+
+
+def measure(events):
+    start = time.perf_counter()
+    first = None
+    count = 0
+    for event in events:
+        sse_event(event)
+        count += 1
+        if first is None:
+            first = time.perf_counter() - start
+    return first, time.perf_counter() - start, count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--startup", type=float, default=1.0, help="seconds before the first token (tool calls)")
+    parser.add_argument("--token-delay", type=float, default=0.002, help="seconds between tokens")
+    parser.add_argument("--reformat", type=float, default=2.0, help="seconds for the buffered reformat call")
+    parser.add_argument("--entities", type=int, default=5)
+    args = parser.parse_args()
+
+    text = synthetic_answer(args.entities)
+
+    def reformat(joined):
+        time.sleep(args.reformat)
+        return joined
+
+    modes = {
+        "incremental": lambda: stream_incremental(stub_agent(text, args.startup, args.token_delay)),
+        "buffered": lambda: stream_buffered(stub_agent(text, args.startup, args.token_delay), reformat),
+    }
+
+    print(f"{'mode':<12} {'first event (s)':>16} {'total (s)':>10} {'events':>7}")
+    for name, build in modes.items():
+        first, total, count = measure(build())
+        print(f"{name:<12} {first:>16.3f} {total:>10.3f} {count:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Load-test harness for /api/stream: opens many concurrent SSE connections
+against a server running benchmarks/stubbed_app.py and reports how many
+connections one worker kept open at the same time, plus first-event and
+total latency.
+
+Compare the threaded WSGI worker with the async worker, from the
+benchmarks directory:
+
+    # before: one gunicorn worker with 8 threads
+    gunicorn -w 1 -k gthread --threads 8 -b 127.0.0.1:5001 stubbed_app:app
+    python load_sse.py --port 5001 --connections 500
+
+    # after: one uvicorn worker
+    ASGI_MAX_RUNS=512 uvicorn --port 5002 stubbed_app:application
+    python load_sse.py --port 5002 --connections 500
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from urllib.parse import quote
+
+
+class Counters:
+    def __init__(self):
+        self.open = 0
+        self.peak_open = 0
+        self.first_event = []
+        self.total = []
+        self.failed = 0
+
+
+async def one_stream(host, port, index, counters, timeout):
+    start = time.perf_counter()
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    except Exception:
+        counters.failed += 1
+        return
+
+    query = quote(f"load test query {index}")
+    writer.write(f"GET /api/stream?query={query} HTTP/1.1\r\nHost: {host}\r\nAccept: text/event-stream\r\n\r\n".encode())
+    await writer.drain()
+
+    headers_seen = False
+    first = None
+    try:
+        async def read_events():
+            nonlocal headers_seen, first
+            while True:
+                line = await reader.readline()
+                if not line:
+                    return
+                if not headers_seen and line.startswith(b"HTTP/1.1 200"):
+                    headers_seen = True
+                    counters.open += 1
+                    counters.peak_open = max(counters.peak_open, counters.open)
+                if line.startswith(b"data: "):
+                    if first is None:
+                        first = time.perf_counter() - start
+                    if b'"done"' in line or b'"error"' in line:
+                        return
+        await asyncio.wait_for(read_events(), timeout)
+    except Exception:
+        counters.failed += 1
+    finally:
+        if headers_seen:
+            counters.open -= 1
+        writer.close()
+
+    if first is not None:
+        counters.first_event.append(first)
+        counters.total.append(time.perf_counter() - start)
+
+
+def percentile(values, pct):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--connections", type=int, default=200)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    args = parser.parse_args()
+
+    counters = Counters()
+    start = time.perf_counter()
+    await asyncio.gather(*(one_stream(args.host, args.port, i, counters, args.timeout) for i in range(args.connections)))
+    elapsed = time.perf_counter() - start
+
+    print(f"connections requested     {args.connections}")
+    print(f"peak open SSE connections {counters.peak_open}")
+    print(f"completed / failed        {len(counters.total)} / {counters.failed}")
+    print(f"first event p50 / p99 (s) {percentile(counters.first_event, 50):.2f} / {percentile(counters.first_event, 99):.2f}")
+    print(f"total p50 / p99 (s)       {percentile(counters.total, 50):.2f} / {percentile(counters.total, 99):.2f}")
+    if counters.total:
+        print(f"mean total (s)            {statistics.mean(counters.total):.2f}")
+    print(f"wall clock (s)            {elapsed:.2f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
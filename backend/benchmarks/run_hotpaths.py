@@ -0,0 +1,206 @@
+"""
+Regression suite for the CPU-bound request hot paths: typed chunk and
+tool call extraction, incremental markdown streaming, SSE encoding, the
+post-processing scan and validators, table parsing, evidence merging and
+query classification, each on realistic large answers or long chunk streams.
+
+Every case is timed over several rounds, after a warm-up run, and reported
+as min and median. Results can be saved as a baseline JSON file and later
+runs compared against it. A case counts as a regression when both its
+median and its min are slower than the baseline's by more than
+--threshold: a single noisy round moves the median but rarely the min, so
+requiring both keeps one slow round from failing the run, while a real
+slowdown moves both. The run fails (exit code 1) on any regression. The
+baseline records the Python version and machine, and a comparison against
+a baseline from a different one is flagged, since its timings do not
+carry over; save the baseline on the machine that runs the comparison.
+
+This is a plain script like the other benchmarks rather than a
+pytest-benchmark or asv suite: the backend has no pytest setup, and the
+cases only need the modules under test, so it runs anywhere the backend
+imports (including CI without MongoDB or API keys).
+
+Run from the backend directory:
+    python benchmarks/run_hotpaths.py --save hotpaths_baseline.json     # on main
+    python benchmarks/run_hotpaths.py --compare hotpaths_baseline.json  # on a branch
+    python benchmarks/run_hotpaths.py --only postprocess --rounds 20
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from fanout import EngineResult, merge_evidence
+from postprocess import education_column_note, postprocess_response, scan_response
+from query_classifier import _classify, classify
+from streaming import agent_events, chunk_content, sse_event, stream_incremental
+from tables import INSTITUTION_COLUMNS, COMPANY_COLUMNS, TableParser, extract_records, parse_tables
+
+
+class Chunk:
+    """Stream chunk with phi's RunResponse fields"""
+
+    def __init__(self, content, event="RunResponse", tools=None):
+        self.content = content
+        self.event = event
+        self.tools = tools
+
+
+def large_answer(entities=200, columns=INSTITUTION_COLUMNS):
+    header = "| " + " | ".join(columns) + " |"
+    separator = "|" + "---|" * len(columns)
+    rows = "\n".join(
+        "| " + " | ".join(f"{column} value {i} [Source {i % 7}]" for column in columns) + " |"
+        for i in range(entities)
+    )
+    news = "\n".join(
+        f"- [POSITIVE] Entity {i} opened a new research centre.  Source: https://news.example.com/{i}\n"
+        f"- [CHALLENGING] Entity {i} faced criticism over fees.   Source: https://news.example.com/c{i}"
+        for i in range(entities // 4)
+    )
+    return (
+        "I'll use my search tools to gather the latest information.\n\n"
+        "HIGH CONFIDENCE: Summary of the requested entities.\n\n"
+        + header + "\n" + separator + "\n" + rows + "\n\n\n\n"
+        + "## Recent News\n\n" + news + "\n\n"
+        + "Sources:\n" + "\n".join(f"{i}. https://source{i}.example.com/page" for i in range(40)) + "\n"
+    )
+
+
+def token_deltas(text, size=6):
+    """The answer as a long stream of token-sized deltas"""
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def build_cases(entities):
+    answer = large_answer(entities)
+    company_answer = large_answer(entities, COMPANY_COLUMNS)
+    deltas = token_deltas(answer)
+    chunks = [Chunk(delta) for delta in deltas]
+    # A run that calls tools: the growing tool list rides on every later chunk
+    tools = []
+    tool_chunks = []
+    for i, delta in enumerate(deltas):
+        if i % 200 == 0:
+            tools = tools + [{"tool_call_id": f"call_{i}", "tool_name": "google_search",
+                              "tool_args": {"query": f"query {i}"}}]
+            tool_chunks.append(Chunk("google_search(query)", "ToolCallStarted", tools))
+            tools = tools[:-1] + [dict(tools[-1], content="result " * 200, metrics={"time": 1.2})]
+            tool_chunks.append(Chunk("google_search(query) completed", "ToolCallCompleted", tools))
+        tool_chunks.append(Chunk(delta, tools=tools))
+    events = list(stream_incremental(iter(deltas)))
+    education = classify("top engineering colleges and universities in Delhi")
+    company = classify("largest software companies in Bangalore")
+    engines = [EngineResult(name, name.title(), large_answer(entities // 2), 3.0)
+               for name in ("google", "duckduckgo", "baidu")]
+    queries = [f"top {i} engineering colleges in city {i}" for i in range(2000)]
+
+    def stream_answer():
+        parser = TableParser()
+        for event in stream_incremental(agent_events(chunks)):
+            if "chunk" in event:
+                parser.feed(event["chunk"])
+        parser.flush()
+        return parser.tables
+
+    def classify_queries():
+        _classify.cache_clear()
+        for query in queries:
+            classify(query)
+
+    return {
+        "chunk_content.attr": (lambda: [chunk_content(chunk) for chunk in chunks], len(chunks)),
+        "agent_events.tools": (lambda: list(agent_events(tool_chunks)), len(tool_chunks)),
+        "stream.incremental": (lambda: list(stream_incremental(iter(deltas))), len(deltas)),
+        "stream.sse_encode": (lambda: [sse_event(event) for event in events], len(events)),
+        "stream.end_to_end": (stream_answer, len(chunks)),
+        "postprocess.scan": (lambda: scan_response(answer), 1),
+        "postprocess.education": (lambda: postprocess_response(answer, education), 1),
+        "postprocess.company": (lambda: postprocess_response(company_answer, company), 1),
+        "postprocess.column_note": (lambda: education_column_note(answer, education), 1),
+        "tables.parse_records": (lambda: extract_records(parse_tables(answer)), 1),
+        "fanout.merge_evidence": (lambda: merge_evidence(engines), 1),
+        "classify.queries": (classify_queries, len(queries)),
+    }
+
+
+def measure(fn, rounds, warmup=1):
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return {"min_ms": round(min(times) * 1000, 3), "median_ms": round(statistics.median(times) * 1000, 3)}
+
+
+def machine():
+    return {"python": platform.python_version(), "platform": platform.platform(),
+            "processor": platform.processor()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entities", type=int, default=200, help="table rows of the synthetic answers")
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--only", help="run only cases whose name contains this")
+    parser.add_argument("--save", help="write the results to this baseline file")
+    parser.add_argument("--compare", help="compare against this baseline file")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="allowed median and min slowdown against the baseline (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    cases = build_cases(args.entities)
+    baseline = {}
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            saved = json.load(f)
+        baseline = saved["cases"]
+        if saved.get("machine") != machine():
+            print(f"warning: the baseline was saved on another machine or Python ({saved.get('machine')})")
+
+    results = {}
+    regressions = []
+    print(f"{'case':<26} {'items':>7} {'min (ms)':>10} {'median (ms)':>12} {'baseline':>10} {'change':>8}")
+    for name, (fn, items) in cases.items():
+        if args.only and args.only not in name:
+            continue
+        result = measure(fn, args.rounds)
+        result["items"] = items
+        results[name] = result
+
+        base = baseline.get(name, {}).get("median_ms")
+        base_min = baseline.get(name, {}).get("min_ms")
+        change = ""
+        if base:
+            ratio = result["median_ms"] / base - 1
+            change = f"{ratio:+.0%}"
+            if ratio > args.threshold and (not base_min or result["min_ms"] / base_min - 1 > args.threshold):
+                regressions.append(name)
+                change += " !"
+        print(f"{name:<26} {items:>7} {result['min_ms']:>10.2f} {result['median_ms']:>12.2f} "
+              f"{base if base else '-':>10} {change:>8}")
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({
+                "machine": machine(),
+                "entities": args.entities,
+                "rounds": args.rounds,
+                "cases": results,
+            }, f, indent=2)
+        print(f"saved {len(results)} cases to {args.save}")
+
+    if regressions:
+        print(f"regressions over {args.threshold:.0%}: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
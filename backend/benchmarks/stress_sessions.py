@@ -0,0 +1,141 @@
+"""
+Concurrency stress test for per-request research sessions.
+
+Runs many ResearchSession instances in parallel threads against a stubbed
+LLM that echoes the agent's prompt back after a random delay, and checks
+that every prompt and response only carries its own query. With the prompt
+builder the query travels in the user message, so the system messages must
+not carry any query at all. MongoDB is replaced by mongomock.
+
+A second case fills admission to its maximum limit with runs whose search
+engines take --engine-seconds each, and checks that no engine of an
+admitted run times out waiting for a fan-out worker.
+
+Run from the backend directory (needs requirements.txt and requirements-dev.txt installed):
+    python benchmarks/stress_sessions.py --requests 200 --threads 32
+    python benchmarks/stress_sessions.py --engine-seconds 1 --engine-deadline 3
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("MONGODB_URI", "mongodb://localhost:27017")
+os.environ.setdefault("QUERY_CACHE_BACKEND", "off")
+
+import mongomock
+from phi.agent import Agent, RunResponse
+
+import storage
+
+storage.create_mongo_client = lambda uri: mongomock.MongoClient()
+
+import app
+
+# (system message, user message) of every stubbed model call
+prompts = []
+prompts_lock = threading.Lock()
+# Seconds a stubbed search engine takes in the fan-out case
+engine_seconds = 0.0
+
+
+def query_tokens(text):
+    return {t.strip(".,:;\"'") for t in text.split() if "stress-query-" in t}
+
+
+def fake_run(self, message=None, stream=False, **kwargs):
+    """Stand-in for Agent.run: echo the prompt after a random delay"""
+    time.sleep(random.uniform(0.001, 0.02))
+    if engine_seconds and not isinstance(self, app.AlwaysSearchAgent):
+        time.sleep(engine_seconds)
+        return RunResponse(content=f"Search results for {message}")
+    with prompts_lock:
+        prompts.append((str(self.system_message or ""), str(message or "")))
+    return RunResponse(content=f"SYSTEM: {self.system_message}\nMESSAGE: {message}")
+
+
+def run_one(index):
+    token = f"stress-query-{index:05d}"
+    response = app.run_research(f"Tell me about {token} University", stream=False)
+    tokens = query_tokens(response.content)
+    return token in tokens, tokens - {token}
+
+
+def run_admitted(index):
+    """One run admitted like a request; the statuses of its fan-out engines"""
+    query = f"Tell me about fanout-stress-{index:05d} University"
+    query_class = app.classify(query)
+    session = app.ResearchSession(query, query_class)
+    with app.admission.admit(None, app.pipeline_key(query_class)):
+        session.run(stream=False)
+    return [result.status for result in session.engine_results or []]
+
+
+def fanout_stress(seconds, deadline):
+    """Run as many runs as admission allows at once; count engines that timed out"""
+    global engine_seconds
+    engine_seconds = seconds
+    app.fanout_executor.default_deadline = deadline
+    app.fanout_executor.deadlines = {}
+    # The worst case: the adaptive limit has grown to its maximum
+    runs = app.admission.max_limit
+    app.admission.limit = float(runs)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=runs) as pool:
+        statuses = [status for run in pool.map(run_admitted, range(runs)) for status in run]
+    elapsed = time.perf_counter() - start
+    timeouts = statuses.count("timeout")
+    print(f"{runs} admitted runs, {len(statuses)} engines of {engine_seconds}s "
+          f"on {app.fanout_executor.pool._max_workers} fan-out workers in {elapsed:.2f}s")
+    print(f"engines timed out (deadline {deadline}s): {timeouts}")
+    return timeouts
+
+
+def bad_prompts():
+    """Prompts whose user message is not about exactly one query, or whose
+    system message carries a query the user message does not"""
+    bad = 0
+    for system, message in prompts:
+        asked = query_tokens(message)
+        in_system = query_tokens(system)
+        if len(asked) != 1 or not in_system <= asked or (app.PROMPT_BUILDER and in_system):
+            bad += 1
+    return bad
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--engine-seconds", type=float, default=0.5,
+                        help="search engine time in the fan-out case (0 skips it)")
+    parser.add_argument("--engine-deadline", type=float, default=2.0,
+                        help="fan-out deadline of every engine in the fan-out case")
+    args = parser.parse_args()
+
+    Agent.run = fake_run
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as pool:
+        results = list(pool.map(run_one, range(args.requests)))
+    elapsed = time.perf_counter() - start
+
+    missing = sum(1 for found, _ in results if not found)
+    leaks = sum(1 for _, leaked in results if leaked)
+    bad = bad_prompts()
+    print(f"{args.requests} requests on {args.threads} threads in {elapsed:.2f}s")
+    print(f"responses missing their own query: {missing}")
+    print(f"responses containing another request's query: {leaks}")
+    print(f"model prompts with a wrong or misplaced query: {bad} of {len(prompts)}")
+
+    timeouts = fanout_stress(args.engine_seconds, args.engine_deadline) if args.engine_seconds else 0
+    sys.exit(1 if missing or leaks or bad or timeouts else 0)
+
+
+if __name__ == "__main__":
+    main()
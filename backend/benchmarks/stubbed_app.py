@@ -0,0 +1,49 @@
+"""
+The backend with its agent pipeline replaced by a stub that waits like a
+real run (LLM, search and crawl latency) without touching the network.
+MongoDB is replaced by mongomock (requirements-dev.txt). Used as the server
+under test by the load-test harnesses.
+
+Run from the benchmarks directory:
+    gunicorn -w 1 -k gthread --threads 8 stubbed_app:app
+    uvicorn stubbed_app:application
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+os.environ.setdefault("MONGODB_URI", "mongodb://localhost:27017")
+os.environ.setdefault("QUERY_CACHE_BACKEND", "off")
+
+import mongomock
+from phi.agent import RunResponse
+
+import storage
+
+storage.create_mongo_client = lambda uri: mongomock.MongoClient()
+
+import app as backend
+
+STUB_AGENT_SECONDS = float(os.getenv("STUB_AGENT_SECONDS", "5"))
+STUB_CHUNKS = int(os.getenv("STUB_CHUNKS", "20"))
+
+
+def stub_run_research(query, stream=False, query_class=None):
+    if not stream:
+        time.sleep(STUB_AGENT_SECONDS)
+        return RunResponse(content=f"Stubbed answer for {query}")
+
+    def chunks():
+        # Most of a run is spent waiting before the first token arrives
+        time.sleep(STUB_AGENT_SECONDS * 0.8)
+        for i in range(STUB_CHUNKS):
+            time.sleep(STUB_AGENT_SECONDS * 0.2 / STUB_CHUNKS)
+            yield f"Paragraph {i} about {query}.\n\n"
+    return chunks()
+
+
+backend.run_research = stub_run_research
+app = backend.app
+
+from asgi import application
@@ -0,0 +1,184 @@
+import hashlib
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from datetime import datetime
+
+from bson import Binary
+from pymongo import UpdateOne
+
+try:
+    import zstandard
+except ImportError:  # zlib is used when the zstandard package is not installed
+    zstandard = None
+
+ZLIB_LEVEL = int(os.getenv("BODY_ZLIB_LEVEL", "6"))
+ZSTD_LEVEL = int(os.getenv("BODY_ZSTD_LEVEL", "9"))
+# Decompressed bodies kept in memory; bodies never change once stored
+BODY_CACHE_MAX_BYTES = int(os.getenv("BODY_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+
+def content_hash(content):
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def compress_body(content, codec=None):
+    """Returns (codec, compressed bytes); zstd when available, zlib otherwise"""
+    raw = content.encode("utf-8")
+    codec = codec or ("zstd" if zstandard else "zlib")
+    if codec == "zstd":
+        return codec, zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(raw)
+    return "zlib", zlib.compress(raw, ZLIB_LEVEL)
+
+
+def decompress_body(codec, data):
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Body is zstd-compressed but the zstandard package is not installed")
+        return zstandard.ZstdDecompressor().decompress(data).decode("utf-8")
+    if codec == "zlib":
+        return zlib.decompress(data).decode("utf-8")
+    raise ValueError(f"Unknown body codec: {codec}")
+
+
+class BodyStore:
+    """
+    Content-addressed, compressed storage of saved response bodies.
+    Each distinct body is stored once under its SHA-256, with a reference
+    count; search results hold the hash in `contentRef` instead of the text.
+    """
+
+    def __init__(self, collection, cache_max_bytes=BODY_CACHE_MAX_BYTES):
+        self.collection = collection
+        self.cache_max_bytes = cache_max_bytes
+        self._cache = OrderedDict()
+        self._cache_bytes = 0
+        self._lock = threading.Lock()
+        self.stored = 0
+        self.deduplicated = 0
+        self.raw_bytes = 0
+        self.stored_bytes = 0
+
+    def put_many(self, contents):
+        """
+        Store bodies (or add a reference to already stored ones) and return
+        their hashes. Every upsert carries the body in $setOnInsert, so a body
+        deleted by a concurrent release() in between is stored again whole.
+        """
+        hashes = [content_hash(content) for content in contents]
+        unique = dict(zip(hashes, contents))
+
+        references = {}
+        for body_hash in hashes:
+            references[body_hash] = references.get(body_hash, 0) + 1
+
+        operations = []
+        sizes = {}
+        raw_bytes = 0
+        for body_hash, count in references.items():
+            content = unique[body_hash]
+            size = len(content.encode("utf-8"))
+            raw_bytes += size * count
+            codec, data = compress_body(content)
+            sizes[body_hash] = len(data)
+            operations.append(UpdateOne({"_id": body_hash}, {
+                "$inc": {"refCount": count},
+                "$setOnInsert": {
+                    "codec": codec,
+                    "data": Binary(data),
+                    "size": size,
+                    "storedSize": len(data),
+                    "createdAt": datetime.utcnow(),
+                },
+            }, upsert=True))
+        upserted = {}
+        if operations:
+            upserted = self.collection.bulk_write(operations, ordered=False).upserted_ids or {}
+
+        new = len(upserted)
+        with self._lock:
+            self.stored += new
+            self.deduplicated += len(hashes) - new
+            self.raw_bytes += raw_bytes
+            self.stored_bytes += sum(sizes[body_hash] for body_hash in upserted.values())
+        return hashes
+
+    def externalize(self, docs):
+        """Replace the `content` of search result documents with a `contentRef`"""
+        pending = [doc for doc in docs if "content" in doc and isinstance(doc["content"], str)]
+        if not pending:
+            return docs
+        for doc, body_hash in zip(pending, self.put_many([doc["content"] for doc in pending])):
+            del doc["content"]
+            doc["contentRef"] = body_hash
+        return docs
+
+    def get_many(self, hashes):
+        """{hash: content} for the given hashes; missing bodies are left out"""
+        found = {}
+        with self._lock:
+            for body_hash in hashes:
+                if body_hash in self._cache:
+                    self._cache.move_to_end(body_hash)
+                    found[body_hash] = self._cache[body_hash]
+
+        missing = [body_hash for body_hash in set(hashes) if body_hash not in found]
+        if missing:
+            for doc in self.collection.find({"_id": {"$in": missing}}, {"codec": 1, "data": 1}):
+                content = decompress_body(doc["codec"], bytes(doc["data"]))
+                found[doc["_id"]] = content
+                self._remember(doc["_id"], content)
+        return found
+
+    def inline(self, docs):
+        """Put the content back into search result documents that hold a reference"""
+        refs = [doc["contentRef"] for doc in docs if doc and "contentRef" in doc]
+        if not refs:
+            return docs
+        bodies = self.get_many(refs)
+        for doc in docs:
+            if doc and "contentRef" in doc:
+                doc["content"] = bodies.get(doc.pop("contentRef"), "")
+        return docs
+
+    def release_refs(self, docs):
+        """Drop the references of externalized documents that were never written"""
+        for doc in docs:
+            self.release(doc.get("contentRef"))
+
+    def release(self, body_hash):
+        """Drop one reference; the body is deleted with its last reference"""
+        if not body_hash:
+            return
+        self.collection.update_one({"_id": body_hash}, {"$inc": {"refCount": -1}})
+        result = self.collection.delete_one({"_id": body_hash, "refCount": {"$lte": 0}})
+        if result.deleted_count:
+            with self._lock:
+                content = self._cache.pop(body_hash, None)
+                if content is not None:
+                    self._cache_bytes -= len(content)
+
+    def stats(self):
+        """Counters of this process: new bodies stored, references to existing ones, bytes saved"""
+        with self._lock:
+            return {
+                "codec": "zstd" if zstandard else "zlib",
+                "stored": self.stored,
+                "deduplicated": self.deduplicated,
+                "rawBytes": self.raw_bytes,
+                "storedBytes": self.stored_bytes,
+                "cachedBodies": len(self._cache),
+            }
+
+    def _remember(self, body_hash, content):
+        if len(content) > self.cache_max_bytes:
+            return
+        with self._lock:
+            if body_hash in self._cache:
+                return
+            self._cache[body_hash] = content
+            self._cache_bytes += len(content)
+            while self._cache_bytes > self.cache_max_bytes:
+                _, evicted = self._cache.popitem(last=False)
+                self._cache_bytes -= len(evicted)
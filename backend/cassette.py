@@ -0,0 +1,140 @@
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+
+# "record" runs the real tools and appends every call to TOOL_CASSETTE,
+# "replay" answers tool calls from it without touching the network
+TOOL_CASSETTE_MODE = os.getenv("TOOL_CASSETTE_MODE", "off")
+TOOL_CASSETTE = os.getenv("TOOL_CASSETTE", "tool_cassette.jsonl")
+# Replayed calls take their recorded time multiplied by this (0 = no delay,
+# 1 = original timing)
+TOOL_CASSETTE_TIMING = float(os.getenv("TOOL_CASSETTE_TIMING", "0"))
+
+
+def call_key(tool, arguments):
+    return tool + " " + json.dumps(arguments, sort_keys=True, default=str)
+
+
+class Cassette:
+    """
+    Record/replay layer for tool traffic. Each call is one JSONL line with
+    the tool name, its arguments, the output (or error), its size in bytes
+    and how long it took. Replay answers calls with the same tool and
+    arguments in recorded order, repeating the last recording once they run
+    out; calls that were never recorded get a "no result" output.
+    """
+
+    def __init__(self, path=TOOL_CASSETTE, mode=TOOL_CASSETTE_MODE, timing=TOOL_CASSETTE_TIMING):
+        self.path = path
+        self.mode = mode
+        self.timing = timing
+        self.recorded = 0
+        self.replayed = 0
+        self.misses = 0
+        self.bytes = 0
+        self.recorded_seconds = 0.0
+        self._calls = {}  # call key -> deque of recordings not replayed yet
+        self._last = {}  # call key -> last recording
+        self._lock = threading.Lock()
+        if mode == "replay":
+            self._load()
+        elif mode not in ("off", "record"):
+            print(f"Unknown TOOL_CASSETTE_MODE {mode}, tool calls are not recorded")
+            self.mode = "off"
+
+    @property
+    def enabled(self):
+        return self.mode != "off"
+
+    def instrument(self, toolkit):
+        """
+        Route a toolkit's calls through the cassette. Crawlers with a page
+        cache (fetch_page) are wrapped below the cache, so caching still runs
+        on replay; other toolkits have every function entrypoint wrapped.
+        """
+        if not self.enabled:
+            return toolkit
+        if hasattr(toolkit, "fetch_page"):
+            toolkit.fetch_page = self.wrap("web_crawler", toolkit.fetch_page)
+        else:
+            for name, function in toolkit.functions.items():
+                function.entrypoint = self.wrap(name, function.entrypoint)
+        return toolkit
+
+    def wrap(self, tool, fn):
+        @functools.wraps(fn)
+        def call(*args, **kwargs):
+            arguments = dict(kwargs)
+            if args:
+                arguments["args"] = list(args)
+            if self.mode == "replay":
+                return self._replay(tool, arguments)
+            return self._record(tool, arguments, fn, args, kwargs)
+        return call
+
+    def stats(self):
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "recorded": self.recorded,
+                "replayed": self.replayed,
+                "misses": self.misses,
+                "bytes": self.bytes,
+                "recordedSeconds": round(self.recorded_seconds, 2),
+            }
+
+    def _record(self, tool, arguments, fn, args, kwargs):
+        started = time.perf_counter()
+        entry = {"tool": tool, "arguments": arguments}
+        try:
+            output = fn(*args, **kwargs)
+            entry["output"] = output
+            return output
+        except Exception as e:
+            entry["error"] = str(e)
+            raise
+        finally:
+            entry["seconds"] = round(time.perf_counter() - started, 4)
+            entry["bytes"] = len(str(entry.get("output") or "").encode("utf-8"))
+            line = json.dumps(entry, default=str)
+            with self._lock:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+                self.recorded += 1
+                self.bytes += entry["bytes"]
+                self.recorded_seconds += entry["seconds"]
+
+    def _replay(self, tool, arguments):
+        key = call_key(tool, arguments)
+        with self._lock:
+            queue = self._calls.get(key)
+            entry = queue.popleft() if queue else self._last.get(key)
+            if entry is None:
+                self.misses += 1
+            else:
+                self.replayed += 1
+                self.bytes += entry.get("bytes", 0)
+        if entry is None:
+            print(f"No recorded result for {tool} {json.dumps(arguments, default=str)}")
+            return "No result"
+        if self.timing > 0:
+            time.sleep(entry.get("seconds", 0) * self.timing)
+        if "error" in entry:
+            raise RuntimeError(entry["error"])
+        return entry.get("output")
+
+    def _load(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    entry = json.loads(line)
+                    key = call_key(entry["tool"], entry.get("arguments") or {})
+                    self._calls.setdefault(key, deque()).append(entry)
+                    self._last[key] = entry
+        except FileNotFoundError:
+            print(f"Tool cassette {self.path} not found; every tool call will miss")
@@ -0,0 +1,232 @@
+import contextvars
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Optional
+
+from phi.tools.crawl4ai_tools import Crawl4aiTools
+
+from tracing import span
+
+CRAWL_CACHE_TTL = int(os.getenv("CRAWL_CACHE_TTL", "86400"))
+CRAWL_CACHE_MAX_PAGES = int(os.getenv("CRAWL_CACHE_MAX_PAGES", "500"))
+# Upper bound on what a single crawl may put into the LLM context
+CRAWL_MAX_PAGE_BYTES = int(os.getenv("CRAWL_MAX_PAGE_BYTES", "20000"))
+# Upper bound on crawled text across all agents working on one query
+CRAWL_MAX_QUERY_BYTES = int(os.getenv("CRAWL_MAX_QUERY_BYTES", "120000"))
+
+# Words that make a page section worth keeping for the tables the prompts ask for
+FIELD_TERMS = [
+    "contact", "phone", "email", "address", "website", "founded", "established",
+    "headquarters", "location", "news", "press", "announcement", "award", "achievement",
+    "admission", "tuition", "fees", "enrollment", "students", "programs", "accreditation",
+    "placement", "campus", "facilities", "revenue", "employees", "salary", "careers",
+    "products", "services", "industry",
+]
+
+STOPWORDS = {
+    "the", "and", "for", "with", "about", "what", "which", "who", "are", "is", "of", "in",
+    "on", "to", "me", "tell", "give", "information", "details", "list", "best", "top",
+}
+
+_word = re.compile(r"[a-z0-9]+")
+_section_split = re.compile(r"\n(?=#{1,6} )|\n\s*\n")
+
+_current_budget = contextvars.ContextVar("crawl_budget", default=None)
+
+
+class CrawlCache:
+    """
+    URL-keyed page cache. Page bodies are stored once per content hash so
+    mirrors and redirects to the same page share one copy.
+    """
+
+    def __init__(self, ttl=CRAWL_CACHE_TTL, max_pages=CRAWL_CACHE_MAX_PAGES):
+        self.ttl = ttl
+        self.max_pages = max_pages
+        self._urls = OrderedDict()  # url -> (content hash, fetched at)
+        self._bodies = {}  # content hash -> [content, reference count]
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bytes_fetched = 0
+
+    def get(self, url):
+        with self._lock:
+            entry = self._urls.get(url)
+            if entry is None or entry[1] + self.ttl < time.time():
+                if entry is not None:
+                    self._drop(url)
+                self.misses += 1
+                return None
+            self._urls.move_to_end(url)
+            self.hits += 1
+            return self._bodies[entry[0]][0]
+
+    def peek(self, url):
+        """Cached page of a URL, if fresh, without counting a hit or miss or touching the LRU order"""
+        with self._lock:
+            entry = self._urls.get(url)
+            if entry is None or entry[1] + self.ttl < time.time():
+                return None
+            return self._bodies[entry[0]][0]
+
+    def put(self, url, content):
+        digest = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        with self._lock:
+            self.bytes_fetched += len(content.encode("utf-8"))
+            if url in self._urls:
+                self._drop(url)
+            body = self._bodies.setdefault(digest, [content, 0])
+            body[1] += 1
+            self._urls[url] = (digest, time.time())
+            while len(self._urls) > self.max_pages:
+                self._drop(next(iter(self._urls)))
+
+    def _drop(self, url):
+        digest, _ = self._urls.pop(url)
+        body = self._bodies[digest]
+        body[1] -= 1
+        if body[1] <= 0:
+            del self._bodies[digest]
+
+    def stats(self):
+        return {
+            "pages": len(self._urls),
+            "uniqueBodies": len(self._bodies),
+            "hits": self.hits,
+            "misses": self.misses,
+            "bytesFetched": self.bytes_fetched,
+        }
+
+
+class QueryBudget:
+    """Byte budget for everything crawled on behalf of one query"""
+
+    def __init__(self, query, max_bytes=CRAWL_MAX_QUERY_BYTES):
+        self.terms = [w for w in _word.findall(query.lower()) if len(w) > 2 and w not in STOPWORDS]
+        self.max_bytes = max_bytes
+        self.used = 0
+        self._lock = threading.Lock()
+
+    def remaining(self):
+        return max(0, self.max_bytes - self.used)
+
+    def reserve(self, limit):
+        """Take up to limit bytes from the budget at once; returns the bytes granted"""
+        with self._lock:
+            granted = max(0, min(limit, self.max_bytes - self.used))
+            self.used += granted
+            return granted
+
+    def refund(self, size):
+        """Give back the part of a reservation that was not used"""
+        if size > 0:
+            with self._lock:
+                self.used -= size
+
+
+@contextmanager
+def crawl_budget(query, max_bytes=CRAWL_MAX_QUERY_BYTES):
+    """Attach a per-query crawl budget to the current context"""
+    token = _current_budget.set(QueryBudget(query, max_bytes))
+    try:
+        yield
+    finally:
+        _current_budget.reset(token)
+
+
+def extract_relevant(content, terms, max_bytes):
+    """
+    Keep the page sections that mention the query or the table fields,
+    in page order, until max_bytes is reached.
+    """
+    if len(content.encode("utf-8")) <= max_bytes:
+        return content
+
+    sections = [s.strip() for s in _section_split.split(content) if s.strip()]
+    wanted = set(terms) | set(FIELD_TERMS)
+    query_terms = set(terms)
+
+    scored = []
+    for index, section in enumerate(sections):
+        words = _word.findall(section.lower())
+        # Query words count more than generic field words
+        score = sum(3 if w in query_terms else 1 for w in words if w in wanted)
+        if score:
+            scored.append((score, index))
+
+    if not scored:
+        return content.encode("utf-8")[:max_bytes].decode("utf-8", "ignore")
+
+    ranked = sorted(scored, key=lambda item: (-item[0], item[1]))
+    chosen = []
+    used = 0
+    for score, index in ranked:
+        size = len(sections[index].encode("utf-8")) + 2
+        if used + size > max_bytes:
+            continue
+        chosen.append(index)
+        used += size
+
+    if not chosen:
+        best = sections[ranked[0][1]]
+        return best.encode("utf-8")[:max_bytes].decode("utf-8", "ignore")
+
+    return "\n\n".join(sections[index] for index in sorted(chosen))
+
+
+class SharedCrawl4aiTools(Crawl4aiTools):
+    """Crawl4aiTools backed by a shared page cache and per-page/per-query byte budgets"""
+
+    def __init__(self, cache, max_page_bytes=CRAWL_MAX_PAGE_BYTES):
+        self.cache = cache
+        self.max_page_bytes = max_page_bytes
+        super().__init__(max_length=None)
+
+    def web_crawler(self, url: str, max_length: Optional[int] = None) -> str:
+        """
+        Crawls a website and returns the sections relevant to the current query.
+        :param url: The URL to crawl.
+        :param max_length: The maximum length of the result.
+        :return: The relevant content of the page.
+        """
+        if url is None:
+            return "No URL provided"
+
+        budget = _current_budget.get()
+        limit = self.max_page_bytes
+        if max_length:
+            limit = min(limit, max_length)
+        if budget is not None:
+            # Engines crawl concurrently, so the bytes are reserved up front
+            # and whatever the page does not use is refunded afterwards
+            limit = budget.reserve(limit)
+            if limit <= 0:
+                return "Crawl budget for this query is exhausted. Use the information already gathered."
+
+        size = 0
+        try:
+            with span("crawl") as current:
+                page = self.cache.get(url)
+                current.set(cacheHit=page is not None)
+                if page is None:
+                    page = self.fetch_page(url=url)
+                    if page and page != "No result":
+                        self.cache.put(url, page)
+
+                text = extract_relevant(page or "", budget.terms if budget else [], limit)
+                size = len(text.encode("utf-8"))
+                current.set(bytes=size)
+        finally:
+            if budget is not None:
+                budget.refund(limit - size)
+        return text
+
+    def fetch_page(self, url):
+        """The whole page from the network (the tool cassette replaces this on replay)"""
+        return super().web_crawler(url, max_length=None)
@@ -0,0 +1,352 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from reuse import entity_keys, query_words
+from tables import SCHEMAS, TableParser, cell_text, classify_headers, convert_value, is_missing, is_separator, split_row
+
+DAY = 86400
+
+# Seconds a stored field stays fresh. Founding years and names hardly ever
+# change, news is stale after days.
+FIELD_TTLS = {
+    "name": 365 * DAY,
+    "established_year": 365 * DAY,
+    "founded_year": 365 * DAY,
+    "type": 180 * DAY,
+    "location": 180 * DAY,
+    "headquarters": 180 * DAY,
+    "industry": 180 * DAY,
+    "website": 90 * DAY,
+    "accreditation": 90 * DAY,
+    "top_programs": 90 * DAY,
+    "facilities": 90 * DAY,
+    "products": 90 * DAY,
+    "top_job_roles": 90 * DAY,
+    "contact": 30 * DAY,
+    "enrollment": 30 * DAY,
+    "tuition_fees": 30 * DAY,
+    "placement_rate": 30 * DAY,
+    "employees": 30 * DAY,
+    "annual_revenue": 30 * DAY,
+    "salary_range": 30 * DAY,
+    "culture_rating": 30 * DAY,
+    "achievements": 3 * DAY,
+    "recent_news": 3 * DAY,
+}
+DEFAULT_FIELD_TTL = 30 * DAY
+
+_parenthetical = re.compile(r"\([^)]*\)")
+_sources_heading = re.compile(r"^\s*(?:#+\s*|\*\*\s*)?(?:mandatory\s+)?sources?\b", re.IGNORECASE)
+_heading = re.compile(r"^\s*(?:#+\s|\*\*[^*]+\*\*\s*:?\s*$)")
+_source_line = re.compile(r"^\s*(?:[-*]\s*)?\[?(?:source\s*)?(\d+)\]?[.):\]]?\s+(.*)$", re.IGNORECASE)
+_source_url = re.compile(r"https?://[^\s)\]>|\"']+")
+# Annotation of a value taken from the store, in a filled cell or copied from known information
+_retrieved_note = re.compile(r"\((?:\[source\]\([^)]*\),\s*|source:\s*\S+,\s*)?retrieved \d{4}-\d{2}-\d{2}\)")
+
+
+def parse_field_ttls(spec):
+    """Parse "recent_news=86400,contact=604800" into {"recent_news": 86400.0, "contact": 604800.0}"""
+    ttls = {}
+    for item in (spec or "").split(","):
+        if "=" not in item:
+            continue
+        field, seconds = item.split("=", 1)
+        try:
+            ttls[field.strip().lower()] = float(seconds)
+        except ValueError:
+            print(f"Ignoring invalid entity field TTL: {item}")
+    return ttls
+
+
+def field_ttls(spec=None):
+    """FIELD_TTLS with the overrides of ENTITY_FIELD_TTLS"""
+    ttls = dict(FIELD_TTLS)
+    ttls.update(parse_field_ttls(os.getenv("ENTITY_FIELD_TTLS", "") if spec is None else spec))
+    return ttls
+
+
+def canonical_key(name):
+    """Store key of an entity: its normalised name without parentheticals"""
+    words = query_words(_parenthetical.sub(" ", name or ""))
+    return " ".join(words) if words else " ".join(query_words(name or ""))
+
+
+def parse_sources(text):
+    """{source number: URL} from the numbered Sources section of an answer"""
+    sources = {}
+    in_sources = False
+    for line in (text or "").split("\n"):
+        if _sources_heading.match(line):
+            in_sources = True
+            continue
+        if not in_sources:
+            continue
+        if _heading.match(line):
+            in_sources = False
+            continue
+        match = _source_line.match(line)
+        if match:
+            url = _source_url.search(match.group(2))
+            if url:
+                sources.setdefault(int(match.group(1)), url.group(0).rstrip(".,;"))
+    return sources
+
+
+class StoredField:
+    def __init__(self, value, text, source_url, retrieved_at, expires_at):
+        self.value = value
+        self.text = text
+        self.source_url = source_url
+        self.retrieved_at = retrieved_at
+        self.expires_at = expires_at
+
+    def fresh(self, now=None):
+        return self.expires_at > (now or time.time())
+
+    def retrieved_date(self):
+        return datetime.utcfromtimestamp(self.retrieved_at).strftime("%Y-%m-%d")
+
+
+class StoredEntity:
+    def __init__(self, key, kind, name, fields, aliases=()):
+        self.key = key
+        self.kind = kind
+        self.name = name
+        self.fields = fields  # field -> StoredField
+        self.aliases = set(aliases)
+
+    def fresh_fields(self, now=None):
+        return {field: stored for field, stored in self.fields.items() if stored.fresh(now)}
+
+    def stale_fields(self, now=None):
+        """Fields of the entity's schema that are missing or past their TTL"""
+        now = now or time.time()
+        return [field for field in SCHEMAS[self.kind]
+                if field != "name" and (field not in self.fields or not self.fields[field].fresh(now))]
+
+
+class EntityStore:
+    """
+    Local store of institution and company facts keyed by canonical entity
+    name. Every field keeps its value, the source URL it was cited from, when
+    it was retrieved and when it goes stale (per-field TTLs). Answers are
+    ingested as they are produced; an unchanged value that is still fresh
+    keeps its original retrieval date, so copying known facts into a new
+    answer does not make them look newly verified.
+    """
+
+    def __init__(self, db_file="agents.db", ttls=None):
+        self.ttls = ttls if ttls is not None else field_ttls()
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_file, check_same_thread=False)
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS entities ("
+            "key TEXT PRIMARY KEY, kind TEXT NOT NULL, name TEXT NOT NULL, updated_at REAL NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS entity_aliases (alias TEXT PRIMARY KEY, key TEXT NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS entity_fields ("
+            "key TEXT NOT NULL, field TEXT NOT NULL, value TEXT NOT NULL, text TEXT NOT NULL, source_url TEXT, "
+            "retrieved_at REAL NOT NULL, expires_at REAL NOT NULL, PRIMARY KEY (key, field));"
+        )
+        self._conn.commit()
+        self.ingested = 0
+        self.fields_written = 0
+        self.fields_kept = 0
+        self.filled = 0
+
+    def ttl(self, field):
+        return self.ttls.get(field, DEFAULT_FIELD_TTL)
+
+    def ingest(self, text, retrieved_at=None):
+        """Store the institution and company table rows of an answer; returns the entities seen"""
+        parser = TableParser()
+        parser.feed(text or "")
+        parser.flush()
+        sources = parse_sources(text)
+        now = retrieved_at or time.time()
+
+        rows = []
+        for table in parser.tables:
+            kind = table.entity_kind()
+            if kind is None:
+                continue
+            schema = SCHEMAS[kind]
+            for values in table.values():
+                name = cell_text(values.get("name"))
+                if is_missing(values.get("name")) or not canonical_key(name):
+                    continue
+                fields = {}
+                for field, raw in values.items():
+                    if field == "name" or _retrieved_note.search(raw or ""):
+                        # Stored values repeated in the answer were not retrieved again
+                        continue
+                    value, cited = convert_value(raw, schema[field][0])
+                    if value is None:
+                        continue
+                    source = next((sources[number] for number in cited if number in sources), None)
+                    if source is None and field == "website":
+                        source = value
+                    fields[field] = (value, cell_text(raw), source)
+                rows.append((kind, name, fields))
+        if not rows:
+            return []
+
+        with self._lock:
+            for kind, name, fields in rows:
+                self._upsert(kind, name, fields, now)
+            self._conn.commit()
+            self.ingested += 1
+        return [name for _, name, _ in rows]
+
+    def _upsert(self, kind, name, fields, now):
+        key = canonical_key(name)
+        self._conn.execute(
+            "INSERT INTO entities (key, kind, name, updated_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET name = excluded.name, updated_at = excluded.updated_at",
+            (key, kind, name, now),
+        )
+        for alias in entity_keys(name) | {key}:
+            self._conn.execute("INSERT OR REPLACE INTO entity_aliases (alias, key) VALUES (?, ?)", (alias, key))
+
+        existing = {
+            field: (value, expires_at)
+            for field, value, expires_at in self._conn.execute(
+                "SELECT field, value, expires_at FROM entity_fields WHERE key = ?", (key,))
+        }
+        for field, (value, text, source) in fields.items():
+            encoded = json.dumps(value)
+            current = existing.get(field)
+            if current is not None and current[0] == encoded and current[1] > now:
+                self.fields_kept += 1
+                continue
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entity_fields (key, field, value, text, source_url, retrieved_at, expires_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, field, encoded, text, source, now, now + self.ttl(field)),
+            )
+            self.fields_written += 1
+
+    def get(self, name):
+        """The stored entity for a name or alias, or None"""
+        found = self.match(entity_keys(name) | {canonical_key(name)})
+        return found[0] if found else None
+
+    def match(self, keys):
+        """Stored entities whose name or alias is one of keys (e.g. the n-grams of a query)"""
+        keys = [key for key in keys if key]
+        if not keys:
+            return []
+        with self._lock:
+            aliases = {}
+            for start in range(0, len(keys), 500):
+                part = keys[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT alias, key FROM entity_aliases WHERE alias IN ({','.join('?' * len(part))})", part)
+                for alias, key in rows:
+                    aliases.setdefault(key, set()).add(alias)
+            entities = []
+            for key, matched in aliases.items():
+                row = self._conn.execute("SELECT kind, name FROM entities WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    continue
+                fields = {
+                    field: StoredField(json.loads(value), text, source_url, retrieved_at, expires_at)
+                    for field, value, text, source_url, retrieved_at, expires_at in self._conn.execute(
+                        "SELECT field, value, text, source_url, retrieved_at, expires_at "
+                        "FROM entity_fields WHERE key = ?", (key,))
+                }
+                all_aliases = {alias for (alias,) in self._conn.execute(
+                    "SELECT alias FROM entity_aliases WHERE key = ?", (key,))}
+                entities.append(StoredEntity(key, row[0], row[1], fields, all_aliases | matched))
+        return entities
+
+    def count_filled(self, cells):
+        with self._lock:
+            self.filled += cells
+
+    def stats(self):
+        now = time.time()
+        with self._lock:
+            entities = self._conn.execute("SELECT COUNT(*) FROM entities").fetchone()[0]
+            fresh, stale = self._conn.execute(
+                "SELECT COALESCE(SUM(expires_at > ?), 0), COALESCE(SUM(expires_at <= ?), 0) FROM entity_fields",
+                (now, now)).fetchone()
+        return {
+            "entities": entities,
+            "freshFields": fresh,
+            "staleFields": stale,
+            "answersIngested": self.ingested,
+            "fieldsWritten": self.fields_written,
+            "fieldsKept": self.fields_kept,
+            "cellsFilled": self.filled,
+        }
+
+
+class TableFiller:
+    """
+    Fills "Data not available" cells of institution and company tables with
+    fresh values from the store, citing where and when they were retrieved.
+    Text can be given in line-complete pieces (stream chunks); table state
+    is kept across pieces.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._header = None
+        self._fields = None
+        self._entities = {}
+
+    def fill(self, text):
+        if not text:
+            return text
+        if "|" not in text:
+            if text.strip():
+                self._header = self._fields = None
+            return text
+        return "\n".join(self._line(line) for line in text.split("\n"))
+
+    def _line(self, line):
+        stripped = line.strip()
+        if not stripped.startswith("|"):
+            if stripped:
+                self._header = self._fields = None
+            return line
+        if self._fields is None:
+            if self._header is not None and is_separator(stripped):
+                kind, fields = classify_headers(self._header)
+                self._fields = (kind, fields) if kind and "name" in fields else None
+                self._header = None
+            else:
+                self._header = split_row(stripped)
+            return line
+
+        kind, fields = self._fields
+        cells = split_row(stripped)
+        name_index = fields.index("name")
+        if name_index >= len(cells) or is_missing(cells[name_index]):
+            return line
+        entity = self._entity(cell_text(cells[name_index]))
+        if entity is None or entity.kind != kind:
+            return line
+
+        now = time.time()
+        filled = 0
+        for i, field in enumerate(fields):
+            stored = entity.fields.get(field) if field and field != "name" else None
+            if i < len(cells) and stored is not None and stored.fresh(now) and is_missing(cells[i]):
+                cite = f"[source]({stored.source_url}), " if stored.source_url else ""
+                cells[i] = f"{stored.text} ({cite}retrieved {stored.retrieved_date()})"
+                filled += 1
+        if not filled:
+            return line
+        self.store.count_filled(filled)
+        return "| " + " | ".join(cells) + " |"
+
+    def _entity(self, name):
+        if name not in self._entities:
+            self._entities[name] = self.store.get(name)
+        return self._entities[name]
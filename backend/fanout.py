@@ -0,0 +1,183 @@
+import contextvars
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from tracing import span
+
+# Seconds each search engine gets before its results are dropped from the merge
+DEFAULT_DEADLINE = float(os.getenv("FANOUT_DEFAULT_DEADLINE", "60"))
+# Fan-out worker threads; 0 sizes the pool for the admitted runs (fanout_workers)
+FANOUT_MAX_WORKERS = int(os.getenv("FANOUT_MAX_WORKERS", "0"))
+
+_url_pattern = re.compile(r"https?://[^\s)\]>|\"']+")
+_key_strip = re.compile(r"[\W_]+")
+
+
+def parse_deadlines(spec):
+    """Parse "google=40,baidu=30" into {"google": 40.0, "baidu": 30.0}"""
+    deadlines = {}
+    for item in (spec or "").split(","):
+        if "=" not in item:
+            continue
+        name, seconds = item.split("=", 1)
+        try:
+            deadlines[name.strip().lower()] = float(seconds)
+        except ValueError:
+            print(f"Ignoring invalid fan-out deadline: {item}")
+    return deadlines
+
+
+def fanout_workers(max_runs, engines_per_run):
+    """
+    Workers for max_runs concurrent runs to start all their engines at once,
+    twice over: an engine abandoned at its deadline keeps its worker until
+    it returns, while its run's slot already went to the next run. Fewer
+    workers make engines of admitted runs queue until their deadline.
+    """
+    return FANOUT_MAX_WORKERS or max_runs * engines_per_run * 2
+
+
+class EngineResult:
+    def __init__(self, name, label, content="", elapsed=0.0, status="ok", error=None, tools=None):
+        self.name = name
+        self.label = label
+        self.content = content
+        self.elapsed = elapsed
+        self.status = status  # "ok", "timeout" or "error"
+        self.error = error
+        self.tools = tools or []  # phi tool call dicts of the engine's run
+
+
+class FanOutExecutor:
+    """
+    Runs several retrieval agents concurrently, each with its own deadline
+    counted from when the engine starts. Agents that miss their deadline are
+    left to finish in the background and their output is discarded; agents
+    still queued for a worker when it passes are cancelled.
+    """
+
+    def __init__(self, deadlines=None, default_deadline=DEFAULT_DEADLINE, max_workers=12):
+        self.deadlines = deadlines or {}
+        self.default_deadline = default_deadline
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="fanout")
+
+    def gather(self, engines, query):
+        """engines: list of (name, label, agent) to run for this query"""
+        submitted = time.monotonic()
+        futures = {}
+        starts = {}
+        for name, label, agent in engines:
+            # Each engine runs in a copy of the caller's context so per-query
+            # state such as the crawl budget is shared with the workers
+            context = contextvars.copy_context()
+            starts[name] = _Start()
+            futures[name] = self.pool.submit(context.run, self._run_engine, name, agent, query, starts[name])
+
+        results = []
+        for name, label, agent in engines:
+            deadline = self.deadlines.get(name, self.default_deadline)
+            future = futures[name]
+            start = starts[name]
+            # A busy pool must not eat into an engine's own deadline, but an
+            # engine that cannot get a worker within it is dropped as well
+            if start.wait(max(0.0, deadline - (time.monotonic() - submitted))):
+                wait([future], timeout=max(0.0, deadline - (time.monotonic() - start.at)))
+            elapsed = time.monotonic() - (start.at or submitted)
+
+            if not future.done():
+                # Only an engine that has not started yet can be cancelled
+                future.cancel()
+                results.append(EngineResult(name, label, elapsed=elapsed, status="timeout"))
+                continue
+            try:
+                content, tools = future.result()
+                results.append(EngineResult(name, label, content, elapsed, tools=tools))
+            except Exception as e:
+                print(f"Fan-out engine {name} failed: {e}")
+                results.append(EngineResult(name, label, elapsed=elapsed, status="error", error=str(e)))
+
+        return results
+
+    @staticmethod
+    def _run_engine(name, agent, query, start):
+        start.mark()
+        with span("search", engine=name) as current:
+            response = agent.run(query, stream=False)
+            content = getattr(response, "content", response)
+            content = content if isinstance(content, str) else str(content or "")
+            current.set(bytes=len(content.encode("utf-8")))
+        return content, getattr(response, "tools", None)
+
+
+class _Start(threading.Event):
+    """Set when a worker picks an engine up; at is its start time"""
+
+    at = None
+
+    def mark(self):
+        self.at = time.monotonic()
+        self.set()
+
+
+def _block_key(block):
+    return _key_strip.sub(" ", block.lower()).strip()
+
+
+def merge_evidence(results):
+    """
+    Merge engine outputs into one de-duplicated evidence document.
+    Paragraphs and table rows already seen from another engine are dropped,
+    and all source URLs are collected into a single list.
+    """
+    seen = set()
+    urls = []
+    seen_urls = set()
+    sections = []
+    missing = []
+
+    for result in results:
+        if result.status != "ok" or not result.content.strip():
+            missing.append(f"{result.label} ({result.status})")
+            continue
+
+        kept = []
+        for block in re.split(r"\n\s*\n", result.content):
+            # Table rows are compared one by one so overlapping tables merge
+            lines = block.strip().split("\n")
+            if lines and all(line.lstrip().startswith("|") for line in lines):
+                # Header and separator stay so the kept rows still form a table
+                header = lines[:2] if len(lines) > 1 and not _block_key(lines[1]) else lines[:1]
+                rows = []
+                for line in lines[len(header):]:
+                    key = _block_key(line)
+                    if key and key not in seen:
+                        seen.add(key)
+                        rows.append(line)
+                if rows:
+                    kept.append("\n".join(header + rows))
+                continue
+
+            key = _block_key(block)
+            if not key or key in seen:
+                continue
+            seen.add(key)
+            kept.append(block.strip())
+
+        for url in _url_pattern.findall(result.content):
+            url = url.rstrip(".,;:")
+            if url not in seen_urls:
+                seen_urls.add(url)
+                urls.append(url)
+
+        if kept:
+            sections.append(f"### Evidence from {result.label} ({result.elapsed:.1f}s)\n\n" + "\n\n".join(kept))
+
+    if urls:
+        sections.append("### Source URLs\n\n" + "\n".join(f"- {url}" for url in urls))
+    if missing:
+        sections.append("### Engines without results\n\n" + "\n".join(f"- {item}" for item in missing))
+
+    return "\n\n".join(sections)
@@ -0,0 +1,137 @@
+import itertools
+import os
+import queue
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+
+from query_cache import normalize_query
+from streaming import EventLog
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+# Finished jobs kept in memory; older ones are only available from MongoDB
+JOB_HISTORY_SIZE = int(os.getenv("JOB_HISTORY_SIZE", "1000"))
+
+
+class Job:
+    def __init__(self, query, user_id=None, priority=0):
+        self.id = uuid.uuid4().hex
+        # Jobs are shared per user; a result is saved under its submitter only
+        self.key = (user_id, normalize_query(query))
+        self.query = query
+        self.user_id = user_id
+        self.priority = priority
+        self.status = "queued"  # queued, running, done or failed
+        self.created_at = datetime.utcnow()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        self.chunks = 0
+        self.log = EventLog()
+
+    def to_dict(self, include_result=True):
+        job = {
+            "jobId": self.id,
+            "query": self.query,
+            "status": self.status,
+            "priority": self.priority,
+            "progress": {"chunks": self.chunks, "events": len(self.log.events)},
+            "createdAt": self.created_at.isoformat(),
+            "startedAt": self.started_at.isoformat() if self.started_at else None,
+            "finishedAt": self.finished_at.isoformat() if self.finished_at else None,
+        }
+        if self.error:
+            job["error"] = self.error
+        if include_result and self.status == "done":
+            job["result"] = self.result
+        return job
+
+
+class JobManager:
+    """
+    Runs research queries on a local worker pool with bounded concurrency.
+    Higher priority jobs are picked first. Submitting a query the same user
+    already has queued or running returns that job instead of starting
+    another. Jobs of different users for the same query are separate, so each
+    result is saved for its own user; their runs still share one agent run
+    through run_events.
+    """
+
+    def __init__(self, run_events, persist=None, workers=JOB_WORKERS, history_size=JOB_HISTORY_SIZE):
+        # run_events(query, user_id) yields the same event payloads as /api/stream
+        self.run_events = run_events
+        self.persist = persist
+        self.history_size = history_size
+        self._jobs = OrderedDict()
+        self._active = {}  # (user id, normalised query) -> in-flight job
+        self._queue = queue.PriorityQueue()
+        self._order = itertools.count()
+        self._lock = threading.Lock()
+        for i in range(workers):
+            threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True).start()
+
+    def submit(self, query, user_id=None, priority=0):
+        """Returns the job and whether it was newly created"""
+        with self._lock:
+            active = self._active.get((user_id, normalize_query(query)))
+            if active is not None:
+                return active, False
+
+            job = Job(query, user_id, priority)
+            self._jobs[job.id] = job
+            self._active[job.key] = job
+            self._queue.put((-priority, next(self._order), job))
+            return job, True
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def stats(self):
+        with self._lock:
+            statuses = [job.status for job in self._jobs.values()]
+        return {status: statuses.count(status) for status in ("queued", "running", "done", "failed")}
+
+    def _work(self):
+        while True:
+            _, _, job = self._queue.get()
+            self._run(job)
+            self._queue.task_done()
+
+    def _run(self, job):
+        job.status = "running"
+        job.started_at = datetime.utcnow()
+        chunks = []
+
+        try:
+            for event in self.run_events(job.query, job.user_id):
+                job.log.append(event)
+                if "chunk" in event:
+                    chunks.append(event["chunk"])
+                    job.chunks += 1
+                elif "error" in event:
+                    job.error = event["error"]
+            job.result = "".join(chunks)
+            job.status = "failed" if job.error else "done"
+        except Exception as e:
+            job.error = str(e)
+            job.status = "failed"
+            job.log.append({"error": job.error})
+        finally:
+            job.finished_at = datetime.utcnow()
+            job.log.close()
+            with self._lock:
+                self._active.pop(job.key, None)
+                self._evict()
+
+        if job.status == "done" and self.persist:
+            try:
+                self.persist(job)
+            except Exception as e:
+                print(f"Error persisting job {job.id}: {e}")
+
+    def _evict(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.status in ("done", "failed")]
+        for job_id in finished[:max(0, len(self._jobs) - self.history_size)]:
+            del self._jobs[job_id]
@@ -0,0 +1,339 @@
+import json
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, Iterator, List
+
+from phi.model.base import Model
+from phi.model.groq import Groq
+from phi.model.message import Message
+from phi.model.response import ModelResponse, ModelResponseEvent
+from phi.tools.function import FunctionCall
+
+from prompts import count_tokens
+from tracing import message_tokens, span, traced
+
+# Model provider of every agent ("groq", "fake" or "record"), with per-role
+# overrides like "search=fake,synthesis=groq" (roles: search, coordinator,
+# synthesis). "record" runs Groq and appends every turn to FAKE_MODEL_RECORD.
+MODEL_PROVIDER = os.getenv("MODEL_PROVIDER", "groq")
+MODEL_PROVIDERS = os.getenv("MODEL_PROVIDERS", "")
+# Provider of the buffered-mode reformat pass ("gemini" or "fake")
+REFORMAT_PROVIDER = os.getenv("REFORMAT_PROVIDER", "gemini")
+REFORMAT_MODEL = os.getenv("REFORMAT_MODEL", "gemini-2.0-flash")
+
+# The fake model waits FAKE_MODEL_LATENCY seconds before its first token and
+# then produces FAKE_MODEL_TOKEN_RATE tokens per second (0 = no delay)
+FAKE_MODEL_LATENCY = float(os.getenv("FAKE_MODEL_LATENCY", "0.5"))
+FAKE_MODEL_TOKEN_RATE = float(os.getenv("FAKE_MODEL_TOKEN_RATE", "200"))
+# JSONL file of recorded turns the fake model replays
+FAKE_MODEL_SCRIPT = os.getenv("FAKE_MODEL_SCRIPT", "")
+# Table rows of the answer the fake model gives when no recorded turn matches
+FAKE_MODEL_ROWS = int(os.getenv("FAKE_MODEL_ROWS", "10"))
+# JSONL file the "record" provider appends turns to, in the FAKE_MODEL_SCRIPT format
+FAKE_MODEL_RECORD = os.getenv("FAKE_MODEL_RECORD", "model_turns.jsonl")
+
+_query_line = re.compile(r"^Query:\s*(.+)$", re.MULTILINE)
+_token = re.compile(r"\S+\s*|\s+")
+
+_scripts = {}
+_scripts_lock = threading.Lock()
+_record_lock = threading.Lock()
+
+
+def parse_providers(spec):
+    """Parse "search=fake,synthesis=groq" into {"search": "fake", "synthesis": "groq"}"""
+    providers = {}
+    for item in (spec or "").split(","):
+        if "=" in item:
+            role, provider = item.split("=", 1)
+            providers[role.strip().lower()] = provider.strip().lower()
+    return providers
+
+
+_role_providers = parse_providers(MODEL_PROVIDERS)
+
+
+def provider_for(role):
+    return _role_providers.get(role, MODEL_PROVIDER)
+
+
+def create_model(role, model_id):
+    """The phi model of an agent role, from its configured provider"""
+    provider = provider_for(role)
+    if provider == "fake":
+        return TracedFakeModel(id=f"fake-{model_id}", script=load_script(FAKE_MODEL_SCRIPT), agent_role=role)
+    if provider == "record":
+        return RecordingGroq(id=model_id, agent_role=role)
+    if provider != "groq":
+        print(f"Unknown model provider {provider} for {role} agents, using groq")
+    return TracedGroq(id=model_id)
+
+
+def load_script(path):
+    """
+    Recorded turns from a JSONL file, one per line:
+    {"match": "...", "role": "...", "tool_calls": [{"name": ..., "arguments": {...}, "result": ...}],
+     "content": "..."}
+    "match" is a case-insensitive substring of the user message (a turn
+    without one matches anything); a turn with a "role" only matches agents
+    of that role, and one whose tool calls name tools the agent does not have
+    is skipped. A tool call without a "result" is executed.
+    """
+    if not path:
+        return []
+    with _scripts_lock:
+        if path not in _scripts:
+            turns = []
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        turns.append(json.loads(line))
+            _scripts[path] = turns
+        return _scripts[path]
+
+
+def fake_answer(query, rows=FAKE_MODEL_ROWS):
+    """Deterministic answer in the format the prompts ask for, so post-processing has real work"""
+    table = "\n".join(
+        f"| {query} Entity {i} | Private | City {i} | {1950 + i} | Accredited | "
+        f"https://entity{i}.example.com | +1 555 01{i:02d} [Source {i % 3 + 1}] |"
+        for i in range(rows)
+    )
+    return (
+        f"HIGH CONFIDENCE: Summary of the verified information about {query}.\n\n"
+        "| Institution Name | Type | Location | Established Year | Accreditation | Official Website | "
+        "Contact Details |\n|---|---|---|---|---|---|---|\n" + table + "\n\n"
+        "## Recent News\n\n"
+        f"- [POSITIVE] {query} Entity 0 opened a new research centre. Source: https://news.example.com/1\n"
+        f"- [CHALLENGING] {query} Entity 1 faced criticism over fees. Source: https://news.example.com/2\n\n"
+        "Sources:\n1. https://source1.example.com\n2. https://source2.example.com\n3. https://source3.example.com\n"
+    )
+
+
+class FakeModel(Model):
+    """
+    Local stand-in for an LLM: replays recorded tool calls and responses
+    (or a generated answer) after a fixed latency, at a fixed token rate.
+    Deterministic and offline, for load-testing the orchestration,
+    post-processing and streaming code.
+    """
+
+    id: str = "fake"
+    name: str = "FakeModel"
+    provider: str = "Local"
+    latency: float = FAKE_MODEL_LATENCY
+    token_rate: float = FAKE_MODEL_TOKEN_RATE
+    script: List[Dict[str, Any]] = []
+    agent_role: str = ""
+
+    def response(self, messages: List[Message]) -> ModelResponse:
+        started = time.perf_counter()
+        content = self._replay(messages)
+        tokens = _token.findall(content)
+        self._sleep(self.latency + self._token_seconds(len(tokens)))
+        messages.append(self._assistant_message(messages, content, len(tokens), started))
+        return ModelResponse(content=content)
+
+    def response_stream(self, messages: List[Message]) -> Iterator[ModelResponse]:
+        started = time.perf_counter()
+        content = self._replay(messages)
+        tokens = _token.findall(content)
+        self._sleep(self.latency)
+        for token in tokens:
+            self._sleep(self._token_seconds(1))
+            yield ModelResponse(event=ModelResponseEvent.assistant_response.value, content=token)
+        messages.append(self._assistant_message(messages, content, len(tokens), started))
+
+    def _replay(self, messages):
+        """Add the recorded tool calls of the matching turn to messages and return its content"""
+        message = _user_message(messages)
+        turn = self._turn(message)
+        if turn is None:
+            match = _query_line.search(message)
+            return fake_answer((match.group(1) if match else message).strip()[:80])
+
+        for i, call in enumerate(turn.get("tool_calls") or []):
+            call_id = f"call_{i}"
+            arguments = call.get("arguments") or {}
+            messages.append(Message(role="assistant", tool_calls=[{
+                "id": call_id, "type": "function",
+                "function": {"name": call["name"], "arguments": json.dumps(arguments)},
+            }]))
+            result = call["result"] if "result" in call else self._execute(call["name"], arguments)
+            messages.append(Message(role="tool", tool_call_id=call_id, tool_name=call["name"], content=str(result)))
+        return turn.get("content") or ""
+
+    def _turn(self, message):
+        lowered = message.lower()
+        for turn in self.script:
+            if (turn.get("match") or "").lower() not in lowered:
+                continue
+            if turn.get("role") and self.agent_role and turn["role"] != self.agent_role:
+                continue
+            # Search agents share a role; their tools tell them apart
+            if self.functions is not None and any(call["name"] not in self.functions
+                                                  for call in turn.get("tool_calls") or []):
+                continue
+            return turn
+        return None
+
+    def _execute(self, name, arguments):
+        function = (self.functions or {}).get(name)
+        if function is None:
+            return f"Unknown tool: {name}"
+        call = FunctionCall(function=function, arguments=arguments)
+        call.execute()
+        return call.result
+
+    def _assistant_message(self, messages, content, output_tokens, started):
+        input_tokens = sum(count_tokens(m.content) for m in messages if isinstance(m.content, str))
+        return Message(role="assistant", content=content, metrics={
+            "time": time.perf_counter() - started,
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+        })
+
+    def _token_seconds(self, tokens):
+        return tokens / self.token_rate if self.token_rate > 0 else 0.0
+
+    @staticmethod
+    def _sleep(seconds):
+        if seconds > 0:
+            time.sleep(seconds)
+
+
+class TracedModel:
+    """Mixin timing every completion in an "llm" span with its token counts"""
+
+    def response(self, messages):
+        start = len(messages)
+        with span("llm", model=self.id) as current:
+            response = super().response(messages)
+            prompt_tokens, completion_tokens = message_tokens(messages, start)
+            current.set(promptTokens=prompt_tokens, completionTokens=completion_tokens)
+        return response
+
+    def response_stream(self, messages):
+        start = len(messages)
+        with span("llm", model=self.id, stream=True) as current:
+            yield from super().response_stream(messages)
+            prompt_tokens, completion_tokens = message_tokens(messages, start)
+            current.set(promptTokens=prompt_tokens, completionTokens=completion_tokens)
+
+
+class RecordingModel:
+    """
+    Mixin appending every completed turn of the real model to FAKE_MODEL_RECORD
+    as a script line the fake model can replay: the query it answered, the
+    tool calls it made with their results, and its final content.
+    """
+
+    def response(self, messages):
+        start = len(messages)
+        response = super().response(messages)
+        self._record(messages, start)
+        return response
+
+    def response_stream(self, messages):
+        start = len(messages)
+        yield from super().response_stream(messages)
+        self._record(messages, start)
+
+    def _record(self, messages, start):
+        # phi models call themselves again once tool results are in; only the
+        # outer call, which started from the user message, holds the whole turn
+        if start == 0 or messages[start - 1].role == "tool":
+            return
+        try:
+            turn = recorded_turn(messages, start)
+            turn["role"] = self.agent_role
+            line = json.dumps(turn, default=str)
+            with _record_lock:
+                with open(self.record_path, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+        except Exception as e:
+            print(f"Error recording model turn: {e}")
+
+
+def recorded_turn(messages, start):
+    """The script line of the turn whose messages were appended from start on"""
+    message = _user_message(messages[:start])
+    match = _query_line.search(message)
+    added = messages[start:]
+    results = {m.tool_call_id: m.content for m in added if m.role == "tool"}
+    tool_calls = []
+    content = ""
+    for m in added:
+        if m.role != "assistant":
+            continue
+        for call in m.tool_calls or []:
+            function = call.get("function") or {}
+            try:
+                arguments = json.loads(function.get("arguments") or "{}")
+            except ValueError:
+                arguments = {}
+            tool_calls.append({"name": function.get("name"), "arguments": arguments,
+                               "result": results.get(call.get("id"), "")})
+        if isinstance(m.content, str) and m.content:
+            content = m.content
+    return {"match": (match.group(1) if match else message).strip(), "tool_calls": tool_calls, "content": content}
+
+
+class TracedGroq(TracedModel, Groq):
+    pass
+
+
+class RecordingGroq(RecordingModel, TracedGroq):
+    agent_role: str = ""
+    record_path: str = FAKE_MODEL_RECORD
+
+
+class TracedFakeModel(TracedModel, FakeModel):
+    pass
+
+
+def _user_message(messages):
+    for message in reversed(messages):
+        if message.role == "user":
+            return message.content if isinstance(message.content, str) else str(message.content or "")
+    return ""
+
+
+def reformat_with_gemini(text, model=REFORMAT_MODEL):
+    """Legacy blocking post-pass that asks Gemini to tidy the whole response"""
+    # Import Google Generative AI
+    from google import genai
+
+    # Initialize the Generative AI client
+    client = genai.Client(api_key=os.getenv("GOOGLE_API_KEY"))
+    response = client.models.generate_content(
+        model=model,
+        contents='''Reformat this text to have:
+        - Clear line breaks between sections
+        - Proper word spacing
+        - Readable paragraph structure
+        - No unnecessary concatenation of words
+        - Use markdown formatting where appropriate
+        
+        
+        Text to format: ''' + text
+    )
+    return response.text
+
+
+def fake_reformat(text):
+    """Offline reformat pass: the text unchanged after the fake model's latency"""
+    FakeModel._sleep(FAKE_MODEL_LATENCY)
+    return text
+
+
+def create_reformatter(provider=None):
+    """The text -> text reformat function of the configured provider"""
+    provider = provider or REFORMAT_PROVIDER
+    if provider == "fake":
+        return traced("reformat")(fake_reformat)
+    if provider != "gemini":
+        print(f"Unknown reformat provider {provider}, using gemini")
+    return traced("reformat")(reformat_with_gemini)
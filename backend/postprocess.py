@@ -0,0 +1,358 @@
+import re
+from datetime import datetime
+
+from tables import INSTITUTION_COLUMNS, column_field, is_missing, parse_tables
+
+# Get current date information (matches the dates embedded in the agent prompts)
+current_year = datetime.now().year
+current_date_str = datetime.now().strftime("%Y-%m-%d")
+
+# Columns the streamed answer is checked for on education queries
+EDUCATION_STREAM_COLUMNS = [
+    "Institution Name", "Established Year", "Location", "Type",
+    "Total Student Enrollment", "Annual Tuition Fees", "Top Programs Offered",
+    "Accreditation Status", "Average Campus Placement Rate",
+    "Recent Notable Achievements", "Campus Facilities"
+]
+
+# Every institution column is required; the prompts drop the placement rate for schools
+EDUCATION_REQUIRED_COLUMNS = INSTITUTION_COLUMNS
+COLLEGE_ONLY_COLUMNS = ["Average Campus Placement Rate"]
+
+# Patterns to identify and remove system instructions echoed by the model
+INSTRUCTION_PATTERNS = [
+    r"As an advanced information retrieval system.*?protocol EXACTLY:",
+    r"YOU MUST use your search tools.*?information\.",
+    r"NEVER state \"As of my last update\".*?phrases",
+    r"ALWAYS verify information through.*?content",
+    r"CRITICAL: For ANY school or college queries.*?order\.",
+    r"MANDATORY: After the table.*?first",
+    r"YOUR RESPONSE MUST CONTAIN.*?requested",
+    r"I'll use my search tools to gather.*?Query:",
+    r"I must use search tools to gather.*?information\.",
+    r"For your query about.*?search tools\.",
+    r"I'll now search for the most up-to-date information.*?query\.",
+    r"Let me search for information about.*?\.",
+    r"Following the required format for educational institutions.*?\.",
+    r"I'll make sure to include both positive and negative news.*?\.",
+    r"I'll ensure I don't include system instructions.*?\.",
+    r"Now, let me gather information using my search tools.*?one moment\.",
+    r"Website and contact information are TOP PRIORITY fields.*?pages\.",
+    r"I need to use search tools for this query.*?\.",
+    r"I'll actively search for the official website and contact information.*?\.",
+    r"I'll make sure to include news for each entity.*?\.",
+    r"Each news item will be clearly labeled as.*?\.",
+    r"Let me search for the most current information.*?\.",
+    r"Before providing my response.*?\.",
+    r"I understand I need to provide comprehensive information.*?\.",
+    r"I'll get started on your query.*?\.",
+    r"I'll ALWAYS cite my sources.*?\.",
+    r"These instructions are VERY IMPORTANT.*?\.",
+    r"Using my search tools to gather current information.*?\.",
+    r"I need to conduct web searches for this.*?\.",
+    r"I'm using search tools to gather this information.*?\.",
+    r"I'll make sure to include website and contact information.*?\.",
+    r"I'm searching for both positive and negative news.*?\.",
+    r"I'll be sure to format my response according to.*?\.",
+    r"For this query, I need to.*?\.",
+    r"I must create a comprehensive table.*?\.",
+    r"Let me gather the requested information.*?\.",
+    r"I'm using search tools to find the most up-to-date information.*?\.",
+    r"I'll use Crawl4ai to extract detailed information.*?\."
+]
+
+# Substrings the validators look for
+MARKERS = sorted(set([
+    "Sources:", "SOURCES:", "HIGH CONFIDENCE:", "MEDIUM CONFIDENCE:", "LOW CONFIDENCE:",
+    "Official Website", "Contact Details", "Recent News", "RECENT NEWS",
+    "[POSITIVE]", "[CHALLENGING]", "POSITIVE", "Positive", "NEGATIVE", "Negative",
+    "CHALLENGING", "Challenging",
+]), key=len, reverse=True)
+
+
+def _literal_head(pattern):
+    """Split a regex into its leading literal text and the remaining pattern"""
+    head = []
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == "\\" and i + 1 < len(pattern) and not pattern[i + 1].isalnum():
+            head.append(pattern[i + 1])
+            i += 2
+            continue
+        if char in ".^$*+?{}[]()|\\":
+            break
+        head.append(char)
+        i += 1
+    return "".join(head), pattern[i:]
+
+
+def _trie_pattern(entries):
+    """
+    Build one alternation from (literal head, pattern tail) entries, factoring
+    shared head prefixes into a trie so the engine rejects non-matching
+    positions after a character or two instead of trying every alternative.
+    Longer continuations are tried before shorter ones.
+    """
+    trie = {}
+    for head, tail in entries:
+        node = trie
+        for char in head:
+            node = node.setdefault(char, {})
+        node.setdefault("", []).append(tail)
+
+    def emit(node):
+        options = [re.escape(char) + emit(node[char]) for char in sorted(k for k in node if k)]
+        options += [f"(?:{tail})" if tail else "" for tail in node.get("", [])]
+        return options[0] if len(options) == 1 else "(?:" + "|".join(options) + ")"
+
+    return emit(trie)
+
+
+# Echoed instructions, removed in one left-to-right scan. Markers are
+# looked up separately in the same text: a marker consumed by a combined
+# scan could use up the start of an echo inside it ("Official Website and
+# contact information are TOP PRIORITY ...").
+_scan = re.compile(_trie_pattern([_literal_head(p) for p in INSTRUCTION_PATTERNS]), re.DOTALL)
+
+
+class ResponseFacts:
+    """Validation markers present in a response and the tables parsed from it"""
+
+    def __init__(self, markers=None, tables=None):
+        self.markers = markers if markers is not None else set()
+        self.tables = tables if tables is not None else []
+
+    def __contains__(self, marker):
+        return marker in self.markers
+
+    def add(self, other):
+        # Appended notes count for the marker checks only; tables are
+        # always judged on the answer itself
+        self.markers |= other.markers
+
+    def entity_table(self, kind):
+        """The first institution or company table of the answer"""
+        return next((table for table in self.tables if table.entity_kind() == kind), None)
+
+
+def scan_markers(text):
+    """Collect the validation markers of a text without modifying it"""
+    # A substring search per marker beats one alternation scan over the text
+    return ResponseFacts({marker for marker in MARKERS if marker in text})
+
+
+def scan_response(response_text):
+    """
+    Strips echoed system instructions and collects the validation facts.
+    The facts are those of the text as the model gave it, echoes included,
+    since answers were always validated before they were cleaned.
+    """
+    parts = []
+    position = 0
+    for match in _scan.finditer(response_text):
+        parts.append(response_text[position:match.start()])
+        position = match.end()
+    parts.append(response_text[position:])
+
+    cleaned = "".join(parts) if len(parts) > 1 else response_text
+    facts = scan_markers(response_text)
+    facts.tables = parse_tables(response_text)
+    return cleaned, facts
+
+
+def clean_whitespace(text):
+    # Remove any resulting double spaces or newlines
+    text = _blank_lines.sub("\n\n", text)
+    return _double_spaces.sub(" ", text).strip()
+
+
+_blank_lines = re.compile(r"\n\s*\n\s*\n")
+_double_spaces = re.compile(r"  +")
+
+
+SOURCES_REMINDER = f"""
+
+**MISSING INFORMATION: A "Sources" section should be included listing all websites used for information gathering with URLs and access dates.**
+        """
+
+CONFIDENCE_REMINDER = """
+
+**MISSING INFORMATION: Confidence indicators (HIGH/MEDIUM/LOW) should be included for each major section based on source quality.**
+        """
+
+GENERAL_REMINDER = """
+
+**MISSING INFORMATION: Information about any entity should include Official Website and Contact Details. Please request this information if needed.**
+            """
+
+GENERAL_NEWS_REMINDER = f"""
+
+**MISSING INFORMATION: A Recent News section should be included with both positive and challenging news items from {current_year} only. Please request this information if needed.**
+            """
+
+EDUCATION_TABLE_NOTE = """
+        
+**MISSING INFORMATION: The table provided is incomplete. A comprehensive educational institution table should include the following columns:**
+
+| Institution Name | Official Website | Contact Details | Established Year | Location | Type | Total Student Enrollment | Annual Tuition Fees | Top Programs Offered | Accreditation Status | Average Campus Placement Rate | Recent Notable Achievements | Campus Facilities |
+
+Please request more detailed information if needed.
+        """
+
+EDUCATION_NEWS_REMINDER = f"""
+
+**MISSING INFORMATION: A Recent News section should be included with both positive [POSITIVE] and challenging [CHALLENGING] news items from {current_year} only. Please request this information if needed.**
+        """
+
+VERIFICATION_DISCLAIMER = f"""
+
+**INFORMATION VERIFICATION NOTICE: All information provided has been gathered through search tools and web scraping as of {current_date_str}. Any field marked as "Data not available" indicates that information could not be verified from reliable sources. Please consult official websites for the most accurate and up-to-date information.**
+        """
+
+COMPANY_TABLE_NOTE = """
+        
+**NOTE: The table provided is incomplete. A comprehensive company table should include the following columns:**
+
+| Company Name | Official Website | Contact Information | Founded Year | Headquarters Location | Industry Sector | Number of Employees | Annual Revenue | Average Salary Range | Top Job Roles | Company Culture Rating | Recent Major News | Key Products/Services |
+
+Please request more detailed information if needed.
+        """
+
+COMPANY_NEWS_NOTE = f"""
+
+**NOTE: The response should include a "Recent News" section with both positive and negative news items from {current_year} only for each company mentioned.**
+
+Please request this information if needed.
+        """
+
+WEBSITE_CONTACT_WARNING = """
+    
+**IMPORTANT: The results should include Official Website and Contact Information for each entity mentioned. Please ensure this critical information is included in all tables.**
+    """
+
+# The notes are fixed text, so their facts are known up front
+_note_facts = {note: scan_markers(note) for note in [
+    SOURCES_REMINDER, CONFIDENCE_REMINDER, GENERAL_REMINDER, GENERAL_NEWS_REMINDER,
+    EDUCATION_TABLE_NOTE, EDUCATION_NEWS_REMINDER, VERIFICATION_DISCLAIMER,
+    COMPANY_TABLE_NOTE, COMPANY_NEWS_NOTE, WEBSITE_CONTACT_WARNING,
+]}
+
+
+def validate_education_query_response(facts, query_class, notes):
+    """Append the notes an education (or generic entity) answer is missing"""
+    def append(note):
+        notes.append(note)
+        facts.add(_note_facts[note])
+
+    # Check if the response includes a Sources section
+    if not ("Sources:" in facts or "SOURCES:" in facts):
+        append(SOURCES_REMINDER)
+
+    # Check if confidence indicators are included
+    if not any(level in facts for level in ["HIGH CONFIDENCE:", "MEDIUM CONFIDENCE:", "LOW CONFIDENCE:"]):
+        append(CONFIDENCE_REMINDER)
+
+    has_news_section = "Recent News" in facts or "RECENT NEWS" in facts
+    has_balanced_news = "[POSITIVE]" in facts and "[CHALLENGING]" in facts
+
+    if not query_class.education:
+        # Check if the response has "Official Website" and "Contact Details" if it's any type of entity
+        if not ("Official Website" in facts and "Contact Details" in facts):
+            append(GENERAL_REMINDER)
+        if not has_news_section or not has_balanced_news:
+            append(GENERAL_NEWS_REMINDER)
+        return
+
+    # If there's no institution table or it is missing required columns, add a correction note
+    if missing_education_columns(facts.entity_table("institution"), query_class, EDUCATION_REQUIRED_COLUMNS):
+        append(EDUCATION_TABLE_NOTE)
+
+    # If there's no balanced news section, add a reminder
+    if not has_news_section or not has_balanced_news:
+        append(EDUCATION_NEWS_REMINDER)
+
+    # Add anti-hallucination disclaimer
+    append(VERIFICATION_DISCLAIMER)
+
+
+def validate_company_query_response(facts, query_class, notes):
+    """Append the note a company answer is missing, if any"""
+    if not query_class.company:
+        return
+
+    # Check if the response has the required columns for companies
+    table = facts.entity_table("company")
+    if table is None or not table.has_fields("name", "website", "contact"):
+        notes.append(COMPANY_TABLE_NOTE)
+        facts.add(_note_facts[COMPANY_TABLE_NOTE])
+        return
+
+    # Check if there's a news section with both positive and negative news
+    has_positive = "POSITIVE" in facts or "Positive" in facts
+    has_negative = any(word in facts for word in ["NEGATIVE", "Negative", "CHALLENGING", "Challenging"])
+    if "Recent News" not in facts or not has_positive or not has_negative:
+        notes.append(COMPANY_NEWS_NOTE)
+        facts.add(_note_facts[COMPANY_NEWS_NOTE])
+
+
+def has_website_and_contact(table):
+    """True if the table has both columns and no entity lacks both values"""
+    if not {"website", "contact"} <= table.entity_fields():
+        return False
+    return not any(is_missing(values.get("website")) and is_missing(values.get("contact"))
+                   for values in table.values())
+
+
+def enforce_website_contact_info(facts, notes):
+    """Append a warning unless the tables carry website and contact information"""
+    if any(has_website_and_contact(table) for table in facts.tables if table.entity_kind()):
+        return
+    notes.append(WEBSITE_CONTACT_WARNING)
+    facts.add(_note_facts[WEBSITE_CONTACT_WARNING])
+
+
+def postprocess_response(response_text, query_class):
+    """
+    Validate the agent's answer, append notes for missing information and
+    strip echoed system instructions. Echoes are removed in one scan and the
+    facts are taken from the answer as given; whitespace is tidied afterwards
+    as before.
+    """
+    cleaned, facts = scan_response(response_text)
+    notes = []
+    # First validate the educational and company query responses
+    validate_education_query_response(facts, query_class, notes)
+    validate_company_query_response(facts, query_class, notes)
+    # Enforce website and contact information
+    enforce_website_contact_info(facts, notes)
+
+    return clean_whitespace(cleaned + "".join(notes))
+
+
+def missing_education_columns(table, query_class, columns):
+    """Columns absent from the institution table (all of them without a table)"""
+    if not query_class.college:
+        columns = [col for col in columns if col not in COLLEGE_ONLY_COLUMNS]
+    if table is None:
+        return list(columns)
+    present = table.entity_fields()
+    return [col for col in columns if column_field("institution", col) not in present]
+
+
+def education_column_note(text, query_class, tables=None):
+    """
+    Return a note listing required education table columns missing from text.
+    Pass the tables already parsed from the stream to avoid parsing text again.
+    """
+    if not query_class.education:
+        return ""
+
+    if tables is None:
+        tables = parse_tables(text)
+    table = next((table for table in tables if table.entity_kind() == "institution"), None)
+    missing_columns = missing_education_columns(table, query_class, EDUCATION_STREAM_COLUMNS)
+    if not missing_columns:
+        return ""
+
+    return "\n\n**NOTE: The table is missing these required columns: " + ", ".join(missing_columns) + ". Please request more detailed information if needed.**"
@@ -0,0 +1,120 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+# The /api/profile endpoints exist only with PROFILING_ENABLED=1
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "0") == "1"
+# Profile the first N requests after startup (0 = wait for /api/profile/start)
+PROFILE_REQUESTS = int(os.getenv("PROFILE_REQUESTS", "0"))
+# Seconds between stack samples
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))
+PROFILE_MAX_DEPTH = 128
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    module = frame.f_globals.get("__name__", os.path.basename(code.co_filename))
+    return f"{module}.{code.co_name}"
+
+
+def collapse(frame, max_depth=PROFILE_MAX_DEPTH):
+    """Stack of a frame in collapsed form, outermost call first ("a;b;c")"""
+    names = []
+    while frame is not None and len(names) < max_depth:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class SamplingProfiler:
+    """
+    Wall-clock sampling profiler for a number of requests. Once armed it
+    samples the stacks of every thread (request threads, fan-out workers,
+    stream producers) every `interval` seconds while a profiled request is
+    in flight, until the requested number of requests has been handled. The
+    result is in collapsed-stack format, ready for flamegraph.pl or
+    speedscope. Idle threads show up as their wait frames.
+    """
+
+    def __init__(self, interval=PROFILE_INTERVAL):
+        self.interval = interval
+        self.samples = Counter()
+        self.sample_count = 0
+        self.requests_profiled = 0
+        self._remaining = 0
+        self._active = 0
+        self._started = None
+        self._seconds = 0.0
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def arm(self, requests):
+        """Profile the next `requests` requests, discarding earlier samples"""
+        with self._lock:
+            self.samples = Counter()
+            self.sample_count = 0
+            self.requests_profiled = 0
+            self._seconds = 0.0
+            self._remaining = max(0, int(requests))
+
+    @contextmanager
+    def request(self):
+        """Wrap the handling of one request; a no-op unless the profiler is armed"""
+        with self._lock:
+            profiled = self._remaining > 0
+            if profiled:
+                self._remaining -= 1
+                self._active += 1
+                if self._thread is None:
+                    self._started = time.perf_counter()
+                    self._thread = threading.Thread(target=self._sample, name="profiler", daemon=True)
+                    self._thread.start()
+        try:
+            yield
+        finally:
+            if profiled:
+                with self._lock:
+                    self._active -= 1
+                    self.requests_profiled += 1
+
+    def wrap_stream(self, events):
+        """Profile a streamed response until its last event is sent"""
+        with self.request():
+            yield from events
+
+    def collapsed(self):
+        with self._lock:
+            samples = list(self.samples.items())
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(samples, key=lambda item: -item[1]))
+
+    def status(self):
+        with self._lock:
+            return {
+                "running": self._thread is not None,
+                "remaining": self._remaining,
+                "active": self._active,
+                "requestsProfiled": self.requests_profiled,
+                "samples": self.sample_count,
+                "stacks": len(self.samples),
+                "seconds": round(self._seconds, 2),
+                "interval": self.interval,
+            }
+
+    def _sample(self):
+        own = threading.get_ident()
+        while True:
+            frames = sys._current_frames()
+            stacks = [collapse(frame) for thread_id, frame in frames.items() if thread_id != own]
+            del frames
+            with self._lock:
+                self.samples.update(stacks)
+                self.sample_count += 1
+                if self._active == 0:
+                    # No profiled request in flight; the next one starts sampling again
+                    self._seconds += time.perf_counter() - self._started
+                    self._thread = None
+                    return
+            time.sleep(self.interval)
@@ -0,0 +1,209 @@
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime
+
+_whitespace = re.compile(r"\s+")
+_edge_punctuation = re.compile(r"^[\s\W_]+|[\s\W_]+$")
+
+
+def normalize_query(query):
+    """Normalise a query so casing, whitespace and trailing punctuation do not matter"""
+    query = unicodedata.normalize("NFKC", query or "").casefold()
+    query = _whitespace.sub(" ", query)
+    return _edge_punctuation.sub("", query)
+
+
+def date_bucket(now=None):
+    # The agent prompts embed the current date, so answers are only reused within a day
+    return (now or datetime.now()).strftime("%Y-%m-%d")
+
+
+class MemoryCacheBackend:
+    """In-process LRU cache"""
+
+    name = "memory"
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, expires_at):
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def size(self):
+        return len(self._entries)
+
+
+class SqliteCacheBackend:
+    """Cache table in a local SQLite file (by default next to agents.db)"""
+
+    name = "sqlite"
+
+    def __init__(self, max_entries, db_file="agents.db"):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_file, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS query_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS query_cache_last_access ON query_cache (last_access)")
+        self._conn.commit()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, expires_at FROM query_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                self._conn.execute("DELETE FROM query_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute("UPDATE query_cache SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            return row[0]
+
+    def set(self, key, value, expires_at):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO query_cache (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, value, expires_at, now),
+            )
+            self._conn.execute("DELETE FROM query_cache WHERE expires_at < ?", (now,))
+            # Evict least recently used rows beyond the size bound
+            self._conn.execute(
+                "DELETE FROM query_cache WHERE key IN ("
+                "SELECT key FROM query_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self._conn.commit()
+
+    def size(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM query_cache").fetchone()[0]
+
+
+class MongoCacheBackend:
+    """Cache collection in the existing MongoDB database"""
+
+    name = "mongo"
+
+    def __init__(self, max_entries, collection):
+        self.max_entries = max_entries
+        self.collection = collection
+        # MongoDB removes expired entries itself through the TTL index
+        self.collection.create_index("expiresAt", expireAfterSeconds=0)
+        self.collection.create_index("lastAccess")
+
+    def get(self, key):
+        now = datetime.utcnow()
+        doc = self.collection.find_one_and_update(
+            {"_id": key, "expiresAt": {"$gt": now}},
+            {"$set": {"lastAccess": now}},
+            projection={"value": 1},
+        )
+        return doc["value"] if doc else None
+
+    def set(self, key, value, expires_at):
+        now = datetime.utcnow()
+        self.collection.replace_one(
+            {"_id": key},
+            {"value": value, "expiresAt": datetime.utcfromtimestamp(expires_at), "lastAccess": now},
+            upsert=True,
+        )
+        excess = self.collection.estimated_document_count() - self.max_entries
+        if excess > 0:
+            stale = self.collection.find({}, {"_id": 1}).sort("lastAccess", 1).limit(excess)
+            self.collection.delete_many({"_id": {"$in": [doc["_id"] for doc in stale]}})
+
+    def size(self):
+        return self.collection.estimated_document_count()
+
+
+class QueryCache:
+    """
+    Response cache keyed on the normalised query and the current date bucket.
+    Each endpoint has its own entries: /api/query stores the post-processed
+    answer, /api/stream the streamed chunks with their trailing note.
+    """
+
+    def __init__(self, backend, ttl):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def key(self, query, endpoint):
+        return date_bucket() + "|" + endpoint + "|" + normalize_query(query)
+
+    def get(self, query, endpoint):
+        try:
+            value = self.backend.get(self.key(query, endpoint))
+        except Exception as e:
+            print(f"Query cache lookup failed: {e}")
+            value = None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, query, value, endpoint):
+        if not value:
+            return
+        try:
+            self.backend.set(self.key(query, endpoint), value, time.time() + self.ttl)
+        except Exception as e:
+            print(f"Query cache store failed: {e}")
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        try:
+            size = self.backend.size()
+        except Exception:
+            size = None
+        return {
+            "backend": self.backend.name,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "size": size,
+            "maxEntries": self.backend.max_entries,
+            "ttlSeconds": self.ttl,
+        }
+
+
+def build_query_cache(backend, ttl, max_entries, db_file="agents.db", mongo_db=None):
+    """Create the configured cache, or None when caching is switched off"""
+    if backend == "off":
+        return None
+    if backend == "sqlite":
+        return QueryCache(SqliteCacheBackend(max_entries, db_file), ttl)
+    if backend == "mongo":
+        return QueryCache(MongoCacheBackend(max_entries, mongo_db["query_cache"]), ttl)
+    return QueryCache(MemoryCacheBackend(max_entries), ttl)
@@ -0,0 +1,161 @@
+import os
+import re
+import threading
+from functools import lru_cache
+
+from query_cache import normalize_query
+
+# Word stems, so plurals and inflections match ("universities", "educational")
+EDUCATION_STEMS = ["school", "college", "universit", "institut", "campus",
+                   "educat", "academ", "student", "facult", "course"]
+
+COMPANY_STEMS = ["compan", "business", "corporat", "firm", "enterprise",
+                 "industr", "organization", "organisation", "startup"]
+
+NEWS_KEYWORDS = ["news", "latest", "recent", "today", "this week", "this month", "announcement", "announced",
+                 "update", "headline", "happened", "breaking"]
+
+# Short questions of these forms without entity keywords are answered by a single lookup
+FACTUAL_PREFIXES = ["what is", "what are", "what was", "who is", "who was", "who are", "when is", "when was",
+                    "when did", "where is", "where was", "which", "how many", "how much", "how old", "how tall",
+                    "how far", "define", "meaning of", "capital of", "population of"]
+FACTUAL_MAX_WORDS = int(os.getenv("FACTUAL_MAX_WORDS", "10"))
+
+
+def _starts_word(words):
+    return re.compile(r"\b(?:" + "|".join(re.escape(word) for word in words) + r")")
+
+
+_education = _starts_word(EDUCATION_STEMS)
+_company = _starts_word(COMPANY_STEMS)
+_college = _starts_word(["college", "universit", "institut"])
+_school = _starts_word(["school"])
+_news = _starts_word(NEWS_KEYWORDS)
+_factual = re.compile(r"^(?:" + "|".join(re.escape(prefix) for prefix in FACTUAL_PREFIXES) + r")\b")
+
+# Models of the routed pipelines
+PIPELINE_MODEL = os.getenv("PIPELINE_MODEL", "deepseek-r1-distill-llama-70b")
+PIPELINE_SMALL_MODEL = os.getenv("PIPELINE_SMALL_MODEL", "llama-3.1-8b-instant")
+# QUERY_ROUTING=0 sends every class through the full pipeline
+QUERY_ROUTING = os.getenv("QUERY_ROUTING", "1") == "1"
+
+
+class QueryClass:
+    """
+    What a query is about, decided once per request and passed to every
+    stage: prompt assembly, pipeline routing and answer validation.
+    kind is one of education, company, news, factual or general.
+    """
+
+    def __init__(self, kind, education=False, company=False, school=False, college=False):
+        self.kind = kind
+        self.education = education
+        self.company = company
+        self.school = school
+        self.college = college
+
+    @property
+    def topics(self):
+        """Entity table blocks the prompts need"""
+        topics = []
+        if self.education:
+            if self.school:
+                topics.append("school")
+            if self.college:
+                topics.append("college")
+        if self.company:
+            topics.append("company")
+        if not topics and self.kind == "general":
+            # Unclassified queries may still be about an entity; these two tables cover every format
+            return ("college", "company")
+        return tuple(topics)
+
+    def to_dict(self):
+        return {"kind": self.kind, "topics": list(self.topics)}
+
+
+def classify(query):
+    return _classify(normalize_query(query))
+
+
+@lru_cache(maxsize=4096)
+def _classify(query):
+    education = bool(_education.search(query))
+    company = bool(_company.search(query))
+    school = education and bool(_school.search(query))
+    # A school query is a college query too only if it also names colleges
+    college = education and (not school or bool(_college.search(query)))
+
+    if education:
+        kind = "education"
+    elif company:
+        kind = "company"
+    elif _news.search(query):
+        kind = "news"
+    elif _factual.search(query) and len(query.split()) <= FACTUAL_MAX_WORDS:
+        kind = "factual"
+    else:
+        kind = "general"
+    return QueryClass(kind, education, company, school, college)
+
+
+class Pipeline:
+    """How much machinery one class of query gets"""
+
+    def __init__(self, name, engines, crawl=True, model=PIPELINE_MODEL):
+        self.name = name
+        self.engines = engines
+        self.crawl = crawl
+        self.model = model
+
+    def to_dict(self):
+        return {"name": self.name, "engines": list(self.engines), "crawl": self.crawl, "model": self.model}
+
+
+FULL_PIPELINE = Pipeline("full", ("google", "duckduckgo", "baidu"))
+
+PIPELINES = {
+    "education": FULL_PIPELINE,
+    "company": FULL_PIPELINE,
+    "general": FULL_PIPELINE,
+    # Fresh headlines come from search result pages; two engines agree often enough
+    "news": Pipeline("news", ("google", "duckduckgo"), crawl=False),
+    "factual": Pipeline("factual", ("google",), crawl=False, model=PIPELINE_SMALL_MODEL),
+}
+
+
+def route(query_class):
+    return PIPELINES.get(query_class.kind, FULL_PIPELINE) if QUERY_ROUTING else FULL_PIPELINE
+
+
+class ClassStats:
+    """Requests, latency and estimated cost per query class"""
+
+    def __init__(self):
+        self._classes = {}
+        self._lock = threading.Lock()
+
+    def record(self, kind, pipeline, seconds, prompt_tokens=0, output_tokens=0, engine_calls=0):
+        with self._lock:
+            entry = self._classes.setdefault(kind, {
+                "pipeline": pipeline.name, "model": pipeline.model, "requests": 0, "seconds": 0.0,
+                "maxSeconds": 0.0, "promptTokens": 0, "outputTokens": 0, "engineCalls": 0,
+            })
+            entry["requests"] += 1
+            entry["seconds"] += seconds
+            entry["maxSeconds"] = max(entry["maxSeconds"], seconds)
+            entry["promptTokens"] += prompt_tokens
+            entry["outputTokens"] += output_tokens
+            entry["engineCalls"] += engine_calls
+
+    def stats(self):
+        with self._lock:
+            classes = {kind: dict(entry) for kind, entry in self._classes.items()}
+        for entry in classes.values():
+            requests = entry["requests"]
+            entry["avgSeconds"] = round(entry.pop("seconds") / requests, 2)
+            entry["maxSeconds"] = round(entry["maxSeconds"], 2)
+            entry["avgPromptTokens"] = round(entry["promptTokens"] / requests)
+            entry["avgOutputTokens"] = round(entry["outputTokens"] / requests)
+            entry["avgEngineCalls"] = round(entry["engineCalls"] / requests, 2)
+        return {"routing": QUERY_ROUTING, "classes": classes}
@@ -0,0 +1,356 @@
+import os
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+
+from pymongo import ASCENDING, DESCENDING
+
+from crawl_cache import extract_relevant
+from query_cache import normalize_query
+from tables import SCHEMAS, expand_records, extract_records, parse_tables
+
+# Saved answers to the same (or a near-identical) query are served directly
+# while they are younger than REUSE_ANSWER_MAX_AGE seconds
+REUSE_ANSWER_MAX_AGE = int(os.getenv("REUSE_ANSWER_MAX_AGE", "21600"))
+# Saved records of the entities a query names are passed to the agents as
+# known information while they are younger than REUSE_CONTEXT_MAX_AGE seconds
+REUSE_CONTEXT_MAX_AGE = int(os.getenv("REUSE_CONTEXT_MAX_AGE", "604800"))
+# Word overlap (Jaccard) between two queries at which a saved answer is reused as is
+REUSE_ANSWER_SIMILARITY = float(os.getenv("REUSE_ANSWER_SIMILARITY", "0.85"))
+REUSE_MAX_ENTITIES = int(os.getenv("REUSE_MAX_ENTITIES", "10"))
+REUSE_MAX_CANDIDATES = int(os.getenv("REUSE_MAX_CANDIDATES", "50"))
+# Cached page text added per reused entity website
+REUSE_PAGE_BYTES = int(os.getenv("REUSE_PAGE_BYTES", "4000"))
+# Longest entity name, in words, looked for in a query
+MAX_ENTITY_WORDS = 6
+
+REUSED_NOTE = "\n\n*This answer reuses research saved on {date}.*"
+
+STOPWORDS = frozenset("""
+a about an and are as at be best by compare for from give in information is list me of on or show tell
+the to top vs what which who with
+""".split())
+
+_word = re.compile(r"[^\W_]+", re.UNICODE)
+_parenthetical = re.compile(r"\(([^)]*)\)")
+
+
+def query_key(query):
+    return normalize_query(query)
+
+
+def query_words(query):
+    return _word.findall(normalize_query(query))
+
+
+def entity_keys(name):
+    """
+    Lookup keys of an entity name: the name without parentheticals and each
+    parenthetical on its own, so "Indian Institute of Technology Bombay
+    (IIT Bombay)" is found by either spelling.
+    """
+    if not isinstance(name, str):
+        return set()
+    spellings = [_parenthetical.sub(" ", name)] + _parenthetical.findall(name)
+    keys = set()
+    for spelling in spellings:
+        words = query_words(spelling)
+        if words and len(words) <= MAX_ENTITY_WORDS and not all(word in STOPWORDS for word in words):
+            keys.add(" ".join(words))
+    return keys
+
+
+def query_entity_keys(query):
+    """Word n-grams of the query that could be entity keys"""
+    words = query_words(query)
+    grams = set()
+    for size in range(1, MAX_ENTITY_WORDS + 1):
+        for start in range(len(words) - size + 1):
+            gram = words[start:start + size]
+            if gram[0] in STOPWORDS or gram[-1] in STOPWORDS:
+                continue
+            grams.add(" ".join(gram))
+    return grams
+
+
+def reuse_fields(query, records):
+    """Lookup fields stored with a remembered answer"""
+    keys = set()
+    for record in expand_records(records):
+        keys.update(entity_keys(record.get("name")))
+    return {"queryKey": query_key(query), "entityKeys": sorted(keys)}
+
+
+def similarity(first, second):
+    first, second = set(query_words(first)), set(query_words(second))
+    if not first or not second:
+        return 0.0
+    return len(first & second) / len(first | second)
+
+
+def _label(field):
+    return field.replace("_", " ")
+
+
+class Reuse:
+    """
+    Outcome of a reuse lookup: either a saved `answer` to serve as is, or
+    known `evidence` about some of the entities of the query.
+    """
+
+    def __init__(self, answer=None, evidence=None, entities=None, missing=None, pages=0):
+        self.answer = answer
+        self.evidence = evidence
+        self.entities = entities or []  # names of the entities covered
+        self.missing = missing or {}  # entity name -> fields that were not found
+        self.pages = pages
+
+    @property
+    def outcome(self):
+        return "answer" if self.answer is not None else "context"
+
+    def search_hint(self):
+        """Appended to the query of the search agents so they skip what is known"""
+        lines = ["Recent research already covers: " + ", ".join(self.entities) + "."]
+        gaps = [f"{name} ({', '.join(_label(field) for field in fields)})"
+                for name, fields in self.missing.items() if fields]
+        if gaps:
+            lines.append("For those entities search only for the missing fields: " + "; ".join(gaps) + ".")
+        lines.append("Search for any other entities the query asks about as usual.")
+        return "\n".join(lines)
+
+
+class AnswerReuse:
+    """
+    Retrieval step in front of the research pipeline. Answers the pipeline
+    produced itself are remembered in their own collection with a
+    normalised `queryKey` and the `entityKeys` of the entities in their
+    tables; a new query is answered from a fresh answer to the same or a
+    near-identical query, or gets the fresh facts of the entities it names
+    (from the entity store, else from remembered records) and cached pages
+    of their websites as known information.
+
+    Results saved by users (/api/pushData) are client-supplied text and are
+    never reused, so one client cannot plant answers for everyone else.
+    """
+
+    def __init__(self, collection, crawl_cache=None, entities=None, answer_max_age=REUSE_ANSWER_MAX_AGE,
+                 context_max_age=REUSE_CONTEXT_MAX_AGE, answer_similarity=REUSE_ANSWER_SIMILARITY):
+        self.collection = collection
+        self.crawl_cache = crawl_cache
+        # EntityStore with per-field freshness; preferred over saved records
+        self.entities = entities
+        self.answer_max_age = answer_max_age
+        self.context_max_age = context_max_age
+        self.answer_similarity = answer_similarity
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.errors = 0
+        self.entities_reused = 0
+        self.pages_reused = 0
+        self.lookup_seconds = 0.0
+        # outcome -> [runs, total seconds]
+        self._runs = {"answer": [0, 0.0], "context": [0, 0.0], "miss": [0, 0.0]}
+        self.remembered = 0
+
+    def ensure_indexes(self):
+        """Lookup indexes; answers expire once they are too old to serve as context"""
+        try:
+            self.collection.create_index([("queryKey", ASCENDING), ("timestamp", DESCENDING)], name="queryKey_timestamp")
+            self.collection.create_index([("entityKeys", ASCENDING), ("timestamp", DESCENDING)],
+                                         name="entityKeys_timestamp")
+            self.collection.create_index("timestamp", name="timestamp_ttl", expireAfterSeconds=self.context_max_age)
+        except Exception as e:
+            print(f"Error creating indexes on {self.collection.name}: {e}")
+
+    def remember(self, query, answer):
+        """Store an answer the research pipeline produced for a query"""
+        if not (answer or "").strip():
+            return
+        records = extract_records(parse_tables(answer))
+        try:
+            self.collection.insert_one({
+                "searchQuery": query,
+                "content": answer,
+                "records": records,
+                "timestamp": datetime.utcnow(),
+                **reuse_fields(query, records),
+            })
+        except Exception as e:
+            print(f"Error remembering answer for reuse: {e}")
+            return
+        with self._lock:
+            self.remembered += 1
+
+    def lookup(self, query):
+        """A Reuse for the query, or None when nothing fresh enough is saved"""
+        started = time.perf_counter()
+        try:
+            return self._lookup(query)
+        except Exception as e:
+            # Reuse is an optimisation; the query is researched normally
+            print(f"Error looking up saved results for reuse: {e}")
+            with self._lock:
+                self.errors += 1
+            return None
+        finally:
+            with self._lock:
+                self.lookups += 1
+                self.lookup_seconds += time.perf_counter() - started
+
+    def record(self, outcome, seconds):
+        """Duration of a research run that was answered, given context, or missed ("miss")"""
+        with self._lock:
+            runs = self._runs[outcome]
+            runs[0] += 1
+            runs[1] += seconds
+
+    def stats(self):
+        with self._lock:
+            runs = {outcome: list(values) for outcome, values in self._runs.items()}
+            stats = {
+                "lookups": self.lookups,
+                "remembered": self.remembered,
+                "errors": self.errors,
+                "entitiesReused": self.entities_reused,
+                "pagesReused": self.pages_reused,
+                "lookupSeconds": round(self.lookup_seconds, 3),
+            }
+        reused = runs["answer"][0] + runs["context"][0]
+        finished = reused + runs["miss"][0]
+        # Saved time is estimated against the average run that found nothing to reuse
+        baseline = runs["miss"][1] / runs["miss"][0] if runs["miss"][0] else None
+        saved = None
+        if baseline is not None:
+            saved = sum(max(0.0, count * baseline - total) for outcome, (count, total) in runs.items()
+                        if outcome != "miss")
+        stats.update({
+            "answered": runs["answer"][0],
+            "withContext": runs["context"][0],
+            "misses": runs["miss"][0],
+            "reuseRate": round(reused / finished, 3) if finished else None,
+            "avgSeconds": {outcome: round(total / count, 2) if count else None
+                           for outcome, (count, total) in runs.items()},
+            "savedSeconds": round(saved, 1) if saved is not None else None,
+        })
+        return stats
+
+    def _lookup(self, query):
+        now = datetime.utcnow()
+        answer = self._saved_answer(query, now)
+        if answer is not None:
+            return answer
+
+        grams = query_entity_keys(query)
+        if not grams:
+            return None
+        candidates = self.collection.find(
+            {"entityKeys": {"$in": sorted(grams)},
+             "timestamp": {"$gte": now - timedelta(seconds=self.context_max_age)}},
+            {"_id": 1, "searchQuery": 1, "records": 1, "timestamp": 1},
+        ).sort("timestamp", -1).limit(REUSE_MAX_CANDIDATES)
+        candidates = list(candidates)
+
+        # A fresh answer to a near-identical query is served as is
+        answer_since = now - timedelta(seconds=self.answer_max_age)
+        for doc in candidates:
+            if doc["timestamp"] >= answer_since and similarity(query, doc.get("searchQuery")) >= self.answer_similarity:
+                reuse = self._load_answer(doc["_id"])
+                if reuse is not None:
+                    return reuse
+
+        return self._context(grams, candidates)
+
+    def _saved_answer(self, query, now):
+        doc = self.collection.find_one(
+            {"queryKey": query_key(query), "timestamp": {"$gte": now - timedelta(seconds=self.answer_max_age)}},
+            {"_id": 1},
+            sort=[("timestamp", -1)],
+        )
+        return self._load_answer(doc["_id"]) if doc else None
+
+    def _load_answer(self, document_id):
+        doc = self.collection.find_one({"_id": document_id}, {"content": 1, "timestamp": 1})
+        if not doc or not (doc.get("content") or "").strip():
+            return None
+        note = REUSED_NOTE.format(date=doc["timestamp"].strftime("%Y-%m-%d %H:%M UTC"))
+        return Reuse(answer=doc["content"].rstrip() + note)
+
+    def _context(self, grams, candidates):
+        """
+        Known facts about every entity the query names, as an evidence
+        document: fresh fields from the entity store, and for entities not in
+        the store the newest remembered record.
+        """
+        sections = []
+        entities = []
+        missing = {}
+        pages = 0
+        covered = set()
+
+        for entity in (self.entities.match(grams) if self.entities else []):
+            fresh = entity.fresh_fields()
+            if not fresh or len(entities) >= REUSE_MAX_ENTITIES:
+                continue
+            covered |= entity.aliases
+            known = []
+            for field in SCHEMAS[entity.kind]:
+                stored = fresh.get(field)
+                if field != "name" and stored is not None:
+                    source = f"source: {stored.source_url}, " if stored.source_url else ""
+                    known.append(f"- {_label(field)}: {stored.text} ({source}retrieved {stored.retrieved_date()})")
+            missing[entity.name] = entity.stale_fields()
+            entities.append(entity.name)
+            website = fresh["website"].value if "website" in fresh else None
+            section, page = self._section(f"{entity.name} (entity store)", known, website, grams)
+            sections.append(section)
+            pages += page
+
+        chosen = {}  # entity key -> (record, saved at)
+        for doc in candidates:  # newest first
+            for record in expand_records(doc.get("records")):
+                keys = entity_keys(record.get("name")) & grams
+                if keys and not keys & covered and not any(key in chosen for key in keys):
+                    for key in keys:
+                        chosen[key] = (record, doc["timestamp"])
+
+        seen = set()
+        for record, saved_at in chosen.values():
+            if id(record) in seen or len(entities) >= REUSE_MAX_ENTITIES:
+                continue
+            seen.add(id(record))
+            name = record["name"]
+            fields = [field for field in SCHEMAS[record["kind"]] if field != "name"]
+            known = [f"- {_label(field)}: {record[field]}" for field in fields if record.get(field) is not None]
+            missing[name] = [field for field in fields if record.get(field) is None]
+            entities.append(name)
+            section, page = self._section(f"{name} (saved {saved_at.strftime('%Y-%m-%d')})", known,
+                                          record.get("website"), grams)
+            sections.append(section)
+            pages += page
+
+        if not entities:
+            return None
+        with self._lock:
+            self.entities_reused += len(entities)
+            self.pages_reused += pages
+        evidence = "### Known information from recent research\n\n" + "\n\n".join(sections)
+        return Reuse(evidence=evidence, entities=entities, missing=missing, pages=pages)
+
+    def _section(self, title, known, website, grams):
+        """Markdown section of one entity and whether a cached page was added"""
+        section = f"#### {title}\n\n" + "\n".join(known)
+        page = self._cached_page(website, grams)
+        if not page:
+            return section, 0
+        return section + f"\n\nCached page of {website}:\n\n{page}", 1
+
+    def _cached_page(self, url, grams):
+        if not url or self.crawl_cache is None:
+            return None
+        page = self.crawl_cache.peek(url)
+        if not page:
+            return None
+        terms = {word for gram in grams for word in gram.split()}
+        return extract_relevant(page, sorted(terms), REUSE_PAGE_BYTES)
@@ -0,0 +1,274 @@
+import math
+import os
+import re
+import threading
+from array import array
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+
+# Per-user indexes kept in memory; others are rebuilt from MongoDB on demand
+SEARCH_INDEX_MAX_USERS = int(os.getenv("SEARCH_INDEX_MAX_USERS", "200"))
+# Characters of each saved answer that are indexed
+SEARCH_INDEX_MAX_CHARS = int(os.getenv("SEARCH_INDEX_MAX_CHARS", "20000"))
+# Saved queries count this many times more than words of the answer
+QUERY_FIELD_WEIGHT = 3
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_token = re.compile(r"[^\W_]+", re.UNICODE)
+STOPWORDS = frozenset("""
+a an and are as at be by for from has have in is it its of on or that the this to was were will with
+""".split())
+
+SEARCH_PROJECTION = {"_id": 1, "searchQuery": 1, "timestamp": 1, "contentSize": 1, "snippet": 1}
+
+
+def tokenize(text):
+    return [token for token in _token.findall(text.lower()) if len(token) > 1 and token not in STOPWORDS]
+
+
+class UserIndex:
+    """
+    Incremental BM25 index over one user's saved responses.
+    Postings are compact arrays that are only appended to; deleting a
+    response marks its slot dead and the postings are compacted once a
+    quarter of the slots are dead.
+    """
+
+    def __init__(self):
+        self.postings = {}  # term -> (array of slots, array of term frequencies)
+        self.ids = []  # slot -> response id
+        self.lengths = array("I")
+        self.slots = {}  # response id -> slot
+        self.dead = set()
+        self.total_length = 0
+        self.newest = None  # newest timestamp seen, for catching up with other workers
+        # Reentrant so the initial build can hold it while adding responses
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.slots)
+
+    def add(self, response_id, search_query, content, timestamp=None):
+        terms = {}
+        for token in tokenize(search_query or ""):
+            terms[token] = terms.get(token, 0) + QUERY_FIELD_WEIGHT
+        for token in tokenize((content or "")[:SEARCH_INDEX_MAX_CHARS]):
+            terms[token] = terms.get(token, 0) + 1
+        length = sum(terms.values())
+
+        with self.lock:
+            if response_id in self.slots:
+                self._remove(response_id)
+            slot = len(self.ids)
+            self.ids.append(response_id)
+            self.lengths.append(length)
+            self.slots[response_id] = slot
+            self.total_length += length
+            for term, frequency in terms.items():
+                entry = self.postings.get(term)
+                if entry is None:
+                    entry = self.postings[term] = (array("I"), array("H"))
+                entry[0].append(slot)
+                entry[1].append(min(frequency, 65535))
+            if timestamp and (self.newest is None or timestamp > self.newest):
+                self.newest = timestamp
+
+    def remove(self, response_id):
+        with self.lock:
+            self._remove(response_id)
+
+    def search(self, query, limit=20):
+        """[(response id, score)] best first"""
+        terms = set(tokenize(query))
+        with self.lock:
+            live = len(self.slots)
+            if not terms or not live:
+                return []
+            average_length = self.total_length / live
+            scores = {}
+            for term in terms:
+                entry = self.postings.get(term)
+                if entry is None:
+                    continue
+                slots, frequencies = entry
+                idf = math.log(1 + (live - len(slots) + 0.5) / (len(slots) + 0.5))
+                lengths = self.lengths
+                norm = BM25_K1 * (1 - BM25_B)
+                scale = BM25_K1 * BM25_B / average_length
+                for slot, frequency in zip(slots, frequencies):
+                    score = idf * frequency * (BM25_K1 + 1) / (frequency + norm + scale * lengths[slot])
+                    scores[slot] = scores.get(slot, 0.0) + score
+
+            dead = self.dead
+            ranked = sorted((item for item in scores.items() if item[0] not in dead),
+                            key=lambda item: item[1], reverse=True)[:limit]
+            return [(self.ids[slot], score) for slot, score in ranked]
+
+    def _remove(self, response_id):
+        slot = self.slots.pop(response_id, None)
+        if slot is None:
+            return
+        self.dead.add(slot)
+        self.total_length -= self.lengths[slot]
+        if len(self.dead) * 4 > len(self.ids):
+            self._compact()
+
+    def _compact(self):
+        """Drop dead slots and renumber the live ones"""
+        renumber = {}
+        ids = []
+        lengths = array("I")
+        for slot, response_id in enumerate(self.ids):
+            if slot not in self.dead:
+                renumber[slot] = len(ids)
+                ids.append(response_id)
+                lengths.append(self.lengths[slot])
+
+        postings = {}
+        for term, (slots, frequencies) in self.postings.items():
+            kept = [(renumber[slot], frequency) for slot, frequency in zip(slots, frequencies) if slot in renumber]
+            if kept:
+                postings[term] = (array("I", [slot for slot, _ in kept]), array("H", [f for _, f in kept]))
+
+        self.postings = postings
+        self.ids = ids
+        self.lengths = lengths
+        self.slots = {response_id: slot for slot, response_id in enumerate(ids)}
+        self.dead = set()
+
+
+class SearchIndex:
+    """
+    Full-text search over saved responses, one UserIndex per user.
+    A user's index is built from MongoDB on their first search and then kept
+    current incrementally by add() and remove() from the save and delete
+    routes. Each search also picks up responses saved by other worker
+    processes since the index was built and drops hits deleted elsewhere.
+    """
+
+    def __init__(self, collection, bodies=None, pending=None, max_users=SEARCH_INDEX_MAX_USERS):
+        self.collection = collection
+        self.bodies = bodies
+        # pending(user_id) returns saved responses not written to MongoDB yet
+        self.pending = pending
+        self.max_users = max_users
+        self.builds = 0
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, user_id, response_id, search_query, content, timestamp=None):
+        index = self._loaded(user_id)
+        if index is not None:
+            index.add(str(response_id), search_query, content, timestamp)
+
+    def remove(self, user_id, response_id):
+        index = self._loaded(user_id)
+        if index is not None:
+            index.remove(str(response_id))
+
+    def search(self, user_id, query, limit=20):
+        """Saved responses of the user matching query, best first, with their scores"""
+        index = self._index(user_id)
+        self._catch_up(user_id, index)
+
+        ranked = index.search(query, limit)
+        if not ranked:
+            return []
+
+        docs = {
+            str(doc["_id"]): doc
+            for doc in self.collection.find(
+                {"_id": {"$in": [ObjectId(response_id) for response_id, _ in ranked]}, "userId": user_id},
+                SEARCH_PROJECTION,
+            )
+        }
+        results = []
+        for response_id, score in ranked:
+            doc = docs.get(response_id)
+            if doc is None:
+                if not self._is_pending(user_id, response_id):
+                    # Deleted by another worker process
+                    index.remove(response_id)
+                continue
+            doc["score"] = round(score, 4)
+            results.append(doc)
+        return results
+
+    def stats(self):
+        with self._lock:
+            indexes = list(self._indexes.values())
+        return {
+            "users": len(indexes),
+            "responses": sum(len(index) for index in indexes),
+            "terms": sum(len(index.postings) for index in indexes),
+            "builds": self.builds,
+        }
+
+    def _loaded(self, user_id):
+        with self._lock:
+            return self._indexes.get(user_id)
+
+    def _index(self, user_id):
+        with self._lock:
+            index = self._indexes.get(user_id)
+            if index is not None:
+                self._indexes.move_to_end(user_id)
+                return index
+            index = self._indexes[user_id] = UserIndex()
+            while len(self._indexes) > self.max_users:
+                self._indexes.popitem(last=False)
+            self.builds += 1
+            # Built while holding the index lock so concurrent searches and updates wait for it
+            index.lock.acquire()
+
+        try:
+            self._load(index, {"userId": user_id})
+            for doc in (self.pending(user_id) if self.pending else []):
+                self._add_doc(index, doc)
+            if index.newest is None:
+                index.newest = datetime.utcnow()
+        except Exception:
+            with self._lock:
+                self._indexes.pop(user_id, None)
+            raise
+        finally:
+            index.lock.release()
+        return index
+
+    def _catch_up(self, user_id, index):
+        if index.newest is None:
+            return
+        # Small overlap because timestamps from different workers are not strictly ordered
+        since = index.newest - timedelta(seconds=5)
+        recent = self.collection.find({"userId": user_id, "timestamp": {"$gt": since}}, {"_id": 1})
+        unknown = [doc["_id"] for doc in recent if str(doc["_id"]) not in index.slots]
+        if unknown:
+            self._load(index, {"_id": {"$in": unknown}})
+
+    def _load(self, index, query, batch_size=500):
+        projection = {"_id": 1, "searchQuery": 1, "content": 1, "contentRef": 1, "timestamp": 1}
+        batch = []
+        for doc in self.collection.find(query, projection):
+            batch.append(doc)
+            if len(batch) == batch_size:
+                self._add_batch(index, batch)
+                batch = []
+        if batch:
+            self._add_batch(index, batch)
+
+    def _add_batch(self, index, docs):
+        if self.bodies:
+            self.bodies.inline(docs)
+        for doc in docs:
+            self._add_doc(index, doc)
+
+    @staticmethod
+    def _add_doc(index, doc):
+        timestamp = doc.get("timestamp") if isinstance(doc.get("timestamp"), datetime) else None
+        index.add(str(doc["_id"]), doc.get("searchQuery"), doc.get("content"), timestamp)
+
+    def _is_pending(self, user_id, response_id):
+        return bool(self.pending) and any(str(doc["_id"]) == response_id for doc in self.pending(user_id))
@@ -0,0 +1,98 @@
+import threading
+
+from streaming import EventLog
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Collapses concurrent executions for the same key into one.
+    Callers arriving while an execution is in flight attach to it instead of
+    starting their own; nothing is kept once it has finished.
+    """
+
+    def __init__(self, name, executor=None):
+        self.name = name
+        # Streams are produced on this executor when set, else on a thread each
+        self.executor = executor
+        self.executions = 0
+        self.collapsed = 0
+        self._calls = {}
+        self._streams = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        """Run fn() once for all concurrent callers with the same key and share its result"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.executions += 1
+            else:
+                self.collapsed += 1
+
+        if not leader:
+            call.done.wait()
+        else:
+            try:
+                call.result = fn()
+            except Exception as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    del self._calls[key]
+                call.done.set()
+
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    def stream(self, key, produce):
+        """
+        Follow the event stream for key. The first caller starts produce() in
+        a background thread; every subscriber replays the same event log from
+        the start, so all of them see the same sequence.
+        """
+        return self.log(key, produce).follow()
+
+    def log(self, key, produce, max_events=None):
+        """
+        The event log of the stream for key, starting produce() if none is in
+        flight. A log that has already dropped its first events cannot be
+        replayed from the start, so a new subscriber gets a run of its own.
+        """
+        with self._lock:
+            log = self._streams.get(key)
+            if log is None or log.offset:
+                log = self._streams[key] = EventLog(max_events)
+                self.executions += 1
+                if self.executor is not None:
+                    self.executor.submit(self._produce, key, log, produce)
+                else:
+                    threading.Thread(target=self._produce, args=(key, log, produce), daemon=True).start()
+            else:
+                self.collapsed += 1
+        return log
+
+    def _produce(self, key, log, produce):
+        try:
+            for event in produce():
+                log.append(event)
+        except Exception as e:
+            log.append({"error": str(e)})
+        finally:
+            with self._lock:
+                # A newer run may have taken over the key
+                if self._streams.get(key) is log:
+                    del self._streams[key]
+            log.close()
+
+    def stats(self):
+        return {"executions": self.executions, "collapsed": self.collapsed}
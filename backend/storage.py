@@ -0,0 +1,407 @@
+import base64
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, MongoClient
+
+from tracing import TRACING, mongo_listener
+
+# One connection pool for the whole process
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "50"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "2"))
+
+# User profiles copied onto saved results. Each worker process has its own
+# cache and only its own writes invalidate it, so the TTL bounds how long
+# another worker can serve a profile that was updated or deleted
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", "30"))
+USER_CACHE_MAX_ENTRIES = int(os.getenv("USER_CACHE_MAX_ENTRIES", "10000"))
+
+# Saved results are inserted in batches by a background thread; a result
+# waits at most WRITE_BEHIND_MAX_DELAY seconds before it is written
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "100"))
+WRITE_BEHIND_MAX_DELAY = float(os.getenv("WRITE_BEHIND_MAX_DELAY", "0.5"))
+WRITE_BEHIND_MAX_PENDING = int(os.getenv("WRITE_BEHIND_MAX_PENDING", "10000"))
+
+# Saved responses returned per page by default and at most
+HISTORY_PAGE_SIZE = 20
+HISTORY_MAX_PAGE_SIZE = 100
+SNIPPET_CHARS = 200
+
+# Fields of the history listing; the full content is loaded by id
+LIST_PROJECTION = {"_id": 1, "searchQuery": 1, "timestamp": 1, "contentSize": 1, "snippet": 1}
+HISTORY_SORT = [("timestamp", DESCENDING), ("_id", DESCENDING)]
+
+_table_line = re.compile(r"^\s*\|.*$", re.MULTILINE)
+_markup = re.compile(r"[#*_`>\[\]]+|\(https?://[^)]*\)")
+
+
+def create_mongo_client(uri):
+    """The shared MongoClient; pymongo clients are thread-safe and pool connections"""
+    return MongoClient(
+        uri,
+        maxPoolSize=MONGO_MAX_POOL_SIZE,
+        minPoolSize=MONGO_MIN_POOL_SIZE,
+        maxIdleTimeMS=300000,
+        serverSelectionTimeoutMS=5000,
+        retryWrites=True,
+        appname="ai-search-assistant",
+        # Command durations for /metrics and request traces
+        event_listeners=[mongo_listener()] if TRACING else [],
+    )
+
+
+def ensure_indexes(collection):
+    """
+    Create the indexes the history queries rely on. Called once at startup;
+    create_index is a no-op when the index already exists.
+    """
+    try:
+        # Serves the per-user listing sorted newest first, including the _id tie-break
+        collection.create_index(
+            [("userId", ASCENDING), ("timestamp", DESCENDING), ("_id", DESCENDING)],
+            name="userId_timestamp_id",
+        )
+        collection.create_index([("jobId", ASCENDING)], name="jobId", sparse=True)
+    except Exception as e:
+        print(f"Error creating indexes on {collection.name}: {e}")
+
+
+def make_snippet(content, limit=SNIPPET_CHARS):
+    """Short plain-text preview of a markdown answer (tables left out)"""
+    text = _markup.sub("", _table_line.sub(" ", content or ""))
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit].rsplit(" ", 1)[0] + "…"
+
+
+def summary_fields(content):
+    """Listing fields stored next to the content when a response is saved"""
+    content = content or ""
+    return {"contentSize": len(content.encode("utf-8")), "snippet": make_snippet(content)}
+
+
+def encode_cursor(doc):
+    """Opaque cursor pointing just after the given listing entry"""
+    position = {"t": doc["timestamp"].isoformat(), "id": str(doc["_id"])}
+    return base64.urlsafe_b64encode(json.dumps(position).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor):
+    """Returns (timestamp, ObjectId); raises ValueError for malformed cursors"""
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return datetime.fromisoformat(position["t"]), ObjectId(position["id"])
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def parse_limit(limit):
+    """Page size from a request; None means the default. Raises ValueError for non-integers."""
+    if limit is None:
+        return HISTORY_PAGE_SIZE
+    if isinstance(limit, bool) or not isinstance(limit, (int, str)):
+        raise ValueError(f"Invalid limit: {limit}")
+    try:
+        limit = int(limit)
+    except ValueError as e:
+        raise ValueError(f"Invalid limit: {limit}") from e
+    return max(1, min(limit, HISTORY_MAX_PAGE_SIZE))
+
+
+def list_responses(collection, user_id, limit=HISTORY_PAGE_SIZE, cursor=None, bodies=None, pending=None):
+    """
+    One page of a user's saved responses, newest first, without the content.
+    Keyset pagination on (timestamp, _id): every page is an index range scan
+    regardless of how deep it is. Returns the entries and the next cursor
+    (None on the last page). pending(match) returns saved documents that are
+    not written yet; they are merged into the page. Raises ValueError for an
+    invalid limit or cursor.
+    """
+    limit = parse_limit(limit)
+    query = {"userId": user_id}
+    position = None
+    if cursor:
+        timestamp, last_id = decode_cursor(cursor)
+        position = (timestamp, last_id)
+        query["$or"] = [
+            {"timestamp": {"$lt": timestamp}},
+            {"timestamp": timestamp, "_id": {"$lt": last_id}},
+        ]
+
+    docs = list(collection.find(query, LIST_PROJECTION).sort(HISTORY_SORT).limit(limit + 1))
+    if pending:
+        waiting = pending(lambda doc: doc.get("userId") == user_id
+                          and (position is None or (doc["timestamp"], doc["_id"]) < position))
+        if waiting:
+            docs += [{field: doc[field] for field in LIST_PROJECTION if field in doc} for doc in waiting]
+            docs.sort(key=lambda doc: (doc["timestamp"], doc["_id"]), reverse=True)
+    next_cursor = encode_cursor(docs[limit - 1]) if len(docs) > limit else None
+    docs = docs[:limit]
+
+    _backfill_summaries(collection, docs, bodies)
+    return [serialize(doc) for doc in docs], next_cursor
+
+
+def _backfill_summaries(collection, docs, bodies=None):
+    """Compute and store listing fields for documents saved before they existed"""
+    missing = {doc["_id"]: doc for doc in docs if "contentSize" not in doc}
+    if not missing:
+        return
+    stored_docs = list(collection.find({"_id": {"$in": list(missing)}}, {"content": 1, "contentRef": 1}))
+    if bodies:
+        bodies.inline(stored_docs)
+    for stored in stored_docs:
+        fields = summary_fields(stored.get("content"))
+        collection.update_one({"_id": stored["_id"]}, {"$set": fields})
+        missing[stored["_id"]].update(fields)
+
+
+def get_response(collection, user_id, response_id, bodies=None, pending=None):
+    """
+    A saved response with its full content, or None if it is not the user's.
+    pending(match) returns saved documents that are not written yet.
+    """
+    try:
+        object_id = ObjectId(response_id)
+    except Exception:
+        raise ValueError(f"Invalid ID format: {response_id}")
+    fields = ("_id", "content", "contentRef", "records", "searchQuery", "timestamp")
+    doc = collection.find_one({"_id": object_id, "userId": user_id}, {field: 1 for field in fields})
+    if doc is None and pending:
+        waiting = pending(lambda doc: doc["_id"] == object_id and doc.get("userId") == user_id)
+        if waiting:
+            doc = {field: waiting[0][field] for field in fields if field in waiting[0]}
+    if doc and bodies:
+        bodies.inline([doc])
+    return serialize(doc) if doc else None
+
+
+def serialize(doc):
+    doc["_id"] = str(doc["_id"])
+    if isinstance(doc.get("timestamp"), datetime):
+        doc["timestamp"] = doc["timestamp"].isoformat()
+    return doc
+
+
+class UserProfileCache:
+    """
+    Name and email of users, denormalised onto every saved result.
+    Kept current by the Clerk webhook and /api/sync-user, so saving a result
+    normally needs no user lookup; misses fall back to the users collection.
+    """
+
+    def __init__(self, users_collection, ttl=USER_CACHE_TTL, max_entries=USER_CACHE_MAX_ENTRIES):
+        self.users_collection = users_collection
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._profiles = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, clerk_id):
+        """The user's profile dict, or None if the user does not exist"""
+        with self._lock:
+            entry = self._profiles.get(clerk_id)
+            if entry is not None and entry[0] > time.monotonic():
+                self._profiles.move_to_end(clerk_id)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        user = self.users_collection.find_one({"clerkId": clerk_id}, {"_id": 0, "name": 1, "email": 1})
+        if user is None:
+            return None
+        return self.put(clerk_id, user)
+
+    def put(self, clerk_id, user):
+        profile = {"name": user.get("name"), "email": user.get("email")}
+        with self._lock:
+            self._profiles[clerk_id] = (time.monotonic() + self.ttl, profile)
+            self._profiles.move_to_end(clerk_id)
+            while len(self._profiles) > self.max_entries:
+                self._profiles.popitem(last=False)
+        return profile
+
+    def delete(self, clerk_id):
+        with self._lock:
+            self._profiles.pop(clerk_id, None)
+
+    def stats(self):
+        return {"entries": len(self._profiles), "hits": self.hits, "misses": self.misses}
+
+
+class WriteBehindBuffer:
+    """
+    Batches inserts into one collection. Documents get their _id up front so
+    callers can return it immediately; a background thread writes them with
+    insert_many once a batch is full or the oldest pending document has
+    waited max_delay seconds. When more than max_pending documents are
+    waiting, add() writes synchronously instead of growing the buffer.
+    `prepare(docs)` runs on a copy of every batch just before it is
+    inserted, so the queued documents stay as they were added and can be
+    read (pending) or withdrawn (remove) until they are written.
+    `discard(docs)` receives the prepared copies that will never be written,
+    so whatever prepare() acquired for them can be released.
+    """
+
+    def __init__(self, collection, batch_size=WRITE_BEHIND_BATCH_SIZE, max_delay=WRITE_BEHIND_MAX_DELAY,
+                 max_pending=WRITE_BEHIND_MAX_PENDING, max_retries=3, prepare=None, discard=None):
+        self.collection = collection
+        self.prepare = prepare
+        self.discard = discard
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+        self.written = 0
+        self.batches = 0
+        self.failed = 0
+        self.removed = 0
+        # Entries are [doc, attempts, prepared copy or None, queued at], oldest first
+        self._pending = []
+        self._writing = []  # entries of the batch being inserted right now
+        self._cond = threading.Condition()
+        threading.Thread(target=self._run, name=f"write-behind-{collection.name}", daemon=True).start()
+
+    def add(self, doc):
+        return self.add_many([doc])[0]
+
+    def add_many(self, docs):
+        """Queue documents for insertion and return their ids"""
+        for doc in docs:
+            doc.setdefault("_id", ObjectId())
+
+        with self._cond:
+            overflow = len(self._pending) + len(docs) > self.max_pending
+            if not overflow:
+                now = time.monotonic()
+                self._pending.extend([doc, 0, None, now] for doc in docs)
+                self._cond.notify_all()
+
+        if overflow:
+            # Back-pressure: the writer is behind, so this caller pays for its own insert
+            prepared = self._prepared(docs)
+            try:
+                self.collection.insert_many(prepared, ordered=False)
+            except Exception as e:
+                self._discard([prepared[i] for i in self._failed_indexes(e, len(prepared))])
+                raise
+            with self._cond:
+                self.written += len(docs)
+                self.batches += 1
+        return [doc["_id"] for doc in docs]
+
+    def pending(self, match):
+        """Documents still waiting to be written for which match(doc) is true"""
+        with self._cond:
+            return [entry[0] for entry in self._pending + self._writing if match(entry[0])]
+
+    def remove(self, match):
+        """
+        Withdraw the pending documents for which match(doc) is true and return
+        them. A matching document that is being inserted right now is waited
+        for, so afterwards it is either withdrawn or in the collection.
+        """
+        with self._cond:
+            while any(match(entry[0]) for entry in self._writing):
+                self._cond.wait()
+            removed = [entry[0] for entry in self._pending if match(entry[0])]
+            if removed:
+                self._pending = [entry for entry in self._pending if not match(entry[0])]
+                self.removed += len(removed)
+        return removed
+
+    def flush(self):
+        """Write everything pending now (used at shutdown)"""
+        with self._cond:
+            batch, self._pending = self._pending, []
+        while batch:
+            self._write(batch[:self.batch_size])
+            batch = batch[self.batch_size:]
+
+    def stats(self):
+        with self._cond:
+            pending = len(self._pending)
+        return {"pending": pending, "written": self.written, "batches": self.batches, "failed": self.failed,
+                "removed": self.removed}
+
+    def _prepared(self, docs):
+        docs = [dict(doc) for doc in docs]
+        if self.prepare:
+            self.prepare(docs)
+        return docs
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if len(self._pending) >= self.batch_size:
+                        break
+                    if self._pending:
+                        # The oldest document still waiting sets the deadline
+                        remaining = self._pending[0][3] + self.max_delay - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        self._cond.wait(remaining)
+                    else:
+                        self._cond.wait()
+                batch = self._pending[:self.batch_size]
+                self._pending = self._pending[self.batch_size:]
+                self._writing = batch
+            try:
+                self._write(batch)
+            finally:
+                with self._cond:
+                    self._writing = []
+                    self._cond.notify_all()
+
+    def _write(self, batch):
+        try:
+            # A retried document keeps the copy prepared the first time, so
+            # its body reference is not taken twice
+            unprepared = [entry for entry in batch if entry[2] is None]
+            if unprepared:
+                for entry, prepared in zip(unprepared, self._prepared([entry[0] for entry in unprepared])):
+                    entry[2] = prepared
+            self.collection.insert_many([entry[2] for entry in batch], ordered=False)
+            with self._cond:
+                self.written += len(batch)
+                self.batches += 1
+            return
+        except Exception as e:
+            print(f"Error writing batch of {len(batch)} to {self.collection.name}: {e}")
+            retry = [batch[i] for i in self._failed_indexes(e, len(batch))]
+
+        with self._cond:
+            self.written += len(batch) - len(retry)
+            now = time.monotonic()
+            requeue = [[doc, attempts + 1, prepared, now] for doc, attempts, prepared, _ in retry
+                       if attempts + 1 < self.max_retries]
+            self.failed += len(retry) - len(requeue)
+            if requeue:
+                self._pending.extend(requeue)
+        self._discard([prepared for _, attempts, prepared, _ in retry
+                       if attempts + 1 >= self.max_retries and prepared is not None])
+
+    @staticmethod
+    def _failed_indexes(error, count):
+        """Indexes of the documents an insert_many error did not write"""
+        details = getattr(error, "details", None) or {}
+        if not details:
+            return list(range(count))
+        # Documents that were inserted (or already exist) are not retried
+        return sorted({write_error["index"] for write_error in details.get("writeErrors", [])
+                       if write_error.get("code") != 11000})
+
+    def _discard(self, prepared):
+        if prepared and self.discard:
+            try:
+                self.discard(prepared)
+            except Exception as e:
+                print(f"Error discarding {len(prepared)} unwritten documents: {e}")
@@ -0,0 +1,393 @@
+import json
+import re
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+# Flush a pending paragraph early once it grows past this many characters so
+# long tables or run-on text still reach the client promptly
+MAX_PENDING_CHARS = int(os.getenv("STREAM_MAX_PENDING_CHARS", "1200"))
+# Finished streams stay resumable (Last-Event-ID) for this many seconds
+STREAM_REPLAY_TTL = float(os.getenv("STREAM_REPLAY_TTL", "300"))
+# Upper bound on streams kept for resuming; the oldest are dropped first
+STREAM_REPLAY_MAX_STREAMS = int(os.getenv("STREAM_REPLAY_MAX_STREAMS", "500"))
+# Events buffered per stream; a client further behind than this cannot resume
+STREAM_REPLAY_MAX_EVENTS = int(os.getenv("STREAM_REPLAY_MAX_EVENTS", "2000"))
+
+_multi_space = re.compile(r"(?<=\S) {2,}")
+_blank_runs = re.compile(r"\n{3,}")
+
+# Payload keys that name the SSE event type, in order of precedence
+EVENT_TYPES = ("error", "reset", "tool_call", "metrics", "trace", "chunk", "done")
+
+
+def sse_event(payload, event_id=None):
+    """
+    Encode one payload dict as a Server-Sent Events message. Payloads with a
+    known key are sent as that event type; the data line is the same either
+    way. event_id is what the browser sends back as Last-Event-ID on reconnect.
+    """
+    message = "id: " + event_id + "\n" if event_id else ""
+    for kind in EVENT_TYPES:
+        if kind in payload:
+            return message + "event: " + kind + "\ndata: " + json.dumps(payload) + "\n\n"
+    return message + "data: " + json.dumps(payload) + "\n\n"
+
+
+def chunk_content(chunk):
+    """Return the text delta carried by one agent stream chunk"""
+    if isinstance(chunk, str):
+        return chunk
+    content = getattr(chunk, "content", None)
+    if content is None:
+        return ""
+    return content if isinstance(content, str) else str(content)
+
+
+def tool_call_event(tool, engine=None):
+    """Event payload for one phi tool call dict (started, completed or failed)"""
+    result = tool.get("content")
+    timing = (tool.get("metrics") or {}).get("time")
+    if tool.get("tool_call_error"):
+        status = "error"
+    elif result is not None or timing is not None:
+        status = "completed"
+    else:
+        status = "started"
+    return {"tool_call": {
+        "id": tool.get("tool_call_id"),
+        "name": tool.get("tool_name"),
+        "engine": engine,
+        "arguments": tool.get("tool_args") or {},
+        "status": status,
+        "seconds": round(timing, 3) if timing is not None else None,
+        "bytes": len(str(result).encode("utf-8")) if result is not None else None,
+    }}
+
+
+def agent_events(items, engine=None):
+    """
+    Typed view of an agent stream. Yields text deltas (str) for content and
+    event payloads (dict) for tool calls, reading phi's RunResponse fields
+    directly. Tool calls are emitted when they start and again whenever their
+    status changes; payload dicts already in the stream pass through.
+    """
+    # phi sends its whole tool list with every chunk and replaces a call's
+    # dict when it completes, so only dicts not seen before are looked at
+    seen_tools = {}  # tool call id -> last dict seen for it
+    tool_status = {}
+    for item in items:
+        if isinstance(item, dict):
+            yield item
+            continue
+        if isinstance(item, str):
+            if item:
+                yield item
+            continue
+
+        for tool in getattr(item, "tools", None) or ():
+            key = tool.get("tool_call_id") or tool.get("tool_name")
+            if seen_tools.get(key) is tool:
+                continue
+            seen_tools[key] = tool
+            event = tool_call_event(tool, engine)
+            status = event["tool_call"]["status"]
+            if tool_status.get(key) != status:
+                tool_status[key] = status
+                yield event
+
+        # Intermediate events (tool calls, run started/completed) repeat or
+        # carry no text; only RunResponse events are content deltas
+        if getattr(item, "event", "RunResponse") != "RunResponse":
+            continue
+        text = chunk_content(item)
+        if text:
+            yield text
+
+
+def normalize_markdown_block(block, in_fence=False):
+    """
+    Normalise one paragraph-sized block of markdown.
+    Returns the normalised text and whether we are still inside a code fence.
+    """
+    lines = []
+    for line in block.split("\n"):
+        stripped = line.strip()
+        if stripped.startswith("```"):
+            in_fence = not in_fence
+            lines.append(line.rstrip())
+            continue
+        if in_fence:
+            lines.append(line)
+            continue
+
+        line = _multi_space.sub(" ", line.rstrip())
+        if lines and lines[-1].strip():
+            previous = lines[-1].lstrip()
+            # Headings and tables need a blank line before them to render
+            if stripped.startswith("#") and not previous.startswith("#"):
+                lines.append("")
+            elif stripped.startswith("|") != previous.startswith("|") and stripped:
+                lines.append("")
+        lines.append(line)
+
+    return _blank_runs.sub("\n\n", "\n".join(lines)).strip("\n"), in_fence
+
+
+class MarkdownNormalizer:
+    """
+    Incremental markdown normalisation stage.
+    Text deltas are buffered until a paragraph boundary (blank line) and each
+    completed paragraph is normalised and released immediately.
+    """
+
+    def __init__(self, max_pending=MAX_PENDING_CHARS):
+        self.max_pending = max_pending
+        self._pending = ""
+        self._in_fence = False
+        self._at_boundary = True
+
+    def feed(self, text):
+        """Add a text delta and return the list of pieces ready to emit"""
+        if not text:
+            return []
+        if self._at_boundary:
+            text = text.lstrip("\n")
+            if not text:
+                return []
+        self._at_boundary = False
+        self._pending += text
+
+        pieces = []
+        while True:
+            idx = self._pending.find("\n\n")
+            if idx == -1:
+                break
+            block = self._pending[:idx]
+            self._pending = self._pending[idx + 2:].lstrip("\n")
+            piece = self._normalize(block)
+            if piece:
+                pieces.append(piece + "\n\n")
+
+        if not self._pending:
+            self._at_boundary = bool(pieces)
+        elif len(self._pending) > self.max_pending:
+            # No paragraph boundary in sight: release every complete line
+            cut = self._pending.rfind("\n")
+            if cut > 0:
+                block = self._pending[:cut]
+                self._pending = self._pending[cut + 1:]
+                piece = self._normalize(block)
+                if piece:
+                    pieces.append(piece + "\n")
+
+        return pieces
+
+    def flush(self):
+        """Release whatever is still buffered at the end of the stream"""
+        block, self._pending = self._pending, ""
+        piece = self._normalize(block)
+        self._at_boundary = True
+        return [piece + "\n\n"] if piece else []
+
+    def _normalize(self, block):
+        piece, self._in_fence = normalize_markdown_block(block, self._in_fence)
+        return piece
+
+
+def stream_incremental(deltas, finalize=None, max_pending=MAX_PENDING_CHARS):
+    """
+    Forward agent text deltas as chunk events as soon as each paragraph is
+    complete. `finalize` receives the full streamed text and may return a
+    trailing note (e.g. missing table columns) which is sent before done.
+    """
+    normalizer = MarkdownNormalizer(max_pending)
+    emitted = []
+
+    for delta in deltas:
+        if isinstance(delta, dict):
+            # Typed events (tool calls, metrics) are not text; send them right away
+            yield delta
+            continue
+        for piece in normalizer.feed(delta):
+            emitted.append(piece)
+            yield {"chunk": piece}
+
+    for piece in normalizer.flush():
+        emitted.append(piece)
+        yield {"chunk": piece}
+
+    if finalize:
+        note = finalize("".join(emitted))
+        if note:
+            yield {"chunk": note}
+
+    yield {"done": True}
+
+
+def stream_buffered(deltas, reformat, finalize=None):
+    """
+    Legacy mode: collect the whole agent output, send it through a single
+    reformat call and emit it as one chunk. Typed events are sent as they arrive.
+    """
+    total_chunks = []
+    for delta in deltas:
+        if isinstance(delta, dict):
+            yield delta
+        elif delta and delta.strip():
+            total_chunks.append(delta.strip())
+    final_data = reformat(" ".join(total_chunks))
+
+    if finalize:
+        final_data += finalize(final_data)
+
+    yield {"chunk": final_data}
+    yield {"done": True}
+
+
+class StreamOverrun(Exception):
+    """A reader fell behind the oldest event a capped log still holds"""
+
+
+class EventLog:
+    """
+    Append-only log of event payloads for one run. Any number of readers can
+    replay it from the start and then follow new events as they arrive.
+    With max_events only the most recent events are kept; `offset` is the
+    index of the oldest one still held. Readers that cannot block a thread
+    (the asyncio server) subscribe a callback instead and read() when it fires.
+    """
+
+    def __init__(self, max_events=None):
+        self.events = []
+        self.offset = 0
+        self.max_events = max_events
+        self.closed = False
+        self.closed_at = None
+        self._listeners = []
+        self._cond = threading.Condition()
+
+    def subscribe(self, listener):
+        """Call listener() (from the writing thread) after every append and on close"""
+        with self._cond:
+            self._listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        with self._cond:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    def read(self, start=0):
+        """Without blocking: (events from start, closed); raises StreamOverrun if start was dropped"""
+        with self._cond:
+            if start < self.offset:
+                raise StreamOverrun(f"events before {self.offset} were dropped")
+            return self.events[start - self.offset:], self.closed
+
+    def _notify(self):
+        for listener in list(self._listeners):
+            listener()
+
+    def __len__(self):
+        with self._cond:
+            return self.offset + len(self.events)
+
+    def append(self, event):
+        with self._cond:
+            self.events.append(event)
+            # Trim in batches so appends stay cheap
+            if self.max_events and len(self.events) > self.max_events + self.max_events // 4:
+                dropped = len(self.events) - self.max_events
+                del self.events[:dropped]
+                self.offset += dropped
+            self._cond.notify_all()
+        self._notify()
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self.closed_at = time.monotonic()
+            self._cond.notify_all()
+        self._notify()
+
+    def follow(self, start=0):
+        """Yield events from index `start`, blocking for new ones until the log is closed"""
+        for _, event in self.entries(start):
+            yield event
+
+    def entries(self, start=0):
+        """
+        Yield (index, event) pairs from index `start`, blocking for new ones
+        until the log is closed. A reader that falls behind the oldest event
+        still held gets StreamOverrun rather than a stream with a gap.
+        """
+        index = start
+        while True:
+            with self._cond:
+                while index >= self.offset + len(self.events) and not self.closed:
+                    self._cond.wait()
+                if index < self.offset:
+                    raise StreamOverrun(f"events before {self.offset} were dropped")
+                pending = self.events[index - self.offset:]
+                closed = self.closed
+                end = self.offset + len(self.events)
+            for event in pending:
+                yield index, event
+                index += 1
+            if closed and index >= end:
+                return
+
+
+class ReplayRegistry:
+    """
+    Event logs of recent streams by stream id, so a client that lost its
+    connection can resume after the last event it received instead of
+    starting the run again. Streams are dropped STREAM_REPLAY_TTL seconds
+    after they finish, or oldest first once more than max_streams are held.
+    Event ids are "<stream id>-<index in the log>".
+    """
+
+    def __init__(self, ttl=STREAM_REPLAY_TTL, max_streams=STREAM_REPLAY_MAX_STREAMS):
+        self.ttl = ttl
+        self.max_streams = max_streams
+        self.resumed = 0
+        self.misses = 0
+        self._logs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, log):
+        """Register a stream's log and return its id"""
+        stream_id = uuid.uuid4().hex
+        with self._lock:
+            self._logs[stream_id] = log
+            self._evict()
+        return stream_id
+
+    def resume(self, last_event_id):
+        """
+        (stream id, log, next index) for the event after last_event_id, or
+        None when that stream or event is no longer buffered
+        """
+        stream_id, _, index = (last_event_id or "").rpartition("-")
+        with self._lock:
+            self._evict()
+            log = self._logs.get(stream_id)
+            # Events the client has not seen yet must still be in the log
+            if log is None or not index.isdigit() or int(index) + 1 < log.offset:
+                self.misses += 1
+                return None
+            self.resumed += 1
+        return stream_id, log, int(index) + 1
+
+    def stats(self):
+        with self._lock:
+            return {"streams": len(self._logs), "resumed": self.resumed, "misses": self.misses}
+
+    def _evict(self):
+        now = time.monotonic()
+        for stream_id, log in list(self._logs.items()):
+            expired = log.closed_at is not None and now - log.closed_at > self.ttl
+            if expired or len(self._logs) > self.max_streams:
+                del self._logs[stream_id]
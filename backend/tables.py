@@ -0,0 +1,347 @@
+import re
+
+# Table columns requested by the main agent instructions
+INSTITUTION_COLUMNS = [
+    "Institution Name", "Official Website", "Contact Information", "Established Year", "Location", "Type",
+    "Total Student Enrollment", "Annual Tuition Fees", "Top Programs Offered", "Accreditation Status",
+    "Average Campus Placement Rate", "Recent Notable Achievements", "Campus Facilities"
+]
+
+COMPANY_COLUMNS = [
+    "Company Name", "Official Website", "Contact Information", "Founded Year", "Headquarters Location",
+    "Industry Sector", "Number of Employees", "Annual Revenue", "Average Salary Range", "Top Job Roles",
+    "Company Culture Rating", "Recent Major News", "Key Products/Services"
+]
+
+# Record fields per entity kind: field -> (value type, header spellings).
+# Header spellings are compared after normalize_header(), so the
+# "(Latest Official Name)" style hints from the search instructions and
+# bold markup do not matter. The first field is the entity name.
+SCHEMAS = {
+    "institution": {
+        "name": ("text", ["institution name", "school name", "college name", "university name"]),
+        "website": ("url", ["official website", "website"]),
+        "contact": ("text", ["contact information", "contact details", "contact"]),
+        "established_year": ("year", ["established year", "established", "year established"]),
+        "location": ("text", ["location"]),
+        "type": ("text", ["type"]),
+        "enrollment": ("count", ["total student enrollment", "student enrollment", "enrollment"]),
+        "tuition_fees": ("text", ["annual tuition fees", "tuition fees"]),
+        "top_programs": ("text", ["top programs offered", "top programs", "programs offered"]),
+        "accreditation": ("text", ["accreditation status", "accreditation"]),
+        "placement_rate": ("percent", ["average campus placement rate", "campus placement rate", "placement rate"]),
+        "achievements": ("text", ["recent notable achievements", "recent notable achievements in detail",
+                                  "notable achievements"]),
+        "facilities": ("text", ["campus facilities", "facilities"]),
+    },
+    "company": {
+        "name": ("text", ["company name"]),
+        "website": ("url", ["official website", "website"]),
+        "contact": ("text", ["contact information", "contact details", "contact"]),
+        "founded_year": ("year", ["founded year", "founded", "year founded"]),
+        "headquarters": ("text", ["headquarters location", "headquarters"]),
+        "industry": ("text", ["industry sector", "industry"]),
+        "employees": ("count", ["number of employees", "employees"]),
+        "annual_revenue": ("text", ["annual revenue", "revenue"]),
+        "salary_range": ("text", ["average salary range", "salary range"]),
+        "top_job_roles": ("text", ["top job roles", "job roles"]),
+        "culture_rating": ("rating", ["company culture rating", "culture rating"]),
+        "recent_news": ("text", ["recent major news", "recent major news/developments", "recent news"]),
+        "products": ("text", ["key products/services", "products/services", "key products"]),
+    },
+}
+
+_header_fields = {
+    kind: {spelling: field for field, (_, spellings) in fields.items() for spelling in spellings}
+    for kind, fields in SCHEMAS.items()
+}
+
+MISSING_VALUES = {"", "-", "--", "n/a", "na", "none", "not available", "data not available", "unknown"}
+
+_separator_cell = re.compile(r"^:?-{1,}:?$")
+_escaped_pipe = re.compile(r"(?<!\\)\|")
+_hint = re.compile(r"\s*\([^)]*\)")
+_source_ref = re.compile(r"\[\s*Sources?\s+([\d,\s]+)\]", re.IGNORECASE)
+_markup = re.compile(r"\*\*|__|`")
+_markdown_link = re.compile(r"\[[^\]]*\]\((https?://[^)\s]+)\)")
+_url = re.compile(r"https?://[^\s)\]>|\"']+|www\.[^\s)\]>|\"']+")
+_year = re.compile(r"\b(1[5-9]\d\d|20\d\d)\b")
+_number = re.compile(r"(\d[\d,]*(?:\.\d+)?)\s*(k|thousand|lakh|lakhs|million|crore|crores|billion)?\b", re.IGNORECASE)
+_percent = re.compile(r"(\d+(?:\.\d+)?)\s*%")
+_rating = re.compile(r"(\d+(?:\.\d+)?)\s*(?:/\s*(\d+)|out of\s*(\d+))?")
+
+_multipliers = {"k": 1e3, "thousand": 1e3, "lakh": 1e5, "lakhs": 1e5, "million": 1e6,
+                "crore": 1e7, "crores": 1e7, "billion": 1e9}
+
+
+def normalize_header(cell):
+    """Lower-case a header cell without markup or parenthesised hints"""
+    return " ".join(_hint.sub("", _markup.sub("", cell)).lower().split())
+
+
+def split_row(line):
+    """Split one markdown table line into its stripped cells"""
+    line = line.strip()
+    if line.startswith("|"):
+        line = line[1:]
+    if line.endswith("|") and not line.endswith("\\|"):
+        line = line[:-1]
+    cells = _escaped_pipe.split(line) if "\\|" in line else line.split("|")
+    return [cell.strip() for cell in cells]
+
+
+def is_separator(line):
+    cells = split_row(line)
+    return bool(cells) and all(_separator_cell.match(cell.replace(" ", "")) for cell in cells)
+
+
+class MarkdownTable:
+    def __init__(self, headers, rows):
+        self.headers = headers
+        self.rows = rows
+        self.kind, self.fields = classify_headers(headers)
+        self._transposed = None
+
+    def has_fields(self, *fields):
+        present = self.entity_fields()
+        return all(field in present for field in fields)
+
+    def values(self):
+        """
+        Yield one {field: raw cell} dict per entity. Two-column tables that
+        list one entity's attributes row by row ("| Official Website | ... |")
+        yield a single dict.
+        """
+        if self.kind is not None:
+            for row in self.rows:
+                yield {field: row[i] for i, field in enumerate(self.fields) if field and i < len(row)}
+        elif self.transposed() is not None:
+            yield self.transposed()[1]
+
+    def transposed(self):
+        """(kind, values) when the table is a field/value listing of one entity"""
+        if self._transposed is None:
+            self._transposed = False
+            if len(self.headers) == 2:
+                labels = [normalize_header(row[0]) for row in self.rows]
+                best_score = 2
+                for kind, spellings in _header_fields.items():
+                    fields = [spellings.get(label) for label in labels]
+                    score = sum(1 for field in fields if field)
+                    if score > best_score:
+                        values = {field: row[1] for field, row in zip(fields, self.rows) if field and len(row) > 1}
+                        self._transposed, best_score = (kind, values), score
+        return self._transposed or None
+
+    def entity_kind(self):
+        if self.kind is not None:
+            return self.kind
+        transposed = self.transposed()
+        return transposed[0] if transposed else None
+
+    def entity_fields(self):
+        if self.kind is not None:
+            return {field for field in self.fields if field}
+        transposed = self.transposed()
+        return set(transposed[1]) if transposed else set()
+
+
+def classify_headers(headers):
+    """
+    Match header cells against the entity schemas.
+    Returns the kind and the field of each column (None for unknown columns),
+    or (None, []) when the headers are not an institution or company table.
+    """
+    normalized = [normalize_header(cell) for cell in headers]
+    best = (None, [])
+    best_score = 0
+    for kind, spellings in _header_fields.items():
+        fields = [spellings.get(cell) for cell in normalized]
+        # The entity name column decides; otherwise require a few known columns
+        score = sum(1 for field in fields if field) + (10 if "name" in fields else 0)
+        if score > best_score and ("name" in fields or score >= 3):
+            best, best_score = (kind, fields), score
+    return best
+
+
+class TableParser:
+    """
+    Incremental markdown table parser. Text is fed in arbitrary pieces (for
+    example stream deltas); every table is returned as soon as the first
+    non-table line after it arrives. Each line is looked at once.
+    """
+
+    def __init__(self):
+        self.tables = []
+        self._partial = ""
+        self._lines = []
+
+    def feed(self, text):
+        """Add text and return the tables completed by it"""
+        if not text:
+            return []
+        lines = (self._partial + text).split("\n")
+        self._partial = lines.pop()
+        completed = []
+        for line in lines:
+            table = self._add_line(line)
+            if table is not None:
+                completed.append(table)
+        return completed
+
+    def flush(self):
+        """Finish the input and return any table still open"""
+        completed = []
+        if self._partial:
+            table = self._add_line(self._partial)
+            self._partial = ""
+            if table is not None:
+                completed.append(table)
+        table = self._close()
+        if table is not None:
+            completed.append(table)
+        return completed
+
+    def _add_line(self, line):
+        stripped = line.strip()
+        if stripped.startswith("|"):
+            self._lines.append(stripped)
+            return None
+        return self._close()
+
+    def _close(self):
+        lines, self._lines = self._lines, []
+        if len(lines) < 2 or not is_separator(lines[1]):
+            return None
+        headers = split_row(lines[0])
+        rows = [split_row(line) for line in lines[2:]]
+        table = MarkdownTable(headers, [row for row in rows if any(row)])
+        self.tables.append(table)
+        return table
+
+
+def parse_tables(text):
+    parser = TableParser()
+    parser.feed(text)
+    parser.flush()
+    return parser.tables
+
+
+def is_missing(value):
+    if value is None:
+        return True
+    # Cheap rejection first: missing markers start with one of these characters
+    head = value.lstrip(" *_`")[:1].lower()
+    if head and head not in "-dnu[":
+        return False
+    value = _markup.sub("", _source_ref.sub("", value)).strip().rstrip(".").lower()
+    return value in MISSING_VALUES or value.startswith("data not available")
+
+
+def _to_count(text):
+    match = _number.search(text)
+    if not match:
+        return None
+    number = float(match.group(1).replace(",", ""))
+    unit = (match.group(2) or "").lower()
+    return int(number * _multipliers.get(unit, 1))
+
+
+def _to_rating(text):
+    match = _rating.search(text)
+    if not match:
+        return None
+    value = float(match.group(1))
+    scale = match.group(2) or match.group(3)
+    return round(value * 5 / float(scale), 2) if scale and float(scale) else value
+
+
+def cell_text(value):
+    """Cell text without markup and [Source #] references"""
+    return _markup.sub("", _source_ref.sub("", value or "")).strip()
+
+
+def convert_value(value, value_type):
+    """
+    Typed value of one cell. Missing values become None; cells that do not
+    parse as their type are kept as cleaned text so nothing is lost.
+    Returns the value and the source numbers cited in the cell.
+    """
+    sources = [int(number) for ref in _source_ref.findall(value or "") for number in re.findall(r"\d+", ref)]
+    if is_missing(value):
+        return None, sources
+
+    text = cell_text(value)
+    if value_type == "url":
+        match = _markdown_link.search(text) or _url.search(text)
+        if match:
+            return (match.group(1) if match.re is _markdown_link else match.group(0)).rstrip(".,;"), sources
+    elif value_type == "year":
+        match = _year.search(text)
+        if match:
+            return int(match.group(1)), sources
+    elif value_type == "count":
+        count = _to_count(text)
+        if count is not None:
+            return count, sources
+    elif value_type == "percent":
+        match = _percent.search(text)
+        if match:
+            return float(match.group(1)), sources
+    elif value_type == "rating":
+        rating = _to_rating(text)
+        if rating is not None:
+            return rating, sources
+    return text, sources
+
+
+def extract_records(tables):
+    """
+    Typed records of all institution and company tables, in compact form:
+    one entry per kind with the field names once and a list of value rows,
+    plus the source numbers cited in each row.
+
+        [{"kind": "institution", "fields": ["name", ...], "rows": [[...]], "sources": [[1, 3]]}]
+    """
+    grouped = {}
+    for table in tables:
+        kind = table.entity_kind()
+        if kind is None:
+            continue
+        schema = SCHEMAS[kind]
+        for values in table.values():
+            record = {}
+            cited = set()
+            for field, raw in values.items():
+                record[field], sources = convert_value(raw, schema[field][0])
+                cited.update(sources)
+            if not any(value is not None for value in record.values()):
+                continue
+            grouped.setdefault(kind, []).append((record, sorted(cited)))
+
+    compact = []
+    for kind, records in grouped.items():
+        fields = [field for field in SCHEMAS[kind] if any(field in record for record, _ in records)]
+        entry = {
+            "kind": kind,
+            "fields": fields,
+            "rows": [[record.get(field) for field in fields] for record, _ in records],
+        }
+        if any(cited for _, cited in records):
+            entry["sources"] = [cited for _, cited in records]
+        compact.append(entry)
+    return compact
+
+
+def expand_records(compact):
+    """Turn the compact form back into a list of record dicts with their kind"""
+    return [
+        dict(zip(entry["fields"], row), kind=entry["kind"])
+        for entry in compact or []
+        for row in entry["rows"]
+    ]
+
+
+def column_field(kind, header):
+    """Record field of a column header for the given entity kind, or None"""
+    return _header_fields[kind].get(normalize_header(header))
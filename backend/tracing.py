@@ -0,0 +1,298 @@
+import contextvars
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Spans feed the /metrics endpoint; TRACING=0 turns every span into a no-op
+TRACING = os.getenv("TRACING", "1") == "1"
+# Debug mode: answers carry the per-request trace (every span with its timing)
+TRACE_DEBUG = os.getenv("TRACE_DEBUG", "0") == "1"
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.025, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 60, 120)
+
+METRIC_HELP = {
+    "stage_seconds": ("histogram", "Duration of pipeline stages and tool calls"),
+    "stage_errors_total": ("counter", "Pipeline stages that raised"),
+    "stage_bytes_total": ("counter", "Bytes produced by a stage (tool output, crawled text)"),
+    "stage_cache_total": ("counter", "Cache lookups of a stage by result"),
+    "llm_tokens_total": ("counter", "Prompt and completion tokens per model"),
+    "mongo_command_seconds": ("histogram", "Duration of MongoDB commands"),
+    "admission_wait_seconds": ("histogram", "Time agent runs waited for an admission slot"),
+    "admission_shed_total": ("counter", "Agent runs rejected by admission control, by reason"),
+}
+
+_trace = contextvars.ContextVar("trace", default=None)
+
+
+def _label_key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items() if value is not None))
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label(value)}"' for name, value in pairs) + "}"
+
+
+def _escape_label(value):
+    # Backslash first, so the escapes added for quotes and newlines stay single
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metrics:
+    """Counters and histograms with labels, rendered in the Prometheus text format"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._counters = {}  # name -> {label key: value}
+        self._histograms = {}  # name -> {label key: [bucket counts..., sum, count]}
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            values = series.get(key)
+            if values is None:
+                values = series[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    values[i] += 1
+            values[-2] += seconds
+            values[-1] += 1
+
+    def render(self, collectors=()):
+        """
+        Text exposition of every series. collectors are callables returning
+        (name, type, help, value, labels) tuples read at scrape time.
+        """
+        lines = []
+        with self._lock:
+            counters = {name: dict(series) for name, series in self._counters.items()}
+            histograms = {name: {key: list(values) for key, values in series.items()}
+                          for name, series in self._histograms.items()}
+
+        for name, series in sorted(counters.items()):
+            self._header(lines, name, "counter")
+            for key, value in sorted(series.items()):
+                lines.append(f"{name}{_format_labels(key)} {value}")
+        for name, series in sorted(histograms.items()):
+            self._header(lines, name, "histogram")
+            for key, values in sorted(series.items()):
+                for i, bound in enumerate(self.buckets):
+                    lines.append(f"{name}_bucket{_format_labels(key, [('le', bound)])} {values[i]}")
+                lines.append(f"{name}_bucket{_format_labels(key, [('le', '+Inf')])} {values[-1]}")
+                lines.append(f"{name}_sum{_format_labels(key)} {round(values[-2], 6)}")
+                lines.append(f"{name}_count{_format_labels(key)} {values[-1]}")
+
+        seen = set()
+        for collect in collectors:
+            try:
+                samples = collect()
+            except Exception as e:
+                print(f"Error collecting metrics: {e}")
+                continue
+            for name, kind, help_text, value, labels in samples:
+                if value is None:
+                    continue
+                if name not in seen:
+                    seen.add(name)
+                    lines.append(f"# HELP {name} {help_text}")
+                    lines.append(f"# TYPE {name} {kind}")
+                lines.append(f"{name}{_format_labels(_label_key(labels))} {value}")
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _header(lines, name, kind):
+        kind, help_text = METRIC_HELP.get(name, (kind, name.replace("_", " ")))
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+
+
+metrics = Metrics()
+
+
+class Trace:
+    """Timeline of the spans of one request"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, name, started, seconds, attrs):
+        entry = {"name": name, "startMs": round((started - self.started) * 1000, 1),
+                 "ms": round(seconds * 1000, 1)}
+        entry.update(attrs)
+        with self._lock:
+            self.spans.append(entry)
+
+    def to_dict(self):
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span["startMs"])
+        stages = {}
+        for span in spans:
+            stage = stages.setdefault(span["name"], {"count": 0, "ms": 0.0})
+            stage["count"] += 1
+            stage["ms"] = round(stage["ms"] + span["ms"], 1)
+        return {
+            "totalMs": round((time.perf_counter() - self.started) * 1000, 1),
+            "stages": stages,
+            "spans": spans,
+        }
+
+
+class Span:
+    """
+    Times one stage. Attributes set on the span go into the request trace;
+    promptTokens/completionTokens (with model), bytes and cacheHit also
+    update the matching counters.
+    """
+
+    __slots__ = ("name", "attrs", "started")
+
+    def __init__(self, name, attrs):
+        self.name = name
+        self.attrs = attrs
+        self.started = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self.started
+        attrs = self.attrs
+        metrics.observe("stage_seconds", seconds, stage=self.name)
+        if exc_type is not None:
+            attrs["error"] = exc_type.__name__
+            metrics.inc("stage_errors_total", stage=self.name)
+        if attrs.get("promptTokens"):
+            metrics.inc("llm_tokens_total", attrs["promptTokens"], model=attrs.get("model"), type="prompt")
+        if attrs.get("completionTokens"):
+            metrics.inc("llm_tokens_total", attrs["completionTokens"], model=attrs.get("model"), type="completion")
+        if attrs.get("bytes"):
+            metrics.inc("stage_bytes_total", attrs["bytes"], stage=self.name)
+        if "cacheHit" in attrs:
+            metrics.inc("stage_cache_total", stage=self.name, result="hit" if attrs["cacheHit"] else "miss")
+        trace = _trace.get()
+        if trace is not None:
+            trace.add(self.name, self.started, seconds, attrs)
+        return False
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def set(self, **attrs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_no_span = _NoSpan()
+
+
+def span(name, **attrs):
+    """Context manager timing a stage; a shared no-op when tracing is off"""
+    if not TRACING:
+        return _no_span
+    return Span(name, attrs)
+
+
+def traced(name):
+    """Decorator running the function inside a span"""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def call(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return call
+    return decorate
+
+
+@contextmanager
+def request_trace():
+    """Collect the spans of the current request (and the threads it fans out to) in debug mode"""
+    if not (TRACING and TRACE_DEBUG):
+        yield None
+        return
+    trace = Trace()
+    token = _trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _trace.reset(token)
+
+
+def instrument(toolkit):
+    """Run every function of a phi toolkit inside a "tool.<name>" span with its output size"""
+    if not TRACING:
+        return toolkit
+    for name, function in toolkit.functions.items():
+        function.entrypoint = _traced_tool(name, function.entrypoint)
+    return toolkit
+
+
+def _traced_tool(tool, fn):
+    @functools.wraps(fn)
+    def call(*args, **kwargs):
+        with span(f"tool.{tool}") as current:
+            output = fn(*args, **kwargs)
+            current.set(bytes=len(str(output or "").encode("utf-8")))
+            return output
+    return call
+
+
+def message_tokens(messages, start):
+    """Prompt and completion tokens of the first assistant message added at or after start"""
+    for message in messages[start:]:
+        usage = getattr(message, "metrics", None) or {}
+        if message.role == "assistant" and "output_tokens" in usage:
+            return usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+    return 0, 0
+
+
+def mongo_listener():
+    """pymongo command listener recording every command's duration"""
+    from pymongo import monitoring
+
+    class MongoCommandTracer(monitoring.CommandListener):
+        def started(self, event):
+            pass
+
+        def succeeded(self, event):
+            self._record(event, None)
+
+        def failed(self, event):
+            self._record(event, "failed")
+
+        @staticmethod
+        def _record(event, error):
+            seconds = event.duration_micros / 1e6
+            metrics.observe("mongo_command_seconds", seconds, command=event.command_name)
+            trace = _trace.get()
+            if trace is not None:
+                attrs = {"command": event.command_name}
+                if error:
+                    attrs["error"] = error
+                trace.add("mongo", time.perf_counter() - seconds, seconds, attrs)
+
+    return MongoCommandTracer()
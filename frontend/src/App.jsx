@@ -10,6 +10,12 @@ import LoadingIndicator from './components/LoadingIndicator';
 import SavedResponsesPage from './components/SavedResponsesPage';
 
 const API_BASE_URL = import.meta.env.VITE_API_URL;
+// Reconnect attempts after a dropped stream before showing a connection error
+const MAX_RECONNECTS = 3;
+
+// Same key as the backend uses per engine stream: the call id, or the tool
+// name for calls without one
+const toolCallKey = (call) => `${call.engine || ''}:${call.id || call.name}`;
 
 function App() {
   const [query, setQuery] = useState('');
@@ -50,38 +56,84 @@ function App() {
 
     try {
       const encodedQuery = encodeURIComponent(searchQuery);
-      eventSourceRef.current = new EventSource(`${API_BASE_URL}/api/stream?query=${encodedQuery}`);
+      // The user id lets the server limit concurrent runs per user
+      const userParam = user ? `&userId=${encodeURIComponent(user.id)}` : '';
+      eventSourceRef.current = new EventSource(`${API_BASE_URL}/api/stream?query=${encodedQuery}${userParam}`);
 
-      eventSourceRef.current.onmessage = (event) => {
-        try {
-          const data = JSON.parse(event.data);
-          console.log("Received Cleaned data:", data);
-      
-          if (data.chunk) {
-            setCleanedResponse((prev) => prev + (data.chunk || ''));
-          } else if (data.tool_call) {
-            setToolCalls((prev) => [...prev, data.tool_call]);
-          } else if (data.done) {
-            setIsLoading(false);
-            eventSourceRef.current.close();
-          } else if (data.error) {
-            setError(data.error);
+      const eventSource = eventSourceRef.current;
+      // Connection drops are retried by the browser, which resumes after the
+      // last event received; give up after a few failed attempts in a row
+      let failedReconnects = 0;
+      eventSource.addEventListener('open', () => {
+        failedReconnects = 0;
+      });
+
+      // The server sends each kind of payload as its own event type
+      const listen = (type, handler) => {
+        eventSource.addEventListener(type, (event) => {
+          try {
+            handler(JSON.parse(event.data));
+          } catch (jsonError) {
+            console.error('Error parsing response:', jsonError);
+            setError(`Error parsing response: ${jsonError.message}`);
             setIsLoading(false);
-            eventSourceRef.current.close();
           }
-        } catch (jsonError) {
-          console.error('Error parsing response:', jsonError);
-          setError(`Error parsing response: ${jsonError.message}`);
-          setIsLoading(false);
-        }
+        });
       };
 
-      eventSourceRef.current.onerror = (e) => {
-        console.error('EventSource error:', e);
-        setError('Connection error with the server. Please check if the Flask backend is running at https://ai-data-retrieval-and-database.onrender.com');
+      listen('reset', () => {
+        // The server could not resume this stream and sends the answer again
+        setCleanedResponse('');
+        setToolCalls([]);
+      });
+
+      listen('chunk', (data) => {
+        setCleanedResponse((prev) => prev + (data.chunk || ''));
+      });
+
+      listen('tool_call', (data) => {
+        // A call is sent again when it completes; replace the earlier entry.
+        // Calls without an id are matched by name, as the backend does.
+        setToolCalls((prev) => {
+          const key = toolCallKey(data.tool_call);
+          const index = prev.findIndex((call) => toolCallKey(call) === key);
+          if (index === -1) {
+            return [...prev, data.tool_call];
+          }
+          const next = [...prev];
+          next[index] = data.tool_call;
+          return next;
+        });
+      });
+
+      listen('metrics', (data) => {
+        console.log('Run metrics:', data.metrics);
+      });
+
+      listen('done', () => {
         setIsLoading(false);
-        eventSourceRef.current.close();
-      };
+        eventSource.close();
+      });
+
+      eventSource.addEventListener('error', (event) => {
+        if (event.data) {
+          // An error event sent by the server
+          try {
+            setError(JSON.parse(event.data).error);
+          } catch (jsonError) {
+            setError(`Error parsing response: ${jsonError.message}`);
+          }
+        } else {
+          console.error('EventSource error:', event);
+          failedReconnects += 1;
+          if (eventSource.readyState === EventSource.CONNECTING && failedReconnects <= MAX_RECONNECTS) {
+            return;
+          }
+          setError('Connection error with the server. Please check if the Flask backend is running at https://ai-data-retrieval-and-database.onrender.com');
+        }
+        setIsLoading(false);
+        eventSource.close();
+      });
     } catch (err) {
       console.error('Error setting up EventSource:', err);
       setError(`Error connecting to the server: ${err.message}`);
@@ -24,12 +24,23 @@ function formatTimestamp(timestamp) {
   return date.toLocaleString('en-US', options);
 }
 
+function formatSize(bytes) {
+  if (bytes == null) return '';
+  return bytes < 1024 ? `${bytes} B` : `${(bytes / 1024).toFixed(1)} KB`;
+}
+
 function SavedResponsesPage() {
   const { user } = useUser();
   const [responses, setResponses] = useState([]);
   const [error, setError] = useState(null);
   // Holds the response that is currently selected (for the modal)
   const [selectedResponse, setSelectedResponse] = useState(null);
+  // Cursor of the next page of the history, null once everything is loaded
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
+  // Search over the whole history; null while the plain listing is shown
+  const [searchTerm, setSearchTerm] = useState('');
+  const [searchResults, setSearchResults] = useState(null);
 
   useEffect(() => {
     if (user) {
@@ -37,14 +48,15 @@ function SavedResponsesPage() {
     }
   }, [user]);
 
-  const fetchSavedResponses = async (userId) => {
+  // Fetches one page of the listing (query, timestamp, size and snippet only)
+  const fetchSavedResponses = async (userId, cursor = null) => {
     try {
       const response = await fetch(`${API_BASE_URL}/api/get-stored-responses`, {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json'
         },
-        body: JSON.stringify({ userId })
+        body: JSON.stringify({ userId, cursor })
       });
 
       if (!response.ok) {
@@ -52,20 +64,72 @@ function SavedResponsesPage() {
       }
 
       const data = await response.json();
-      if (data.responses) {
-        setResponses(data.responses);
-      } else {
-        setResponses([]);
-      }
+      const page = data.responses || [];
+      setResponses((prev) => (cursor ? [...prev, ...page] : page));
+      setNextCursor(data.nextCursor || null);
     } catch (err) {
       console.error(err);
       setError('Failed to fetch saved responses.');
     }
   };
 
-  // Opens the modal for a specific response
-  const handleCardClick = (resp) => {
+  const handleLoadMore = async () => {
+    setLoadingMore(true);
+    await fetchSavedResponses(user.id, nextCursor);
+    setLoadingMore(false);
+  };
+
+  const handleSearch = async (e) => {
+    e.preventDefault();
+    if (!searchTerm.trim()) {
+      setSearchResults(null);
+      return;
+    }
+    try {
+      const res = await fetch(`${API_BASE_URL}/api/search-responses`, {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json'
+        },
+        body: JSON.stringify({ userId: user.id, query: searchTerm })
+      });
+      if (!res.ok) {
+        throw new Error('Error searching stored responses');
+      }
+      const data = await res.json();
+      setSearchResults(data.responses || []);
+    } catch (err) {
+      console.error(err);
+      setError('Failed to search saved responses.');
+    }
+  };
+
+  const clearSearch = () => {
+    setSearchTerm('');
+    setSearchResults(null);
+  };
+
+  // Opens the modal for a specific response and loads its full content
+  const handleCardClick = async (resp) => {
     setSelectedResponse(resp);
+    try {
+      const res = await fetch(`${API_BASE_URL}/api/get-stored-response`, {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json'
+        },
+        body: JSON.stringify({ userId: user.id, responseId: resp._id })
+      });
+      if (!res.ok) {
+        throw new Error('Error fetching stored response');
+      }
+      const data = await res.json();
+      // Ignore the result if another response was opened in the meantime
+      setSelectedResponse((current) => (current && current._id === resp._id ? data.response : current));
+    } catch (err) {
+      console.error(err);
+      alert('Failed to load the full response.');
+    }
   };
 
   // Closes the modal when clicking on the overlay
@@ -113,6 +177,7 @@ const handleDelete = async (responseId, e) => {
     
     if (res.ok) {
       setResponses((prev) => prev.filter((r) => r._id !== responseId));
+      setSearchResults((prev) => (prev ? prev.filter((r) => r._id !== responseId) : prev));
     } else {
       const errorData = await res.json();
       console.error("Delete error:", errorData);
@@ -129,11 +194,21 @@ const handleDelete = async (responseId, e) => {
     <div className="saved-responses-container">
       <h2>Saved Responses</h2>
       {error && <p className="error-message">{error}</p>}
-      {responses.length === 0 ? (
-        <p>No saved responses found.</p>
+      <form className="saved-search" onSubmit={handleSearch}>
+        <input
+          type="search"
+          placeholder="Search your saved responses"
+          value={searchTerm}
+          onChange={(e) => setSearchTerm(e.target.value)}
+        />
+        <button type="submit">Search</button>
+        {searchResults && <button type="button" onClick={clearSearch}>Clear</button>}
+      </form>
+      {(searchResults || responses).length === 0 ? (
+        <p>{searchResults ? 'No matching responses found.' : 'No saved responses found.'}</p>
       ) : (
         <div className="responses-list">
-          {responses.map((resp, index) => (
+          {(searchResults || responses).map((resp, index) => (
             <div
               className="response-card"
               key={index}
@@ -146,6 +221,8 @@ const handleDelete = async (responseId, e) => {
                     <strong>Search Query:</strong> {resp.searchQuery}
                   </p>
                 )}
+                {resp.snippet && <p className="response-snippet">{resp.snippet}</p>}
+                {resp.contentSize != null && <p><small>{formatSize(resp.contentSize)}</small></p>}
               </div>
               <button
                 className="delete-button"
@@ -158,6 +235,11 @@ const handleDelete = async (responseId, e) => {
           ))}
         </div>
       )}
+      {nextCursor && !searchResults && (
+        <button className="load-more-button" onClick={handleLoadMore} disabled={loadingMore}>
+          {loadingMore ? 'Loading...' : 'Load more'}
+        </button>
+      )}
 
       {/* Modal Overlay */}
       {selectedResponse && (
@@ -181,9 +263,13 @@ const handleDelete = async (responseId, e) => {
                 <strong>Search Query:</strong> {selectedResponse.searchQuery}
               </p>
             )}
-            <ReactMarkdown remarkPlugins={[remarkGfm]}>
-              {selectedResponse.content}
-            </ReactMarkdown>
+            {selectedResponse.content == null ? (
+              <p>Loading...</p>
+            ) : (
+              <ReactMarkdown remarkPlugins={[remarkGfm]}>
+                {selectedResponse.content}
+              </ReactMarkdown>
+            )}
 
             <div className="modal-buttons">
               <button onClick={handleCopyClick}>Copy</button>
@@ -25,13 +25,17 @@ function ToolCallsViewer({ toolCalls }) {
               onClick={() => toggleExpand(index)}
             >
               <span className="tool-name">{call.name || 'Unknown Tool'}</span>
-              <span className="tool-action">{call.input?.action || call.action || 'Unknown Action'}</span>
+              <span className="tool-action">
+                {call.status
+                  ? [call.engine, call.status, call.seconds != null && `${call.seconds}s`].filter(Boolean).join(' · ')
+                  : call.input?.action || call.action || 'Unknown Action'}
+              </span>
               <span className="expand-icon">{expanded[index] ? '▼' : '►'}</span>
             </div>
             
             {expanded[index] && (
               <div className="tool-call-details">
-                <pre>{JSON.stringify(call.input || call, null, 2)}</pre>
+                <pre>{JSON.stringify(call.arguments || call.input || call, null, 2)}</pre>
               </div>
             )}
           </div>